@@ -0,0 +1,324 @@
+"""
+Audio device backends for AudioManager.
+
+AudioManager opens its input and output streams through a backend, so the
+same capture callback (noise gate, pre-roll), playout mixing and network
+code can run on real sound hardware or without any:
+
+- ``PyAudioBackend``: the sound card, through PyAudio (the default).
+- ``FileBackend``: reads captured audio from a WAV file or NumPy array and
+  writes played audio to a WAV file or memory, either in real time or as
+  fast as possible, for benchmarking and profiling on build machines.
+- ``NullBackend``: captures silence and discards playback.
+
+Backends deliver captured audio the way PyAudio's callback mode does:
+``callback(in_data, frame_count, time_info, status)`` on a backend thread.
+"""
+
+import threading
+import time
+import wave
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from config import AUDIO_CONFIG
+
+# Return value of a capture callback that keeps the stream running (pyaudio.paContinue)
+CONTINUE = 0
+
+SAMPLE_WIDTH = 2  # 16-bit samples
+
+
+class AudioBackend:
+    """Opens 16-bit PCM input and output streams."""
+
+    name = 'base'
+
+    def open_input(self, rate: int, channels: int, frames_per_buffer: int, callback: Callable):
+        """Open and return a stream that calls ``callback`` with each captured buffer once started."""
+        raise NotImplementedError
+
+    def open_output(self, rate: int, channels: int, frames_per_buffer: int):
+        """Open and return a stream with a blocking ``write(data)``."""
+        raise NotImplementedError
+
+    def get_devices(self) -> Dict[str, List[dict]]:
+        """Get the available input and output devices."""
+        return {'input': [], 'output': []}
+
+    def terminate(self):
+        """Release the backend."""
+
+
+class PyAudioBackend(AudioBackend):
+    """Sound card input and output through PyAudio."""
+
+    name = 'pyaudio'
+
+    def __init__(self):
+        import pyaudio
+        self.pyaudio = pyaudio
+        self.audio = pyaudio.PyAudio()
+
+    def open_input(self, rate: int, channels: int, frames_per_buffer: int, callback: Callable):
+        return self.audio.open(
+            format=self.pyaudio.paInt16,
+            channels=channels,
+            rate=rate,
+            input=True,
+            frames_per_buffer=frames_per_buffer,
+            stream_callback=callback
+        )
+
+    def open_output(self, rate: int, channels: int, frames_per_buffer: int):
+        return self.audio.open(
+            format=self.pyaudio.paInt16,
+            channels=channels,
+            rate=rate,
+            output=True,
+            frames_per_buffer=frames_per_buffer
+        )
+
+    def get_devices(self) -> Dict[str, List[dict]]:
+        devices = {
+            'input': [],
+            'output': []
+        }
+
+        for i in range(self.audio.get_device_count()):
+            device_info = self.audio.get_device_info_by_index(i)
+            if device_info['maxInputChannels'] > 0:
+                devices['input'].append({
+                    'index': i,
+                    'name': device_info['name'],
+                    'channels': device_info['maxInputChannels']
+                })
+            if device_info['maxOutputChannels'] > 0:
+                devices['output'].append({
+                    'index': i,
+                    'name': device_info['name'],
+                    'channels': device_info['maxOutputChannels']
+                })
+
+        return devices
+
+    def terminate(self):
+        self.audio.terminate()
+
+
+class FileInputStream:
+    """Feeds a capture callback from a sample array on its own thread."""
+
+    def __init__(self, samples: np.ndarray, rate: int, channels: int, frames_per_buffer: int,
+                 callback: Callable, realtime: bool, loop: bool):
+        self.samples = samples
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self.realtime = realtime
+        self.loop = loop
+
+        self.position = 0
+        self.buffers = 0
+        self.finished = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start_stream(self):
+        """Start calling the callback."""
+        if self._running:
+            return
+        self._running = True
+        self.finished.clear()
+        self._thread = threading.Thread(target=self._run, name='file-capture', daemon=True)
+        self._thread.start()
+
+    def _next_buffer(self) -> Optional[bytes]:
+        """Get the next buffer of samples, or None at the end of a source that does not loop."""
+        count = self.frames_per_buffer * self.channels
+        total = len(self.samples)
+        if total == 0:
+            return bytes(count * SAMPLE_WIDTH)
+
+        if self.position + count > total:
+            if not self.loop:
+                return None
+            head = self.samples[self.position:]
+            self.position = count - len(head)
+            return np.concatenate((head, self.samples[:self.position])).tobytes()
+
+        data = self.samples[self.position:self.position + count].tobytes()
+        self.position += count
+        return data
+
+    def _run(self):
+        """Deliver buffers, paced like a sound card in real-time mode."""
+        interval = self.frames_per_buffer / self.rate
+        next_time = time.perf_counter()
+
+        while self._running:
+            data = self._next_buffer()
+            if data is None:
+                break
+
+            if self.realtime:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            self.buffers += 1
+            self.callback(data, self.frames_per_buffer, {}, 0)
+
+        self._running = False
+        self.finished.set()
+
+    def stop_stream(self):
+        """Stop calling the callback and wait for the current call to return."""
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def close(self):
+        self.stop_stream()
+
+
+class FileOutputStream:
+    """Collects played audio in memory or a WAV file."""
+
+    def __init__(self, rate: int, channels: int, realtime: bool, sink: Optional[wave.Wave_write],
+                 keep: bool):
+        self.rate = rate
+        self.channels = channels
+        self.realtime = realtime
+        self.sink = sink
+        self.keep = keep
+
+        self.data = bytearray()
+        self.frames_written = 0
+        self._next_time: Optional[float] = None
+
+    def write(self, data: bytes):
+        """Play a buffer; in real-time mode, block for as long as it takes to play."""
+        frames = len(data) // (SAMPLE_WIDTH * self.channels)
+        self.frames_written += frames
+        if self.sink:
+            self.sink.writeframes(data)
+        elif self.keep:
+            self.data += data
+
+        if self.realtime:
+            now = time.perf_counter()
+            if self._next_time is None or self._next_time < now:
+                self._next_time = now
+            self._next_time += frames / self.rate
+            time.sleep(max(0.0, self._next_time - now - frames / self.rate))
+
+    def stop_stream(self):
+        self._next_time = None
+
+    def close(self):
+        """Close the stream. The WAV sink stays open for later output streams."""
+        self.stop_stream()
+
+
+class FileBackend(AudioBackend):
+    """Captures from a WAV file or NumPy array and plays into a WAV file or memory.
+
+    ``realtime`` paces capture and playback like a sound card; otherwise
+    both run as fast as the code consuming them. ``output`` holds everything
+    played when there is no ``sink_path``.
+    """
+
+    name = 'file'
+
+    def __init__(self, source: Union[str, np.ndarray, None] = None, sink_path: Optional[str] = None,
+                 realtime: bool = True, loop: bool = True, keep_output: bool = True):
+        self.source = source
+        self.sink_path = sink_path
+        self.realtime = realtime
+        self.loop = loop
+        self.keep_output = keep_output
+
+        self.input_streams: List[FileInputStream] = []
+        self.output_streams: List[FileOutputStream] = []
+        self._sink: Optional[wave.Wave_write] = None
+
+    def _load_source(self, rate: int, channels: int) -> np.ndarray:
+        """Load the source as int16 samples matching the stream format."""
+        if self.source is None:
+            return np.zeros(0, dtype=np.int16)
+        if isinstance(self.source, np.ndarray):
+            return np.ascontiguousarray(self.source, dtype=np.int16).reshape(-1)
+
+        with wave.open(self.source, 'rb') as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (rate, channels, SAMPLE_WIDTH):
+                raise ValueError(
+                    f"{self.source} is {wav.getframerate()} Hz, {wav.getnchannels()} channel(s), "
+                    f"{wav.getsampwidth() * 8}-bit; expected {rate} Hz, {channels} channel(s), 16-bit"
+                )
+            return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+
+    def open_input(self, rate: int, channels: int, frames_per_buffer: int, callback: Callable):
+        stream = FileInputStream(self._load_source(rate, channels), rate, channels, frames_per_buffer,
+                                 callback, self.realtime, self.loop)
+        self.input_streams.append(stream)
+        return stream
+
+    def open_output(self, rate: int, channels: int, frames_per_buffer: int):
+        if self.sink_path and self._sink is None:
+            self._sink = wave.open(self.sink_path, 'wb')
+            self._sink.setnchannels(channels)
+            self._sink.setsampwidth(SAMPLE_WIDTH)
+            self._sink.setframerate(rate)
+
+        stream = FileOutputStream(rate, channels, self.realtime, self._sink, self.keep_output)
+        self.output_streams.append(stream)
+        return stream
+
+    @property
+    def output(self) -> bytes:
+        """Everything played so far, when it is kept in memory."""
+        return b''.join(bytes(stream.data) for stream in self.output_streams)
+
+    def get_devices(self) -> Dict[str, List[dict]]:
+        return {
+            'input': [{'index': 0, 'name': f"{self.name} input", 'channels': 1}],
+            'output': [{'index': 0, 'name': f"{self.name} output", 'channels': 1}],
+        }
+
+    def terminate(self):
+        for stream in self.input_streams:
+            stream.close()
+        if self._sink:
+            self._sink.close()
+            self._sink = None
+
+
+class NullBackend(FileBackend):
+    """Captures silence and discards everything played."""
+
+    name = 'null'
+
+    def __init__(self, realtime: bool = True):
+        super().__init__(realtime=realtime, keep_output=False)
+
+
+def create_backend(name: Optional[str] = None) -> AudioBackend:
+    """Create the backend named in ``AUDIO_CONFIG['backend']`` (or ``name``)."""
+    name = name or AUDIO_CONFIG['backend']
+
+    if name == 'pyaudio':
+        return PyAudioBackend()
+    if name == 'file':
+        return FileBackend(
+            source=AUDIO_CONFIG['backend_source'] or None,
+            sink_path=AUDIO_CONFIG['backend_sink'] or None,
+            realtime=AUDIO_CONFIG['backend_realtime']
+        )
+    if name == 'null':
+        return NullBackend(realtime=AUDIO_CONFIG['backend_realtime'])
+
+    raise ValueError(f"Unknown audio backend: {name}")
@@ -0,0 +1,274 @@
+"""
+Audio and network engine in a child process.
+
+Capture callbacks, playout and the network workers otherwise share one
+Python process (and one GIL) with the Qt event loop, so heavy repaints and
+notifications delay audio. With ``PERFORMANCE_CONFIG['audio_engine_process']``
+the AudioManager and NetworkManager run in a separate process instead:
+captured audio goes straight from the microphone to the network and
+received audio straight to the speakers without leaving that process.
+The GUI sends commands and receives events over a pipe, and reads the
+input level from a shared-memory ring.
+"""
+
+import multiprocessing
+import struct
+import threading
+import time
+from dataclasses import asdict
+from typing import Callable, List, Optional
+
+from shared_ring import SharedRing
+
+# Meter record: wall-clock time, input level (0.0 - 1.0)
+METER = struct.Struct('=dd')
+
+
+def run_engine(conn, username: str, shop_location: str, meter_ring_name: str,
+               meter_interval: float):
+    """Child process entry point: run the audio and network managers until told to stop."""
+    from audio_manager import AudioManager
+    from network_manager import NetworkManager
+    from user_table import UserTable
+    from config import AUDIO_CONFIG, PERFORMANCE_CONFIG
+    import realtime
+
+    meters = SharedRing(meter_ring_name)
+    send_lock = threading.Lock()
+
+    def send_event(kind: str, *args):
+        """Send an event to the GUI process from any engine thread."""
+        with send_lock:
+            try:
+                conn.send((kind,) + args)
+            except (OSError, EOFError):
+                pass
+
+    try:
+        audio_manager = AudioManager(
+            sample_rate=AUDIO_CONFIG['sample_rate'],
+            chunk_size=AUDIO_CONFIG['chunk_size']
+        )
+        if AUDIO_CONFIG['preroll_ms'] > 0:
+            audio_manager.start_monitoring(AUDIO_CONFIG['preroll_ms'])
+        network_manager = NetworkManager(username=username, shop_location=shop_location)
+    except Exception as e:
+        send_event('failed', str(e))
+        meters.close()
+        return
+
+    target = None
+    ptt_pressed_at = None
+
+    def users_snapshot() -> UserTable:
+        # Columns pickle far smaller than a list of users in a large chain
+        return UserTable.from_users(network_manager.get_online_users())
+
+    def on_spurt_end(spurt):
+        audio_manager.release_source(f"{spurt.sender}@{spurt.sender_shop}")
+        send_event('spurt_end', asdict(spurt))
+
+    def on_voice_message(message):
+        audio_manager.play_message(message.audio_data, f"{message.sender}@{message.sender_shop}")
+        # The GUI only needs to announce it; the audio stays in this process
+        fields = message.to_dict()
+        fields['audio_data'] = b''
+        send_event('voice_message', fields)
+
+    def on_captured(audio_data: bytes):
+        nonlocal ptt_pressed_at
+        if ptt_pressed_at is not None:
+            print(f"Push-to-Talk latency: {(time.perf_counter() - ptt_pressed_at) * 1000:.1f} ms to first frame")
+            ptt_pressed_at = None
+        if target:
+            network_manager.send_audio(target[0], target[1], audio_data)
+
+    network_manager.on_user_discovered = lambda user: send_event('user_discovered', user.to_dict(), users_snapshot())
+    network_manager.on_user_offline = lambda user: send_event('user_offline', user.to_dict(), users_snapshot())
+    network_manager.on_directory_changed = lambda: send_event('users_changed', users_snapshot())
+    network_manager.on_spurt_start = lambda spurt: send_event('spurt_start', asdict(spurt))
+    network_manager.on_spurt_end = on_spurt_end
+    network_manager.on_audio_received = lambda packet: audio_manager.play_audio(
+        packet.audio_data, f"{packet.sender}@{packet.sender_shop}"
+    )
+    network_manager.on_voice_message = on_voice_message
+
+    network_manager.start()
+    send_event('ready')
+    
+    if PERFORMANCE_CONFIG['low_latency_mode']:
+        report = threading.Timer(2.0, lambda: print(realtime.diagnostics.report()))
+        report.daemon = True
+        report.start()
+
+    running = True
+    while running:
+        try:
+            if conn.poll(meter_interval):
+                command, *args = conn.recv()
+
+                if command == 'ptt_start':
+                    target = tuple(args)
+                    ptt_pressed_at = time.perf_counter()
+                    audio_manager.start_recording(on_captured)
+                elif command == 'ptt_stop':
+                    audio_manager.stop_recording()
+                    if target:
+                        network_manager.end_talk_spurt(*target)
+                elif command == 'replay_last':
+                    audio_manager.replay_last_message()
+                elif command == 'stop':
+                    running = False
+
+        except (EOFError, OSError):
+            # The GUI process is gone
+            running = False
+        except Exception as e:
+            print(f"Audio engine error: {e}")
+
+        meters.write(METER.pack(time.time(), audio_manager.get_audio_levels()))
+
+    audio_manager.cleanup()
+    network_manager.cleanup()
+    meters.close()
+
+
+class AudioEngineClient:
+    """GUI-side handle on the engine process.
+
+    Offers the same user and talk spurt callbacks as NetworkManager. They are
+    called on an event thread, like NetworkManager's are on its workers.
+    """
+
+    def __init__(self, username: str, shop_location: str, meter_interval: float = 0.05):
+        self.meters = SharedRing(size=METER.size * 256)
+
+        # Spawn, so the engine never inherits Qt state from the GUI process
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=run_engine,
+            args=(child_conn, username, shop_location, self.meters.name, meter_interval),
+            name='audio-engine',
+            daemon=True
+        )
+
+        # Callbacks
+        self.on_user_discovered: Optional[Callable] = None
+        self.on_user_offline: Optional[Callable] = None
+        self.on_directory_changed: Optional[Callable] = None
+        self.on_spurt_start: Optional[Callable] = None
+        self.on_spurt_end: Optional[Callable] = None
+        self.on_voice_message: Optional[Callable] = None
+
+        self.user_table = None
+        self.level = 0.0
+        self.running = False
+        self._ready = threading.Event()
+        self._error: Optional[str] = None
+        self._send_lock = threading.Lock()
+        self.event_thread: Optional[threading.Thread] = None
+
+    def start(self, timeout: float = 30.0):
+        """Start the engine process and wait until its managers are running."""
+        self.process.start()
+        self.event_thread = threading.Thread(target=self._event_worker, name='engine-events', daemon=True)
+        self.event_thread.start()
+
+        if not self._ready.wait(timeout):
+            self._error = self._error or "Audio engine did not start in time"
+        if self._error:
+            self.cleanup()
+            raise RuntimeError(self._error)
+
+        self.running = True
+
+    def _event_worker(self):
+        """Worker thread that dispatches events from the engine process."""
+        from network_manager import User, TalkSpurt, VoiceMessage
+
+        while True:
+            try:
+                kind, *args = self._conn.recv()
+            except (EOFError, OSError):
+                break
+
+            try:
+                if kind == 'ready':
+                    self._ready.set()
+                elif kind == 'failed':
+                    self._error = args[0]
+                    self._ready.set()
+                elif kind in ('user_discovered', 'user_offline'):
+                    self.user_table = args[1]
+                    callback = self.on_user_discovered if kind == 'user_discovered' else self.on_user_offline
+                    if callback:
+                        callback(User(**args[0]))
+                elif kind == 'users_changed':
+                    self.user_table = args[0]
+                    if self.on_directory_changed:
+                        self.on_directory_changed()
+                elif kind == 'spurt_start' and self.on_spurt_start:
+                    self.on_spurt_start(TalkSpurt(**args[0]))
+                elif kind == 'spurt_end' and self.on_spurt_end:
+                    self.on_spurt_end(TalkSpurt(**args[0]))
+                elif kind == 'voice_message' and self.on_voice_message:
+                    self.on_voice_message(VoiceMessage(**args[0]))
+            except Exception as e:
+                print(f"Error handling audio engine event {kind}: {e}")
+
+        self.running = False
+        self._ready.set()
+        print("Audio engine events stopped")
+
+    def _send(self, *command):
+        """Send a command to the engine process."""
+        with self._send_lock:
+            try:
+                self._conn.send(command)
+            except (OSError, EOFError) as e:
+                print(f"Audio engine unavailable: {e}")
+
+    def start_transmit(self, target_user: str, target_shop: str):
+        """Start capturing and sending audio to a user."""
+        self._send('ptt_start', target_user, target_shop)
+
+    def stop_transmit(self):
+        """Stop capturing and end the current transmission."""
+        self._send('ptt_stop')
+
+    def replay_last_message(self):
+        """Ask the engine to play the last recorded message again, and return it (or None).
+
+        The engine process writes the recording, so it is read here straight from the file.
+        """
+        from call_recorder import read_last_message
+        from config import AUDIO_CONFIG
+        message = read_last_message(AUDIO_CONFIG['recording_file']) if AUDIO_CONFIG['call_recording'] else None
+        if message:
+            self._send('replay_last')
+        return message
+
+    def get_online_users(self) -> List:
+        """Get the online users as of the engine's last update."""
+        return self.user_table.online_users() if self.user_table is not None else []
+
+    def get_audio_levels(self) -> float:
+        """Get the most recent input level written by the engine."""
+        records = self.meters.drain()
+        if records:
+            self.level = METER.unpack(records[-1])[1]
+        return self.level
+
+    def cleanup(self):
+        """Stop the engine process and free the shared memory."""
+        if self.process.is_alive():
+            self._send('stop')
+            self.process.join(5.0)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(1.0)
+
+        self.running = False
+        self._conn.close()
+        self.meters.close()
@@ -1,20 +1,32 @@
-import pyaudio
 import numpy as np
 import threading
-import time
-from typing import Optional, Callable
+from typing import Any, Dict, List, Optional, Callable
+
+import audio_backends
+from audio_queue import AudioQueue, PrerollBuffer
+from call_recorder import CallRecorder, RecordedMessage, read_last_message
+from clock import Clock, system_clock
+from config import AUDIO_CONFIG, PERFORMANCE_CONFIG
+import realtime
+
+# Playout source used when replaying a recorded message, so it is not recorded again
+REPLAY_SOURCE = 'replay'
 
 class AudioManager:
     """Manages high-quality audio capture and playback for the intercom system."""
     
-    def __init__(self, sample_rate: int = 44100, chunk_size: int = 1024):
+    def __init__(self, sample_rate: int = 44100, chunk_size: int = 1024,
+                 backend: Optional[audio_backends.AudioBackend] = None, clock: Optional[Clock] = None):
         self.sample_rate = sample_rate
         self.chunk_size = chunk_size
-        self.audio = pyaudio.PyAudio()
+        self.clock = clock or system_clock
+        
+        # Sound card by default; file and null backends run without audio hardware
+        self.audio = backend or audio_backends.create_backend()
         
         # Audio streams
-        self.input_stream: Optional[pyaudio.Stream] = None
-        self.output_stream: Optional[pyaudio.Stream] = None
+        self.input_stream: Optional[Any] = None
+        self.output_stream: Optional[Any] = None
         
         # Callbacks
         self.on_audio_data: Optional[Callable[[bytes], None]] = None
@@ -25,112 +37,317 @@ class AudioManager:
         self.is_playing = False
         self.recording_thread: Optional[threading.Thread] = None
         
+        # Playout: one bounded queue per sender, drained by a single thread
+        self.playout_queues: Dict[str, AudioQueue] = {}
+        self.playout_thread: Optional[threading.Thread] = None
+        self.playout_running = False
+        self.playout_idle_timeout = 1.0  # Close the output stream after this much silence
+        self._playout_event = threading.Event()
+        self._released_sources = set()
+        self._playout_lock = threading.Lock()
+        self._queues_lock = threading.Lock()  # Guards playout_queues and _released_sources
+        
         # Audio quality settings
         self.channels = 1  # Mono for better performance
-        self.format = pyaudio.paInt16
         
-    def start_recording(self, on_data_callback: Callable[[bytes], None]):
-        """Start recording audio from microphone."""
-        if self.is_recording:
+        # Warm input stream with pre-roll, so PTT does not wait for the device to open
+        self.is_monitoring = False
+        self.preroll: Optional[PrerollBuffer] = None
+        self.last_chunk = b''
+        self._capture_lock = threading.Lock()
+        
+        # Low-latency mode: capture and playout threads raise their own priority
+        self.low_latency = PERFORMANCE_CONFIG['low_latency_mode']
+        self._tuned_capture_thread: Optional[int] = None
+        
+        # Optional recording of incoming messages for "replay last message"
+        self.recorder: Optional[CallRecorder] = None
+        if AUDIO_CONFIG['call_recording']:
+            try:
+                self.recorder = CallRecorder(
+                    AUDIO_CONFIG['recording_file'],
+                    AUDIO_CONFIG['recording_max_mb'] * 1024 * 1024,
+                    sample_rate,
+                    self.clock
+                )
+            except (OSError, ValueError) as e:
+                print(f"Error opening call recording {AUDIO_CONFIG['recording_file']}: {e}")
+        self._replay_thread: Optional[threading.Thread] = None
+        
+    def start_monitoring(self, preroll_ms: int):
+        """Open the input stream ahead of time and keep the last ``preroll_ms`` of audio.
+        
+        While monitoring, the stream stays open between transmissions and
+        captured audio goes into a circular pre-roll buffer. Starting a
+        recording then sends the buffered audio first, so the first syllable
+        spoken as the key goes down is not lost.
+        """
+        if self.is_monitoring:
             return
             
-        self.on_audio_data = on_data_callback
-        self.is_recording = True
+        self.preroll = PrerollBuffer(self.sample_rate * preroll_ms // 1000 * 2)
+        
+        if self._open_input_stream():
+            self.is_monitoring = True
+            print(f"Audio input warm with {preroll_ms} ms pre-roll")
+            
+    def stop_monitoring(self):
+        """Close the warm input stream."""
+        self.is_monitoring = False
         
+        if not self.is_recording:
+            self._close_input_stream()
+            
+    def _open_input_stream(self) -> bool:
+        """Open and start the input stream."""
         try:
-            self.input_stream = self.audio.open(
-                format=self.format,
-                channels=self.channels,
-                rate=self.sample_rate,
-                input=True,
-                frames_per_buffer=self.chunk_size,
-                stream_callback=self._audio_callback
+            self.input_stream = self.audio.open_input(
+                self.sample_rate, self.channels, self.chunk_size, self._audio_callback
             )
             
             self.input_stream.start_stream()
-            print("Audio recording started")
+            return True
             
         except Exception as e:
-            print(f"Error starting audio recording: {e}")
-            self.is_recording = False
+            print(f"Error opening audio input: {e}")
+            self.input_stream = None
+            return False
             
-    def stop_recording(self):
-        """Stop recording audio."""
-        self.is_recording = False
-        
+    def _close_input_stream(self):
+        """Stop and close the input stream."""
         if self.input_stream:
             self.input_stream.stop_stream()
             self.input_stream.close()
             self.input_stream = None
             
+    def start_recording(self, on_data_callback: Callable[[bytes], None]):
+        """Start recording audio from microphone."""
+        if self.is_recording:
+            return
+            
+        if self.is_monitoring and self.input_stream:
+            # Send the pre-roll first; live audio follows from the next callback
+            with self._capture_lock:
+                self.on_audio_data = on_data_callback
+                self.is_recording = True
+                preroll = self.preroll.drain()
+                if preroll:
+                    on_data_callback(preroll)
+                    
+            print("Audio recording started")
+            return
+            
+        self.on_audio_data = on_data_callback
+        self.is_recording = True
+        
+        if self._open_input_stream():
+            print("Audio recording started")
+        else:
+            self.is_recording = False
+            
+    def stop_recording(self):
+        """Stop recording audio."""
+        with self._capture_lock:
+            self.is_recording = False
+            
+        if not self.is_monitoring:
+            self._close_input_stream()
+            
         print("Audio recording stopped")
         
     def _audio_callback(self, in_data, frame_count, time_info, status):
         """Callback for audio input stream."""
-        if self.is_recording and self.on_audio_data:
-            # Apply noise reduction and enhance audio quality
-            audio_data = np.frombuffer(in_data, dtype=np.int16)
-            
-            # Simple noise gate (remove very quiet sounds)
-            threshold = 500
-            audio_data = np.where(np.abs(audio_data) < threshold, 0, audio_data)
+        # The backend owns the capture thread (PortAudio's, with PyAudio), so tune it from its first callback
+        if self.low_latency and self._tuned_capture_thread != threading.get_ident():
+            self._tuned_capture_thread = threading.get_ident()
+            realtime.raise_thread_priority('audio')
             
-            # Convert back to bytes
-            processed_data = audio_data.tobytes()
-            self.on_audio_data(processed_data)
-            
-        return (in_data, pyaudio.paContinue)
+        # Apply noise reduction and enhance audio quality
+        audio_data = np.frombuffer(in_data, dtype=np.int16)
         
-    def play_audio(self, audio_data: bytes):
-        """Play received audio data."""
-        if self.is_playing:
-            return
+        # Simple noise gate (remove very quiet sounds)
+        threshold = 500
+        audio_data = np.where(np.abs(audio_data) < threshold, 0, audio_data)
+        
+        # Convert back to bytes
+        processed_data = audio_data.tobytes()
+        self.last_chunk = processed_data
+        
+        with self._capture_lock:
+            if self.is_recording and self.on_audio_data:
+                self.on_audio_data(processed_data)
+            elif self.is_monitoring:
+                self.preroll.write(processed_data)
+                
+        return (in_data, audio_backends.CONTINUE)
+        
+    def play_audio(self, audio_data: bytes, source: str = 'default'):
+        """Queue received audio data for playback.
+        
+        Each source gets its own bounded queue, so a stalled output device
+        drops audio according to the playout policy instead of building up
+        latency.
+        """
+        if self.recorder and source != REPLAY_SOURCE:
+            self.recorder.write(source, audio_data)
             
-        self.is_playing = True
+        # The playout thread must not drop the queue between finding it and filling it
+        with self._queues_lock:
+            self._released_sources.discard(source)
+            queue = self.playout_queues.get(source)
+            if queue is None:
+                queue = self.playout_queues[source] = AudioQueue(
+                    PERFORMANCE_CONFIG['max_audio_queue_size'],
+                    self.chunk_size * 2,
+                    PERFORMANCE_CONFIG['playout_queue_policy'],
+                    AUDIO_CONFIG['noise_gate_threshold']
+                )
+                
+            slot_size = queue.slot_size
+            for offset in range(0, len(audio_data), slot_size):
+                queue.put(audio_data[offset:offset + slot_size])
+                
+        self._start_playout()
+        self._playout_event.set()
         
-        try:
-            self.output_stream = self.audio.open(
-                format=self.format,
-                channels=self.channels,
-                rate=self.sample_rate,
-                output=True,
-                frames_per_buffer=self.chunk_size
-            )
+    def _start_playout(self):
+        """Start the playout thread if it is not running."""
+        with self._playout_lock:
+            if self.playout_running:
+                return
+            self.playout_running = True
+            self.playout_thread = threading.Thread(target=self._playout_worker, name='audio-playout', daemon=True)
+            self.playout_thread.start()
             
-            # Play the audio data
-            self.output_stream.write(audio_data)
-            self.output_stream.stop_stream()
-            self.output_stream.close()
-            self.output_stream = None
+    def _stop_playout(self):
+        """Stop the playout thread and close the output stream."""
+        self.playout_running = False
+        self._playout_event.set()
+        
+        if self.playout_thread and self.playout_thread is not threading.current_thread():
+            self.playout_thread.join(timeout=1.0)
+        self.playout_thread = None
+        
+    def _playout_worker(self):
+        """Worker thread that drains the playout queues into the output stream."""
+        last_write = self.clock.time()
+        if self.low_latency:
+            realtime.raise_thread_priority('audio')
             
+        try:
+            while self.playout_running:
+                self._playout_event.clear()
+                
+                frames = []
+                for source, queue in list(self.playout_queues.items()):
+                    item = queue.get()
+                    if item:
+                        frames.append(item[0])
+                    elif source in self._released_sources:
+                        # The talk spurt ended and its audio has played out
+                        self._drop_released_queue(source, queue)
+                        
+                if not frames:
+                    # Release the device once the line has been quiet for a while
+                    if self.output_stream and self.clock.time() - last_write > self.playout_idle_timeout:
+                        self._close_output_stream()
+                    self._playout_event.wait(0.05)
+                    continue
+                    
+                data = frames[0] if len(frames) == 1 else self._mix_frames(frames)
+                
+                if not self.output_stream:
+                    self.output_stream = self.audio.open_output(
+                        self.sample_rate, self.channels, self.chunk_size
+                    )
+                    self.is_playing = True
+                    
+                self.output_stream.write(data)
+                last_write = self.clock.time()
+                
         except Exception as e:
             print(f"Error playing audio: {e}")
         finally:
-            self.is_playing = False
+            self._close_output_stream()
+            self.playout_running = False
             
+    def _drop_released_queue(self, source: str, queue: AudioQueue):
+        """Remove a released source's queue, unless audio arrived for it meanwhile."""
+        with self._queues_lock:
+            if source in self._released_sources and len(queue) == 0:
+                self._released_sources.discard(source)
+                self.playout_queues.pop(source, None)
+                
+    def _close_output_stream(self):
+        """Close the output stream if it is open."""
+        if self.output_stream:
+            try:
+                self.output_stream.stop_stream()
+                self.output_stream.close()
+            except Exception as e:
+                print(f"Error closing output stream: {e}")
+            self.output_stream = None
+        self.is_playing = False
+        
+    def _mix_frames(self, frames: List[bytes]) -> bytes:
+        """Mix frames from several senders into one, clipping to 16 bits."""
+        length = max(len(frame) for frame in frames) // 2
+        mixed = np.zeros(length, dtype=np.int32)
+        for frame in frames:
+            samples = np.frombuffer(frame, dtype=np.int16)
+            mixed[:samples.size] += samples
+        return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+        
+    def release_source(self, source: str):
+        """Release a source's playout queue once everything queued has played."""
+        if self.recorder:
+            self.recorder.end(source)
+        # A source that never played anything has no queue to release
+        with self._queues_lock:
+            if source not in self.playout_queues:
+                return
+            self._released_sources.add(source)
+        self._playout_event.set()
+        
+    def replay_last_message(self) -> Optional[RecordedMessage]:
+        """Play the last recorded message again. Returns it, or None if there is none."""
+        if not self.recorder:
+            return None
+        if self._replay_thread and self._replay_thread.is_alive():
+            return None
+            
+        message = read_last_message(self.recorder.path)
+        if message is None:
+            return None
+            
+        self._replay_thread = self.play_message(message.audio, REPLAY_SOURCE)
+        return message
+        
+    def play_message(self, audio: bytes, source: str) -> threading.Thread:
+        """Play a whole recorded message from a source, on a thread that feeds it to playout."""
+        thread = threading.Thread(
+            target=self._message_worker, args=(audio, source), name='audio-message', daemon=True
+        )
+        thread.start()
+        return thread
+        
+    def _message_worker(self, audio: bytes, source: str):
+        """Feed a message to playout no faster than it drains, so none of it is dropped."""
+        slot_size = self.chunk_size * 2
+        for offset in range(0, len(audio), slot_size):
+            queue = self.playout_queues.get(source)
+            while queue and len(queue) >= queue.capacity // 2 and self.playout_running:
+                self.clock.sleep(self.chunk_size / self.sample_rate)
+            self.play_audio(audio[offset:offset + slot_size], source)
+        self.release_source(source)
+        
+    def get_queue_stats(self) -> Dict[str, dict]:
+        """Get occupancy and drop metrics for every playout queue."""
+        return {source: queue.stats() for source, queue in list(self.playout_queues.items())}
+        
     def get_available_devices(self):
         """Get list of available audio input and output devices."""
-        devices = {
-            'input': [],
-            'output': []
-        }
-        
-        for i in range(self.audio.get_device_count()):
-            device_info = self.audio.get_device_info_by_index(i)
-            if device_info['maxInputChannels'] > 0:
-                devices['input'].append({
-                    'index': i,
-                    'name': device_info['name'],
-                    'channels': device_info['maxInputChannels']
-                })
-            if device_info['maxOutputChannels'] > 0:
-                devices['output'].append({
-                    'index': i,
-                    'name': device_info['name'],
-                    'channels': device_info['maxOutputChannels']
-                })
-                
-        return devices
+        return self.audio.get_devices()
         
     def set_input_device(self, device_index: int):
         """Set the input device for recording."""
@@ -147,7 +364,12 @@ class AudioManager:
         
     def cleanup(self):
         """Clean up audio resources."""
+        self.is_monitoring = False
         self.stop_recording()
+        self._stop_playout()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
         if self.audio:
             self.audio.terminate()
             
@@ -157,10 +379,12 @@ class AudioManager:
             return 0.0
             
         try:
-            # Get current audio data
-            data = self.input_stream.read(self.chunk_size, exception_on_overflow=False)
-            audio_array = np.frombuffer(data, dtype=np.int16)
-            
+            # The input stream runs in callback mode, so use the latest captured chunk
+            data = self.last_chunk
+            audio_array = np.frombuffer(data, dtype=np.int16).astype(np.float64)
+            if audio_array.size == 0:
+                return 0.0
+                
             # Calculate RMS level
             rms = np.sqrt(np.mean(audio_array**2))
             # Normalize to 0-1 range
@@ -0,0 +1,278 @@
+"""
+Binary wire format and MTU-aware framing for intercom audio.
+
+Audio used to travel as hex inside JSON, which roughly doubled every frame
+and pushed each datagram well past the Ethernet MTU, so every packet was
+IP-fragmented. Frames are now sized against a per-peer payload budget and
+sent with a small fixed binary header.
+"""
+
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Packet header: magic, version, packet type, codec, flags, frame duration (ms),
+# sender length, shop length, talk spurt session id, sequence number, timestamp
+HEADER = struct.Struct('!2sBBBBBBBHId')
+MAGIC = b'TI'
+VERSION = 2
+
+# Packet types
+PACKET_AUDIO = 1
+PACKET_SPURT_START = 2  # opens a talk spurt; carries the session id and codec
+PACKET_SPURT_END = 3    # closes a talk spurt; sent more than once for reliability
+PACKET_TYPES = (PACKET_AUDIO, PACKET_SPURT_START, PACKET_SPURT_END)
+
+# Packet flags
+FLAG_FEC = 0x01   # payload also carries the previous frame for loss recovery
+FLAG_AUTH = 0x02  # packet ends with an authentication tag (see packet_auth)
+FEC_LENGTH = struct.Struct('!H')
+AUTH_TAG_SIZE = 16
+
+# Codecs: name -> (wire id, bytes per sample)
+CODECS: Dict[str, Tuple[int, int]] = {
+    'pcm16': (1, 2),
+    'ulaw': (2, 1),
+}
+CODEC_NAMES = {codec_id: name for name, (codec_id, _) in CODECS.items()}
+
+# Candidate frame durations, preferred (largest) first
+FRAME_DURATIONS_MS = (40, 20, 10)
+
+# G.711 mu-law tables, built once on first use
+_ULAW_ENCODE_TABLE: Optional[np.ndarray] = None
+_ULAW_DECODE_TABLE: Optional[np.ndarray] = None
+
+
+def _build_ulaw_tables():
+    """Build the mu-law lookup tables indexed by raw sample bits."""
+    global _ULAW_ENCODE_TABLE, _ULAW_DECODE_TABLE
+
+    # Encoder: one entry per possible int16 sample (indexed as uint16)
+    samples = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+    sign = (samples < 0).astype(np.int32)
+    magnitude = np.minimum(np.abs(samples), 32635) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    _ULAW_ENCODE_TABLE = (~((sign << 7) | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+    # Decoder: one entry per mu-law byte
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    _ULAW_DECODE_TABLE = np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def encode_payload(codec: str, pcm: bytes) -> bytes:
+    """Encode 16-bit PCM into the wire representation of a codec."""
+    if codec == 'pcm16':
+        return bytes(pcm)
+    if codec == 'ulaw':
+        if _ULAW_ENCODE_TABLE is None:
+            _build_ulaw_tables()
+        samples = np.frombuffer(pcm, dtype=np.uint16)
+        return _ULAW_ENCODE_TABLE[samples].tobytes()
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decode_payload(codec: str, payload: bytes, out: Optional[bytearray] = None) -> bytes:
+    """Decode a codec payload back into 16-bit PCM.
+
+    pcm16 payloads are returned as they are, without copying. With ``out``,
+    other codecs decode into that buffer and return a memoryview of it, so
+    the result is only valid until ``out`` is reused.
+    """
+    if codec == 'pcm16':
+        return payload
+    if codec == 'ulaw':
+        if _ULAW_DECODE_TABLE is None:
+            _build_ulaw_tables()
+        codes = np.frombuffer(payload, dtype=np.uint8)
+        if out is None or len(out) < 2 * len(codes):
+            return _ULAW_DECODE_TABLE[codes].tobytes()
+        np.take(_ULAW_DECODE_TABLE, codes, out=np.frombuffer(out, dtype=np.int16, count=len(codes)))
+        return memoryview(out)[:2 * len(codes)]
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def header_overhead(sender: str, sender_shop: str, authenticated: bool = False) -> int:
+    """Get the number of non-audio bytes an audio packet from this sender carries."""
+    overhead = HEADER.size + len(sender.encode()) + len(sender_shop.encode())
+    return overhead + AUTH_TAG_SIZE if authenticated else overhead
+
+
+def frame_samples(sample_rate: int, frame_ms: int) -> int:
+    """Get the number of samples in a frame of the given duration."""
+    return sample_rate * frame_ms // 1000
+
+
+def choose_frame_duration(codec: str, sample_rate: int, max_packet_size: int,
+                          chunk_size: int, overhead: int, max_frame_ms: int = 40,
+                          fec: bool = False) -> int:
+    """Pick the longest frame duration that fits the payload budget.
+
+    A frame must fit in one datagram of at most ``max_packet_size`` bytes
+    including ``overhead`` header bytes, and may not hold more than
+    ``chunk_size`` samples. Longer frames are preferred because they carry
+    less header per second of audio. With ``fec`` the datagram also carries
+    a redundant copy of the previous frame.
+    """
+    bytes_per_sample = CODECS[codec][1]
+    copies = 2 if fec else 1
+    if fec:
+        overhead += FEC_LENGTH.size
+    for frame_ms in FRAME_DURATIONS_MS:
+        if frame_ms > max_frame_ms:
+            continue
+        samples = frame_samples(sample_rate, frame_ms)
+        if samples <= chunk_size and overhead + copies * samples * bytes_per_sample <= max_packet_size:
+            return frame_ms
+    raise ValueError(
+        f"No {codec} frame fits in {max_packet_size} bytes with {overhead} bytes of header"
+    )
+
+
+def pack_audio(sender: str, sender_shop: str, sequence_number: int, timestamp: float,
+               codec: str, frame_ms: int, payload: bytes,
+               redundant: Optional[bytes] = None, session_id: int = 0,
+               authenticated: bool = False) -> bytes:
+    """Build an audio datagram, optionally carrying the previous frame as FEC.
+
+    With ``authenticated`` the header is flagged for a tag, which the caller
+    appends with ``packet_auth.PacketAuthenticator.sign``.
+    """
+    sender_bytes = sender.encode()
+    shop_bytes = sender_shop.encode()
+    flags = FLAG_FEC if redundant is not None else 0
+    if authenticated:
+        flags |= FLAG_AUTH
+    header = HEADER.pack(
+        MAGIC, VERSION, PACKET_AUDIO, CODECS[codec][0], flags, frame_ms,
+        len(sender_bytes), len(shop_bytes), session_id & 0xFFFF,
+        sequence_number & 0xFFFFFFFF, timestamp
+    )
+    if redundant is None:
+        return b''.join((header, sender_bytes, shop_bytes, payload))
+    return b''.join((header, sender_bytes, shop_bytes,
+                     FEC_LENGTH.pack(len(payload)), payload, redundant))
+
+
+def pack_spurt_marker(packet_type: int, sender: str, sender_shop: str, session_id: int,
+                      sequence_number: int, timestamp: float, codec: str,
+                      authenticated: bool = False) -> bytes:
+    """Build a talk spurt start or end marker.
+
+    For a start marker ``sequence_number`` is the first audio sequence
+    number of the spurt; for an end marker it is one past the last.
+    """
+    sender_bytes = sender.encode()
+    shop_bytes = sender_shop.encode()
+    header = HEADER.pack(
+        MAGIC, VERSION, packet_type, CODECS[codec][0], FLAG_AUTH if authenticated else 0, 0,
+        len(sender_bytes), len(shop_bytes), session_id & 0xFFFF,
+        sequence_number & 0xFFFFFFFF, timestamp
+    )
+    return b''.join((header, sender_bytes, shop_bytes))
+
+
+def unpack_packet(data: bytes) -> dict:
+    """Parse an audio or talk spurt datagram into its fields.
+
+    ``data`` may be a memoryview of a receive buffer; the payload fields are
+    then views of the same buffer rather than copies.
+
+    Raises ``ValueError`` if the datagram is not a valid intercom packet.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Packet too short")
+
+    (magic, version, packet_type, codec_id, flags, frame_ms,
+     sender_len, shop_len, session_id, sequence_number, timestamp) = HEADER.unpack_from(data)
+
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an intercom audio packet")
+    if packet_type not in PACKET_TYPES:
+        raise ValueError(f"Unexpected packet type: {packet_type}")
+    if codec_id not in CODEC_NAMES:
+        raise ValueError(f"Unknown codec id: {codec_id}")
+
+    offset = HEADER.size
+    end = offset + sender_len + shop_len
+    if end > len(data):
+        raise ValueError("Truncated packet header")
+
+    payload = data[end:]
+    if flags & FLAG_AUTH:
+        if len(payload) < AUTH_TAG_SIZE:
+            raise ValueError("Truncated authentication tag")
+        payload = payload[:len(payload) - AUTH_TAG_SIZE]
+
+    redundant = None
+    if flags & FLAG_FEC:
+        if len(payload) < FEC_LENGTH.size:
+            raise ValueError("Truncated FEC payload")
+        (primary_len,) = FEC_LENGTH.unpack_from(payload)
+        primary_end = FEC_LENGTH.size + primary_len
+        redundant = payload[primary_end:] or None
+        payload = payload[FEC_LENGTH.size:primary_end]
+
+    return {
+        'type': packet_type,
+        'sender': str(data[offset:offset + sender_len], 'utf-8'),
+        'sender_shop': str(data[offset + sender_len:end], 'utf-8'),
+        'session_id': session_id,
+        'timestamp': timestamp,
+        'sequence_number': sequence_number,
+        'codec': CODEC_NAMES[codec_id],
+        'frame_ms': frame_ms,
+        'payload': payload,
+        'redundant': redundant,
+        'authenticated': bool(flags & FLAG_AUTH),
+    }
+
+
+class Packetizer:
+    """Slices captured PCM into frames that fit a peer's payload budget."""
+
+    def __init__(self, codec: str, sample_rate: int, frame_ms: int, fec: bool = False,
+                 pending: bytes = b''):
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.fec = fec
+        self.frame_bytes = frame_samples(sample_rate, frame_ms) * 2  # 16-bit PCM in
+        self.previous: Optional[bytes] = None  # last frame sent, for FEC
+        self._pending = bytearray(pending)
+
+    def feed(self, pcm: bytes) -> List[bytes]:
+        """Add captured PCM and return every complete encoded frame."""
+        self._pending += pcm
+
+        frames = []
+        offset = 0
+        while len(self._pending) - offset >= self.frame_bytes:
+            frame = self._pending[offset:offset + self.frame_bytes]
+            frames.append(encode_payload(self.codec, frame))
+            offset += self.frame_bytes
+
+        if offset:
+            del self._pending[:offset]
+
+        return frames
+
+    def flush(self) -> List[bytes]:
+        """Return all buffered PCM as encoded frames, the last one possibly short."""
+        frames = [
+            encode_payload(self.codec, self._pending[offset:offset + self.frame_bytes])
+            for offset in range(0, len(self._pending), self.frame_bytes)
+        ]
+        self._pending.clear()
+        return frames
+
+    def take_pending(self) -> bytes:
+        """Remove and return buffered PCM that has not been framed yet."""
+        pending = bytes(self._pending)
+        self._pending.clear()
+        return pending
@@ -0,0 +1,213 @@
+"""
+Bounded audio frame queues for the intercom system.
+
+Every queue holds at most ``capacity`` frames in storage allocated up front,
+so a stalled consumer (playback device or network) can never build up more
+than a fixed amount of latency. When the queue is full, the drop policy
+decides which frame is lost.
+"""
+
+import threading
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+SKIP_SILENCE = 'skip_silence'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, SKIP_SILENCE)
+
+
+class AudioQueue:
+    """Fixed-capacity FIFO of PCM frames stored in a preallocated ring.
+
+    Policies when the queue is full:
+
+    - ``drop_oldest``: discard the oldest frame to make room (lowest latency)
+    - ``drop_newest``: discard the incoming frame (keeps what is queued intact)
+    - ``skip_silence``: compress time by discarding silent frames first; once
+      the queue is half full, incoming silent frames are skipped as well
+    """
+
+    def __init__(self, capacity: int, slot_size: int, policy: str = DROP_OLDEST,
+                 silence_threshold: int = 500):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.policy = policy
+        self.silence_threshold = silence_threshold
+
+        # Preallocated storage
+        self._buffer = bytearray(capacity * slot_size)
+        self._view = memoryview(self._buffer)
+        self._lengths = [0] * capacity
+        self._meta: list = [None] * capacity
+        self._silent = [False] * capacity
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.puts = 0
+        self.gets = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.dropped_silence = 0
+        self.high_watermark = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def put(self, data: bytes, meta: Any = None) -> bool:
+        """Add a frame. Returns False if the frame itself was dropped."""
+        length = len(data)
+        if length > self.slot_size:
+            raise ValueError(f"Frame of {length} bytes exceeds slot size {self.slot_size}")
+
+        silent = self.policy == SKIP_SILENCE and self._is_silent(data)
+
+        with self._lock:
+            self.puts += 1
+
+            if silent and self._count * 2 >= self.capacity:
+                self.dropped_silence += 1
+                return False
+
+            if self._count == self.capacity:
+                if self.policy == DROP_NEWEST:
+                    self.dropped_newest += 1
+                    return False
+                if not (self.policy == SKIP_SILENCE and self._remove_silent()):
+                    self._pop_locked()
+                    self.dropped_oldest += 1
+
+            index = (self._head + self._count) % self.capacity
+            start = index * self.slot_size
+            self._view[start:start + length] = data
+            self._lengths[index] = length
+            self._meta[index] = meta
+            self._silent[index] = silent
+            self._count += 1
+
+            if self._count > self.high_watermark:
+                self.high_watermark = self._count
+
+            return True
+
+    def get(self) -> Optional[Tuple[bytes, Any]]:
+        """Remove and return the oldest frame and its metadata, or None if empty."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            self.gets += 1
+            return self._pop_locked()
+
+    def clear(self):
+        """Discard every queued frame."""
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            self._meta = [None] * self.capacity
+
+    def stats(self) -> dict:
+        """Get occupancy and drop metrics."""
+        return {
+            'occupancy': self._count,
+            'capacity': self.capacity,
+            'high_watermark': self.high_watermark,
+            'puts': self.puts,
+            'gets': self.gets,
+            'dropped_oldest': self.dropped_oldest,
+            'dropped_newest': self.dropped_newest,
+            'dropped_silence': self.dropped_silence,
+        }
+
+    def _pop_locked(self) -> Tuple[bytes, Any]:
+        """Remove the oldest frame. The lock must be held."""
+        index = self._head
+        start = index * self.slot_size
+        data = bytes(self._view[start:start + self._lengths[index]])
+        meta = self._meta[index]
+        self._meta[index] = None
+        self._head = (self._head + 1) % self.capacity
+        self._count -= 1
+        return data, meta
+
+    def _remove_silent(self) -> bool:
+        """Remove the oldest silent frame, shifting newer frames back. The lock must be held."""
+        for offset in range(self._count):
+            index = (self._head + offset) % self.capacity
+            if not self._silent[index]:
+                continue
+
+            # Move every newer frame one slot towards the head
+            for later in range(offset + 1, self._count):
+                src = (self._head + later) % self.capacity
+                dst = (src - 1) % self.capacity
+                length = self._lengths[src]
+                self._view[dst * self.slot_size:dst * self.slot_size + length] = \
+                    self._view[src * self.slot_size:src * self.slot_size + length]
+                self._lengths[dst] = length
+                self._meta[dst] = self._meta[src]
+                self._silent[dst] = self._silent[src]
+
+            self._count -= 1
+            self._meta[(self._head + self._count) % self.capacity] = None
+            self.dropped_silence += 1
+            return True
+
+        return False
+
+    def _is_silent(self, data: bytes) -> bool:
+        """Check whether a 16-bit PCM frame stays below the silence threshold."""
+        samples = np.frombuffer(data, dtype=np.int16)
+        if samples.size == 0:
+            return True
+        return int(np.max(np.abs(samples.astype(np.int32)))) < self.silence_threshold
+
+
+class PrerollBuffer:
+    """Fixed-size circular byte buffer that keeps only the most recent audio."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._write = 0
+        self._filled = 0
+
+    def __len__(self) -> int:
+        return self._filled
+
+    def write(self, data: bytes):
+        """Append audio, overwriting the oldest bytes once full."""
+        if self.size == 0:
+            return
+
+        data = memoryview(data)
+        if len(data) >= self.size:
+            # Only the tail fits
+            self._view[:] = data[len(data) - self.size:]
+            self._write = 0
+            self._filled = self.size
+            return
+
+        first = min(len(data), self.size - self._write)
+        self._view[self._write:self._write + first] = data[:first]
+        rest = len(data) - first
+        if rest:
+            self._view[:rest] = data[first:]
+        self._write = (self._write + len(data)) % self.size
+        self._filled = min(self.size, self._filled + len(data))
+
+    def drain(self) -> bytes:
+        """Return the buffered audio, oldest first, and empty the buffer."""
+        start = (self._write - self._filled) % self.size if self.size else 0
+        if start + self._filled <= self.size:
+            data = bytes(self._view[start:start + self._filled])
+        else:
+            data = bytes(self._view[start:]) + bytes(self._view[:self._write])
+        self._filled = 0
+        return data
@@ -0,0 +1,924 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the Tradelink Intercom hot paths.
+
+Each benchmark reports the time per operation. Benchmarks with a budget
+fail the run when they exceed it, and so do benchmarks that are more than
+the regression threshold slower than the stored baseline
+(``benchmarks_baseline.json``), so this script can gate changes to code
+that runs once per audio packet. Results can be written to a JSON file,
+one benchmark per line, so a change to a hot path can carry its numbers
+and be diffed against the baseline.
+
+Timings on a busy machine vary from run to run, so a baseline is the
+median of several runs, and a benchmark that looks slower is run again
+before it counts as a regression. Absolute timings depend on the machine,
+so a baseline recorded on a different machine or Python version is only
+reported against: regressions are shown but do not fail the run. A host
+that gates on regressions, such as CI, must record its own baseline with
+``--update-baseline``.
+
+Usage: python benchmarks.py [name filter] [--output results.json] [--baseline FILE]
+                            [--threshold 0.25] [--update-baseline] [--no-reports]
+"""
+
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import select
+import socket
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import audio_protocol
+import packet_auth
+from audio_queue import AudioQueue
+
+BASELINE_FILE = 'benchmarks_baseline.json'
+REGRESSION_THRESHOLD = 0.25  # fraction slower than the baseline that fails the run
+REGRESSION_FLOOR_US = 0.1    # slowdowns smaller than this are loop overhead, not regressions
+BASELINE_RUNS = 5            # runs whose median is stored as a benchmark's baseline
+REGRESSION_RETRIES = 3       # extra runs, keeping the fastest, before a slowdown counts
+
+# A 640-byte audio payload: 320 mono pcm16 samples, about 7 ms at the app's 44.1 kHz
+FRAME = bytes(range(256)) * 2 + bytes(128)
+
+
+def measure(func, iterations: int = 20000, repeats: int = 5) -> float:
+    """Time a function and return the best time per call in microseconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e6
+
+
+def _audio_packet(authenticated: bool) -> bytes:
+    """Build a typical audio packet."""
+    return audio_protocol.pack_audio(
+        'operator', 'Main Shop', 1, time.time(), 'pcm16', 20, FRAME,
+        session_id=7, authenticated=authenticated
+    )
+
+
+def bench_pack_audio() -> float:
+    """Build an unauthenticated audio packet."""
+    return measure(lambda: _audio_packet(False))
+
+
+def bench_auth_sign() -> float:
+    """Build and sign an audio packet, minus the cost of building it."""
+    authenticator = packet_auth.PacketAuthenticator(b'k' * 32)
+    return measure(lambda: authenticator.sign(_audio_packet(True))) - bench_pack_audio()
+
+
+def bench_auth_verify() -> float:
+    """Verify a signed packet's tag and check its sequence number for replay."""
+    authenticator = packet_auth.PacketAuthenticator(b'k' * 32)
+    packet = bytes(authenticator.sign(_audio_packet(True)))
+    replay = packet_auth.ReplayWindow()
+    sequence = [0]
+
+    def verify():
+        sequence[0] += 1
+        authenticator.verify(packet)
+        replay.check(sequence[0])
+
+    return measure(verify)
+
+
+def bench_unpack_audio() -> float:
+    """Parse a signed audio packet."""
+    packet = bytes(packet_auth.PacketAuthenticator(b'k' * 32).sign(_audio_packet(True)))
+    return measure(lambda: audio_protocol.unpack_packet(packet))
+
+
+class ReceiveHarness:
+    """Loopback socket pair feeding audio packets to a receive path.
+
+    Packets are sent in rounds small enough to fit in the socket buffer, and
+    only the receiving side is timed. Received audio is copied into a playout
+    queue, as AudioManager.play_audio does.
+    """
+
+    ROUND = 100
+
+    def __init__(self):
+        from network_manager import NetworkManager
+
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(('127.0.0.1', 0))
+        self.receiver.setblocking(False)
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.address = self.receiver.getsockname()
+        self.playout = AudioQueue(100, 4096)
+
+        self.network_manager = NetworkManager('bench', 'Bench')
+        self.network_manager.audio_socket = self.receiver
+        self.network_manager.on_audio_received = lambda packet: self.playout.put(packet.audio_data)
+        self.packets = [
+            audio_protocol.pack_audio('operator', 'Main Shop', seq, time.time(), 'pcm16', 20, FRAME)
+            for seq in range(self.ROUND)
+        ]
+
+    def fill(self):
+        """Queue one round of packets on the receiving socket."""
+        for packet in self.packets:
+            self.sender.sendto(packet, self.address)
+
+    def receive_recvfrom(self) -> int:
+        """Drain the socket the old way: a new bytes object per datagram, sliced into copies."""
+        count = 0
+        while True:
+            try:
+                data, addr = self.receiver.recvfrom(65536)
+            except BlockingIOError:
+                return count
+            self.network_manager._handle_audio_packet(data, addr)
+            self.playout.get()
+            count += 1
+
+    def receive_pooled(self) -> int:
+        """Drain the socket through NetworkManager's pooled receive path."""
+        manager = self.network_manager
+        count = 0
+        batch = manager._receive_batch()
+        while batch:
+            for buffer, nbytes, addr in batch:
+                manager._handle_audio_packet(buffer[:nbytes], addr)
+                manager.receive_pool.release(buffer)
+                self.playout.get()
+                count += 1
+            batch = manager._receive_batch()
+        return count
+
+    def throughput(self, receive, rounds: int = 50) -> float:
+        """Measure sustained packets per second through a receive function."""
+        elapsed = 0.0
+        packets = 0
+        for _ in range(rounds):
+            self.fill()
+            time.sleep(0.001)
+            start = time.perf_counter()
+            packets += receive()
+            elapsed += time.perf_counter() - start
+        return packets / elapsed
+
+    def bytes_per_packet(self, receive, rounds: int = 20) -> float:
+        """Measure the peak memory traced by tracemalloc while receiving, per packet."""
+        self.fill()
+        receive()  # warm up caches and lazily created state
+
+        total = 0
+        packets = 0
+        tracemalloc.start()
+        try:
+            for _ in range(rounds):
+                self.fill()
+                time.sleep(0.001)
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                packets += receive()
+                total += tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+        return total / max(packets, 1)
+
+    def close(self):
+        self.sender.close()
+        self.receiver.close()
+
+
+def bench_receive_recvfrom() -> float:
+    """Receive, parse and queue a packet with recvfrom."""
+    harness = ReceiveHarness()
+    try:
+        return 1e6 / harness.throughput(harness.receive_recvfrom)
+    finally:
+        harness.close()
+
+
+def bench_receive_pooled() -> float:
+    """Receive, parse and queue a packet with pooled buffers and recvfrom_into."""
+    harness = ReceiveHarness()
+    try:
+        return 1e6 / harness.throughput(harness.receive_pooled)
+    finally:
+        harness.close()
+
+
+def report_receive_path():
+    """Report sustained throughput and memory allocated per packet for both receive paths."""
+    harness = ReceiveHarness()
+    try:
+        print("\nReceive path (loopback, 20 ms pcm16 frames)")
+        for name, receive in (('recvfrom', harness.receive_recvfrom),
+                              ('pooled recvfrom_into', harness.receive_pooled)):
+            rate = harness.throughput(receive)
+            allocated = harness.bytes_per_packet(receive)
+            print(f"  {name:<22} {rate:10.0f} packets/s  {allocated:8.0f} bytes allocated/packet")
+        print("  (pooling saves allocations, not time; the rates differ by run-to-run noise)")
+    finally:
+        harness.close()
+
+
+def _traced_bytes(build) -> int:
+    """Get the memory traced by tracemalloc for the objects ``build()`` returns."""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        objects = build()
+        size = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    del objects
+    return size
+
+
+def report_object_footprint(count: int = 10000):
+    """Report the memory per user and per audio packet, and the allocation rate of a stream."""
+    from dataclasses import dataclass, field
+    from typing import List
+    from network_manager import AudioPacket, User
+    from user_table import UserTable
+
+    # The dataclass representations these replaced, for comparison
+    @dataclass
+    class DataclassUser:
+        username: str
+        shop_location: str
+        ip_address: str
+        port: int
+        last_seen: float
+        is_online: bool = True
+        max_packet_size: int = 1200
+        chunk_size: int = 1024
+        codecs: List[str] = field(default_factory=lambda: ['pcm16'])
+
+    @dataclass
+    class DataclassAudioPacket:
+        sender: str
+        sender_shop: str
+        timestamp: float
+        audio_data: bytes
+        sequence_number: int
+        codec: str = 'pcm16'
+        session_id: int = 0
+
+    now = time.time()
+    fields = [(f"user{i}", f"Shop {i % 40}", f"10.0.{i // 250 % 256}.{i % 250 + 1}", 5000, now + i)
+              for i in range(count)]
+    users = [User(*values) for values in fields]
+
+    print(f"\nMemory per object ({count} objects, names and addresses shared with the input)")
+    for name, build in (
+        ('User (dataclass)', lambda: [DataclassUser(*values) for values in fields]),
+        ('User (__slots__)', lambda: [User(*values) for values in fields]),
+        ('UserTable row', lambda: UserTable.from_users(users)),
+        ('AudioPacket (dataclass)', lambda: [DataclassAudioPacket('a', 'b', now, FRAME, i) for i in range(count)]),
+        ('AudioPacket (__slots__)', lambda: [AudioPacket('a', 'b', now, FRAME, i) for i in range(count)]),
+    ):
+        print(f"  {name:<24} {_traced_bytes(build) / count:8.1f} bytes")
+
+    # One 23 ms frame per packet per sender
+    harness = ReceiveHarness()
+    try:
+        allocated = harness.bytes_per_packet(harness.receive_pooled)
+    finally:
+        harness.close()
+    packets_per_second = 1000 / 23
+    print(f"  Receive allocation rate   {allocated * packets_per_second / 1024:8.1f} KB/s per incoming stream "
+          f"({allocated:.0f} bytes x {packets_per_second:.0f} packets/s)")
+
+
+def _noise(seconds: float, sample_rate: int = 44100):
+    """Speech-level noise as int16 samples."""
+    import numpy as np
+    rng = np.random.default_rng(1)
+    return (rng.standard_normal(int(seconds * sample_rate)) * 3000).astype(np.int16)
+
+
+def bench_capture_chunk() -> float:
+    """Run a captured chunk through AudioManager's capture callback, fed by the file backend."""
+    from audio_backends import FileBackend
+    from audio_manager import AudioManager
+
+    chunks = 2000
+    received = []
+    done = threading.Event()
+
+    def on_audio(data: bytes):
+        received.append(len(data))
+        if len(received) == chunks:
+            done.set()
+
+    manager = AudioManager(44100, 1024, FileBackend(_noise(1.0), realtime=False))
+    start = time.perf_counter()
+    manager.start_recording(on_audio)
+    done.wait(30.0)
+    elapsed = time.perf_counter() - start
+    manager.cleanup()
+    return elapsed / chunks * 1e6
+
+
+def _chunk() -> bytes:
+    """One captured chunk: 1024 samples of speech-level noise."""
+    return _noise(1024 / 44100).tobytes()
+
+
+def bench_packetize(codec: str) -> float:
+    """Frame and encode a captured chunk, as the sender worker does with audio from send_audio."""
+    packetizer = audio_protocol.Packetizer(codec, 44100, 20)
+    chunk = _chunk()
+    return measure(lambda: packetizer.feed(chunk))
+
+
+def bench_decode(codec: str) -> float:
+    """Decode a received 20 ms frame into the reusable buffer, as the audio worker does."""
+    payload = audio_protocol.encode_payload(codec, _noise(0.02).tobytes())
+    out = bytearray(4096)
+    return measure(lambda: audio_protocol.decode_payload(codec, payload, out))
+
+
+def _idle_audio_manager():
+    """An AudioManager on the null backend with no streams open."""
+    from audio_backends import NullBackend
+    from audio_manager import AudioManager
+    return AudioManager(44100, 1024, NullBackend(realtime=False))
+
+
+def bench_noise_gate() -> float:
+    """Gate a captured chunk in the capture callback, with nothing recording or monitoring."""
+    manager = _idle_audio_manager()
+    chunk = _chunk()
+    try:
+        return measure(lambda: manager._audio_callback(chunk, 1024, None, 0))
+    finally:
+        manager.cleanup()
+
+
+def bench_audio_levels() -> float:
+    """Compute the RMS level of the latest captured chunk for the VU meter."""
+    manager = _idle_audio_manager()
+    manager.is_recording = True
+    manager.input_stream = object()  # only checked for being open
+    manager.last_chunk = _chunk()
+    try:
+        return measure(manager.get_audio_levels)
+    finally:
+        manager.is_recording = False
+        manager.input_stream = None
+        manager.cleanup()
+
+
+def _free_ports(count: int, addresses) -> list:
+    """Find UDP ports that are free on every one of ``addresses``."""
+    ports = []
+    while len(ports) < count:
+        probes = []
+        try:
+            probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            probes.append(probe)
+            probe.bind((addresses[0], 0))
+            port = probe.getsockname()[1]
+            for address in addresses[1:]:
+                probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                probes.append(probe)
+                probe.bind((address, port))
+            if port not in ports:
+                ports.append(port)
+        except OSError:
+            pass
+        finally:
+            for probe in probes:
+                probe.close()
+    return ports
+
+
+@contextlib.contextmanager
+def _loopback_networks(users, addresses):
+    """Start a NetworkManager for each (username, shop) on its own loopback address.
+
+    They share free ports, keep their peer caches and voice spools in a
+    temporary directory, and send no discovery, so a benchmark neither
+    touches the working directory nor announces itself on the LAN.
+    """
+    from config import NETWORK_CONFIG
+    from network_manager import NetworkManager
+
+    port, discovery_port, audio_port = _free_ports(3, addresses)
+    spool_dir = NETWORK_CONFIG['voice_spool_dir']
+    networks = []
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        try:
+            for (username, shop), address in zip(users, addresses):
+                network = NetworkManager(username, shop, port=port)
+                network.discovery_port = discovery_port
+                network.audio_port = audio_port
+                network.bind_address = address
+                network.peer_cache_file = os.path.join(workdir, f"{username}-peers.json")
+                network._send_discovery = lambda messages: None
+                NETWORK_CONFIG['voice_spool_dir'] = os.path.join(workdir, f"{username}-spool")
+                network.start()
+                networks.append(network)
+            yield networks
+        finally:
+            NETWORK_CONFIG['voice_spool_dir'] = spool_dir
+            for network in networks:
+                network.stop()
+
+
+def report_audio_loopback(seconds: float = 3.0):
+    """Report how much captured audio reaches playout through the network, with no sound hardware."""
+    from audio_backends import FileBackend
+    from audio_manager import AudioManager
+    from network_manager import User
+
+    # Paced like a sound card, so the send and playout queues behave as they would live
+    backend = FileBackend(_noise(seconds), realtime=True, loop=False)
+    manager = AudioManager(44100, 1024, backend)
+    try:
+        with _loopback_networks([('bench', 'Bench')], ['127.0.0.1']) as (network,):
+            network.on_audio_received = lambda packet: manager.play_audio(packet.audio_data, 'bench')
+            network.users['bench@Bench'] = User('bench', 'Bench', '127.0.0.1', network.port, time.time())
+            manager.start_recording(lambda data: network.send_audio('bench', 'Bench', data))
+            backend.input_streams[-1].finished.wait(seconds + 10)
+            network.end_talk_spurt('bench', 'Bench')
+            time.sleep(0.5)
+            played = sum(stream.frames_written for stream in backend.output_streams) / 44100
+    finally:
+        manager.cleanup()
+
+    print("\nAudio loopback (file backend -> network -> file backend, real time)")
+    print(f"  {played:.2f} s of {seconds:.2f} s captured audio played")
+
+
+def _burn_cpu(stop):
+    """Keep a CPU busy until told to stop, like a point-of-sale application under load."""
+    while not stop.is_set():
+        sum(i * i for i in range(10000))
+
+
+def _loopback_latencies(low_latency: bool, duration: float = 2.0, interval: float = 0.005) -> list:
+    """Send audio-sized packets over loopback on a fixed clock and return each one's latency in ms."""
+    import realtime
+    from config import PERFORMANCE_CONFIG
+
+    stamp = struct.Struct('=d')
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(0.5)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if low_latency:
+        for sock, name in ((receiver, 'receiver'), (sender, 'sender')):
+            realtime.tune_socket(sock, f"benchmark {name}", PERFORMANCE_CONFIG['socket_buffer_size'],
+                                 PERFORMANCE_CONFIG['audio_tos'])
+    address = receiver.getsockname()
+    latencies = []
+
+    def receive():
+        if low_latency:
+            realtime.raise_thread_priority('network')
+        while True:
+            try:
+                data = receiver.recv(2048)
+            except socket.timeout:
+                return
+            latencies.append((time.perf_counter() - stamp.unpack_from(data)[0]) * 1000)
+
+    def send():
+        if low_latency:
+            realtime.raise_thread_priority('audio')
+        padding = FRAME[stamp.size:]
+        next_send = time.perf_counter()
+        end = next_send + duration
+        while next_send < end:
+            time.sleep(max(0.0, next_send - time.perf_counter()))
+            # Stamped with the time it was due, so a late wakeup counts too
+            sender.sendto(stamp.pack(next_send) + padding, address)
+            next_send += interval
+
+    threads = [threading.Thread(target=receive, name='benchmark-receiver'),
+               threading.Thread(target=send, name='benchmark-sender')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sender.close()
+    receiver.close()
+    return latencies
+
+
+def report_latency_under_load():
+    """Report loopback packet latency with and without low-latency mode while every CPU is busy."""
+    import realtime
+
+    def summary(latencies: list) -> str:
+        if not latencies:
+            return "no packets received"
+        latencies = sorted(latencies)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return f"p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  max {latencies[-1]:7.2f} ms  ({len(latencies)} packets)"
+
+    print("\nLoopback latency (5 ms packet clock)")
+    print(f"  {'idle':<26} {summary(_loopback_latencies(False))}")
+
+    # Two busy processes per CPU, so the benchmark threads have to compete for time slices
+    stop = multiprocessing.Event()
+    load = [multiprocessing.Process(target=_burn_cpu, args=(stop,), daemon=True)
+            for _ in range((os.cpu_count() or 1) * 2)]
+    for process in load:
+        process.start()
+    try:
+        time.sleep(0.5)
+        print(f"  {'CPU load':<26} {summary(_loopback_latencies(False))}")
+        print(f"  {'CPU load, low-latency mode':<26} {summary(_loopback_latencies(True))}")
+    finally:
+        stop.set()
+        for process in load:
+            process.join(2.0)
+            if process.is_alive():
+                process.terminate()
+
+    print(realtime.diagnostics.report())
+
+
+def _transfer_over_loopback(seconds: float, loss: float, delay: float, rate: float) -> dict:
+    """Deliver a spooled voice message between two NetworkManagers over a link that drops and delays datagrams.
+
+    Both managers' rate limits are in the path, so acknowledgements the
+    receiver sends too fast show up as filter drops rather than going unseen.
+    """
+    import voice_transfer
+    from network_manager import User
+
+    rng = random.Random(1)
+    in_flight = []  # (due, order, send, datagram, address)
+    order = 0
+    wake = threading.Condition()
+    done = threading.Event()
+    acks_sent = 0
+
+    def impair(network):
+        send = network._send_control_datagram
+
+        def impaired(data: bytes, address):
+            nonlocal order, acks_sent
+            if voice_transfer.is_ack(data):
+                acks_sent += 1
+            if rng.random() < loss:
+                return
+            if not delay:
+                send(data, address)
+                return
+            with wake:
+                heapq.heappush(in_flight, (time.monotonic() + delay, order, send, data, address))
+                order += 1
+                wake.notify()
+        network._send_control_datagram = impaired
+
+    def deliver():
+        with wake:
+            while not done.is_set():
+                if not in_flight:
+                    wake.wait(0.1)
+                    continue
+                wait = in_flight[0][0] - time.monotonic()
+                if wait > 0:
+                    wake.wait(wait)
+                    continue
+                _, _, send, data, address = heapq.heappop(in_flight)
+                send(data, address)
+
+    pcm = _noise(seconds).tobytes()
+    received = []
+    deliverer = threading.Thread(target=deliver, daemon=True)
+    deliverer.start()
+    users = [('bench-a', 'Bench A'), ('bench-b', 'Bench B')]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), \
+                _loopback_networks(users, ['127.0.0.1', '127.0.0.2']) as (sender, receiver):
+            sender.voice_transfer_rate = rate
+            receiver.on_voice_message = received.append
+            receiver.users['bench-a@Bench A'] = User('bench-a', 'Bench A', '127.0.0.1', sender.port, time.time())
+
+            # Spooled while the receiver is unknown, delivered once its presence is heard
+            for start in range(0, len(pcm), 2048):
+                sender.send_audio('bench-b', 'Bench B', pcm[start:start + 2048])
+            sender.end_talk_spurt('bench-b', 'Bench B')
+            impair(sender)
+            impair(receiver)
+            sender.users['bench-b@Bench B'] = User('bench-b', 'Bench B', '127.0.0.2', receiver.port, time.time())
+
+            transfer = None
+            deadline = time.monotonic() + 60.0
+            # Until the sender has heard the last acknowledgement, which may itself be lost
+            while not (received and transfer and transfer.done) and time.monotonic() < deadline:
+                transfer = sender.outgoing_transfers.get('bench-b@Bench B', transfer)
+                time.sleep(0.005)
+
+            stats = transfer.stats() if transfer else {'bytes': 0, 'chunks': 0, 'acknowledged': 0, 'retransmissions': 0}
+            codec = transfer.offer['codec'] if transfer else None
+            stats['intact'] = bool(received) and received[0].audio_data == audio_protocol.decode_payload(
+                codec, audio_protocol.encode_payload(codec, pcm))
+            stats['seconds'] = ((transfer.finished_at or sender.clock.time()) - transfer.started_at) if transfer else 0.0
+            stats['acks'] = acks_sent
+            stats['dropped'] = sum(network.get_filter_stats()[name]['dropped_rate']
+                                   for network in (sender, receiver) for name in ('control', 'voice'))
+    finally:
+        done.set()
+        with wake:
+            wake.notify()
+        deliverer.join()
+    return stats
+
+
+def report_voice_transfer(seconds: float = 20.0):
+    """Report voice message delivery throughput and acknowledgement rate over an impaired loopback link."""
+    from config import NETWORK_CONFIG
+
+    window = NETWORK_CONFIG['voice_transfer_window']
+    print(f"\nVoice message delivery ({seconds:g} s message, window {window} chunks, two managers on loopback)")
+    for label, rate in (('paced', NETWORK_CONFIG['voice_transfer_rate']), ('unpaced', 1e9)):
+        for loss, delay in ((0.0, 0.0), (0.01, 0.005), (0.05, 0.02), (0.10, 0.02)):
+            stats = _transfer_over_loopback(seconds, loss, delay, rate)
+            elapsed = stats['seconds']
+            complete = stats['acknowledged'] == stats['chunks'] and elapsed > 0
+            throughput = stats['bytes'] / elapsed / 1024 if complete else 0.0
+            ack_rate = stats['acks'] / elapsed if elapsed > 0 else 0.0
+            print(f"  {'✓' if stats['intact'] else '✗'} {label:<8} loss {loss:4.0%}  delay {delay * 1000:3.0f} ms  "
+                  f"{throughput:6.0f} KB/s  {stats['retransmissions']:4d} retransmissions  "
+                  f"{ack_rate:4.0f} acks/s  {stats['dropped']:3d} filtered")
+
+
+def _peer_presence(index: int) -> dict:
+    """Build the presence message of a simulated peer."""
+    return {
+        'type': 'presence',
+        'username': f"user{index}",
+        'shop_location': f"Shop {index % 40}",
+        'ip_address': f"10.0.{index // 250 % 256}.{index % 250 + 1}",
+        'port': 5000,
+        'max_packet_size': 1200,
+        'chunk_size': 1024,
+        'codecs': ['pcm16', 'ulaw'],
+        'version': 1,
+        'timestamp': time.time(),
+    }
+
+
+def _directory(count: int):
+    """A NetworkManager that knows ``count`` peers, one in ten of them offline."""
+    import contextlib
+    import io
+    from network_manager import NetworkManager
+
+    network = NetworkManager('bench', 'Bench')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in range(count):
+            message = _peer_presence(index)
+            network._handle_presence(message, message['ip_address'])
+    for index, user in enumerate(network.users.values()):
+        user.is_online = index % 10 != 0
+    return network
+
+
+def bench_handle_presence() -> float:
+    """Handle a presence message from a known peer, in a directory of 1000."""
+    network = _directory(1000)
+    messages = [_peer_presence(index) for index in range(1000)]
+    position = [0]
+
+    def handle():
+        message = messages[position[0] % 1000]
+        position[0] += 1
+        network._handle_presence(message, message['ip_address'])
+
+    return measure(handle)
+
+
+def bench_online_users(count: int) -> float:
+    """List the online peers of a directory of ``count``."""
+    network = _directory(count)
+    return measure(network.get_online_users, iterations=max(20, 200000 // count))
+
+
+def bench_update_users_list(count: int):
+    """Rebuild the main window's user list after one of ``count`` online peers changed.
+
+    Runs offscreen. Returns None without PyQt6.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt6.QtWidgets import QApplication
+        from main_window import MainWindow
+    except ImportError:
+        return None
+
+    class BenchWindow(MainWindow):
+        def load_settings(self):
+            self.username, self.shop_location = 'bench', 'Bench'
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = BenchWindow()
+    users = _directory(count + 1).get_online_users()
+    lists = [users[:count], users[1:count + 1]]
+    position = [0]
+
+    def update():
+        window.update_users_list(lists[position[0] % 2])
+        position[0] += 1
+
+    try:
+        return measure(update, iterations=max(5, 20000 // count), repeats=3)
+    finally:
+        window.close()
+        app.processEvents()
+
+
+# (name, function, budget in microseconds or None)
+BENCHMARKS = [
+    ('pack_audio', bench_pack_audio, None),
+    ('unpack_audio', bench_unpack_audio, None),
+    ('auth_sign', bench_auth_sign, 20.0),
+    ('auth_verify', bench_auth_verify, 20.0),
+    ('receive_recvfrom', bench_receive_recvfrom, None),
+    ('receive_pooled', bench_receive_pooled, None),
+    ('capture_chunk', bench_capture_chunk, None),
+    ('packetize_pcm16', lambda: bench_packetize('pcm16'), None),
+    ('packetize_ulaw', lambda: bench_packetize('ulaw'), None),
+    ('decode_pcm16', lambda: bench_decode('pcm16'), None),
+    ('decode_ulaw', lambda: bench_decode('ulaw'), None),
+    ('noise_gate', bench_noise_gate, None),
+    ('audio_levels', bench_audio_levels, None),
+    ('handle_presence', bench_handle_presence, None),
+    ('online_users_10', lambda: bench_online_users(10), None),
+    ('online_users_1k', lambda: bench_online_users(1000), None),
+    ('online_users_10k', lambda: bench_online_users(10000), None),
+    ('update_users_list_10', lambda: bench_update_users_list(10), None),
+    ('update_users_list_1k', lambda: bench_update_users_list(1000), None),
+    ('update_users_list_10k', lambda: bench_update_users_list(10000), None),
+]
+
+# (name, function) for reports that print more than a time per operation
+REPORTS = [
+    ('receive_path', report_receive_path),
+    ('audio_loopback', report_audio_loopback),
+    ('object_footprint', report_object_footprint),
+    ('latency_under_load', report_latency_under_load),
+    ('voice_transfer', report_voice_transfer),
+]
+
+
+def _machine() -> dict:
+    """Describe the machine results were measured on."""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def load_results(path: str) -> dict:
+    """Load a results file, or an empty one if it does not exist."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'machine': {}, 'results_us': {}}
+
+
+def save_results(path: str, results: dict):
+    """Write results with sorted keys, one benchmark per line, so they diff cleanly."""
+    document = {
+        'machine': _machine(),
+        'results_us': {name: round(value, 3) for name, value in sorted(results.items())},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def _regressed(result: float, baseline: float, threshold: float) -> bool:
+    """Check if a result is slower than its baseline by more than the threshold and the floor."""
+    return result > baseline * (1 + threshold) and result - baseline > REGRESSION_FLOOR_US
+
+
+def main():
+    """Run the benchmarks and report any that exceed their budget or regressed from the baseline."""
+    parser = argparse.ArgumentParser(description="Run the Tradelink Intercom microbenchmarks")
+    parser.add_argument('filter', nargs='?', default='', help="only run benchmarks and reports with this in their name")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline results to compare with")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="fraction slower than the baseline that counts as a regression")
+    parser.add_argument('--update-baseline', action='store_true', help="store these results in the baseline")
+    parser.add_argument('--no-reports', action='store_true', help="only run the timed benchmarks")
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)
+    expected = baseline['results_us']
+    # Timings from another machine say nothing about a regression here
+    gating = baseline['machine'] == _machine()
+    failures = []
+    reported = []
+
+    print("Tradelink Intercom microbenchmarks")
+    print("=" * 50)
+    if expected and not args.update_baseline:
+        print(f"Comparing with {args.baseline}, regression threshold {args.threshold:.0%}")
+        if not gating:
+            print(f"  Recorded on another machine ({baseline['machine'].get('platform')}, "
+                  f"Python {baseline['machine'].get('python')}); regressions are reported only.\n"
+                  f"  Run with --update-baseline on this machine to gate on them.")
+    elif not args.update_baseline:
+        print(f"No baseline in {args.baseline}; run with --update-baseline to record one")
+
+    selected = [(name, func, budget) for name, func, budget in BENCHMARKS if args.filter in name]
+    functions = {name: func for name, func, _ in selected}
+
+    # Whole passes rather than back-to-back runs, so the samples of a benchmark are spread over time
+    samples = {}
+    for _ in range(BASELINE_RUNS if args.update_baseline else 1):
+        for name, func, _ in selected:
+            samples.setdefault(name, []).append(func())
+    results = {name: statistics.median(values) for name, values in samples.items() if None not in values}
+
+    # Run what looks slower again, after the rest, and keep its fastest time
+    for _ in range(0 if args.update_baseline else REGRESSION_RETRIES):
+        slower = [name for name, result in results.items()
+                  if name in expected and _regressed(result, expected[name], args.threshold)]
+        for name in slower:
+            results[name] = min(results[name], functions[name]())
+
+    for name, _, budget in selected:
+        result = results.get(name)
+        if result is None:
+            print(f"  {name:<24}  skipped")
+            continue
+
+        status = ' '
+        notes = []
+        if budget is not None:
+            status = '✓' if result <= budget else '✗'
+            notes.append(f"budget {budget:.0f} us")
+        if name in expected and not args.update_baseline:
+            change = result / expected[name] - 1
+            regressed = _regressed(result, expected[name], args.threshold)
+            notes.append(f"{change:+.0%} vs baseline")
+            if regressed and gating:
+                status = '✗'
+                failures.append(f"{name} (regressed)")
+            elif regressed:
+                status = '!' if status != '✗' else status
+                reported.append(name)
+            elif status == ' ':
+                status = '✓'
+        if budget is not None and result > budget:
+            failures.append(f"{name} (over budget)")
+
+        print(f"{status} {name:<24} {result:9.2f} us" + (f"  ({', '.join(notes)})" if notes else ''))
+
+    if not args.no_reports:
+        for name, func in REPORTS:
+            if args.filter in name:
+                func()
+
+    if args.output:
+        save_results(args.output, results)
+        print(f"\nResults written to {args.output}")
+    if args.update_baseline:
+        save_results(args.baseline, {**expected, **results})
+        print(f"\nBaseline {args.baseline} updated with {len(results)} result(s)")
+
+    if failures:
+        print(f"\n{len(failures)} benchmark(s) failed: {', '.join(failures)}")
+        return 1
+
+    if reported:
+        print(f"\nAll benchmarks within budget; {len(reported)} slower than the other machine's baseline "
+              f"(not gated): {', '.join(reported)}")
+        return 0
+
+    print("\nAll benchmarks within budget and baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Memory-mapped recording of incoming talk spurts, for "replay last message".
+
+The recorder writes every incoming message into a ring inside a file of
+fixed size, preallocated and memory-mapped once. Each frame is copied
+straight from the playout path into the mapping, with no allocation or
+system call and only a lock held for the copy, so recording never holds
+up audio. Old messages are overwritten as the ring wraps, so disk and
+memory use stay at the configured size however long the app runs.
+
+The file header records where the last complete message is, so it can be
+read back by another process (the GUI, when audio runs in the engine
+process) or after a restart.
+
+Layout: ``HEADER``, then the ring of records. Each record is ``RECORD``
+(type, length, message id, timestamp) followed by its data: the sender and
+shop for a start record, 16-bit PCM for an audio record. A wrap record
+means the rest of the ring is unused and the next record is at its start.
+"""
+
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from clock import Clock, system_clock
+
+MAGIC = b'TLREC\0\0\0'
+VERSION = 1
+
+# magic, version, sample rate, ring capacity, bytes written, last message start, end and id
+HEADER = struct.Struct('<8sIIQQQQI4x')
+TOTAL_WRITTEN_OFFSET = 24
+LAST_MESSAGE_OFFSET = 32
+LAST_MESSAGE = struct.Struct('<QQI')
+
+# type, reserved, length, message id, timestamp
+RECORD = struct.Struct('<BBHId')
+
+RECORD_START = 1
+RECORD_AUDIO = 2
+RECORD_END = 3
+RECORD_WRAP = 4
+
+
+class RecordedMessage(NamedTuple):
+    """A message read back from the recording."""
+    sender: str
+    sender_shop: str
+    timestamp: float
+    sample_rate: int
+    audio: bytes
+
+
+class CallRecorder:
+    """Writes incoming talk spurts into a memory-mapped ring file."""
+
+    def __init__(self, path: str, size: int, sample_rate: int, clock: Optional[Clock] = None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.clock = clock or system_clock
+        self.capacity = size - HEADER.size
+
+        # Reuse an existing recording of the same size, so the last message survives a restart
+        existing = os.path.exists(path) and os.path.getsize(path) == size
+        self._file = open(path, 'r+b' if existing else 'w+b')
+        if not existing:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+        header = HEADER.unpack_from(self._map, 0)
+        if header[:4] == (MAGIC, VERSION, sample_rate, self.capacity):
+            self.total_written = header[4]
+            self._next_id = header[7] + 1
+        else:
+            self.total_written = 0
+            self._next_id = 1
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, sample_rate, self.capacity, 0, 0, 0, 0)
+
+        # Open messages: source -> (message id, absolute start position, start time)
+        self._open: Dict[str, tuple] = {}
+        self._lock = threading.Lock()  # frames and message ends can arrive on different network threads
+
+        # Metrics
+        self.messages = 0
+        self.bytes_recorded = 0
+
+    def _append(self, record_type: int, message_id: int, timestamp: float, data) -> int:
+        """Copy a record into the ring and return its absolute start position."""
+        length = len(data)
+        needed = RECORD.size + length
+        if needed > self.capacity:
+            return self.total_written
+
+        offset = self.total_written % self.capacity
+        if offset + needed > self.capacity:
+            # Records never straddle the end of the ring
+            if self.capacity - offset >= RECORD.size:
+                RECORD.pack_into(self._map, HEADER.size + offset, RECORD_WRAP, 0, 0, 0, 0.0)
+            self.total_written += self.capacity - offset
+            offset = 0
+
+        position = self.total_written
+        start = HEADER.size + offset
+        RECORD.pack_into(self._map, start, record_type, 0, length, message_id, timestamp)
+        self._map[start + RECORD.size:start + needed] = data
+        self.total_written += needed
+        struct.pack_into('<Q', self._map, TOTAL_WRITTEN_OFFSET, self.total_written)
+        return position
+
+    def start(self, source: str, timestamp: Optional[float] = None):
+        """Start recording a message from a source ("user@shop")."""
+        timestamp = self.clock.time() if timestamp is None else timestamp
+        sender, _, shop = source.partition('@')
+        with self._lock:
+            message_id = self._next_id
+            self._next_id += 1
+            position = self._append(RECORD_START, message_id, timestamp, f"{sender}\0{shop}".encode('utf-8'))
+            self._open[source] = (message_id, position, timestamp)
+
+    def write(self, source: str, audio_data):
+        """Record a frame of a source's message, starting the message if needed."""
+        if source not in self._open:
+            self.start(source)
+        with self._lock:
+            entry = self._open.get(source)
+            if entry is None:
+                return
+            self._append(RECORD_AUDIO, entry[0], entry[2], audio_data)
+            self.bytes_recorded += len(audio_data)
+
+    def end(self, source: str):
+        """Finish a source's message and make it the last message."""
+        with self._lock:
+            entry = self._open.pop(source, None)
+            if entry is None:
+                return
+            message_id, position, started_at = entry
+            self._append(RECORD_END, message_id, started_at, b'')
+            LAST_MESSAGE.pack_into(self._map, LAST_MESSAGE_OFFSET, position, self.total_written, message_id)
+            self.messages += 1
+
+    def is_recording(self, source: str) -> bool:
+        """Check if a source has a message open."""
+        return source in self._open
+
+    def stats(self) -> dict:
+        """Get recorder metrics."""
+        return {
+            'path': self.path,
+            'capacity': self.capacity,
+            'messages': self.messages,
+            'bytes_recorded': self.bytes_recorded,
+            'open_messages': len(self._open),
+        }
+
+    def close(self):
+        """Close the mapping. Messages still open are dropped."""
+        with self._lock:
+            self._open.clear()
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+def read_last_message(path: str) -> Optional[RecordedMessage]:
+    """Read the last complete message from a recording file, or None.
+
+    The writer may be running in another thread or process. If it
+    overwrites the message while it is being read, None is returned.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, version, sample_rate, capacity, _, start, end, message_id = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or version != VERSION or end <= start or end - start > capacity:
+            return None
+
+        sender = shop = ''
+        timestamp = 0.0
+        frames = []
+        position = start
+        while position < end:
+            offset = position % capacity
+            record_type, _, length, record_id, record_time = RECORD.unpack_from(mapping, HEADER.size + offset)
+            if record_type == RECORD_WRAP or offset + RECORD.size > capacity:
+                position += capacity - offset
+                continue
+
+            data_start = HEADER.size + offset + RECORD.size
+            if record_id == message_id:
+                if record_type == RECORD_START:
+                    sender, _, shop = mapping[data_start:data_start + length].decode('utf-8').partition('\0')
+                    timestamp = record_time
+                elif record_type == RECORD_AUDIO:
+                    frames.append(mapping[data_start:data_start + length])
+            position += RECORD.size + length
+
+        # The writer may have lapped the ring while we copied
+        total_written = struct.unpack_from('<Q', mapping, TOTAL_WRITTEN_OFFSET)[0]
+        if total_written - start > capacity or not frames:
+            return None
+
+        return RecordedMessage(sender, shop, timestamp, sample_rate, b''.join(frames))
+    except (struct.error, UnicodeDecodeError):
+        return None
+    finally:
+        mapping.close()
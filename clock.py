@@ -0,0 +1,122 @@
+"""
+Clocks for the network, audio and hotkey managers.
+
+The managers read the time and sleep through a ``Clock`` instead of the
+``time`` module, so timeouts, expiry, pruning and pacing can be driven by a
+``VirtualClock`` in simulations and tests: hours of protocol time pass in
+as long as the code takes to run, and a run gives the same result every
+time. The app itself uses ``system_clock``.
+
+Blocking socket reads still wait in real time, so a simulation drives the
+managers' handlers and ``_control_tick`` directly rather than starting
+their worker threads.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+# Where virtual clocks start by default: a fixed, plausible wall-clock time
+VIRTUAL_EPOCH = 1_700_000_000.0
+
+
+class Clock:
+    """Wall-clock time, a monotonic timer and sleeping."""
+
+    def time(self) -> float:
+        """Seconds since the epoch, for timestamps and ages."""
+        raise NotImplementedError
+
+    def monotonic(self) -> float:
+        """Seconds from an arbitrary start that never go backwards, for intervals."""
+        raise NotImplementedError
+
+    def sleep(self, seconds: float):
+        """Wait for ``seconds``."""
+        raise NotImplementedError
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        """Wait until ``event`` is set or ``timeout`` passes. Returns whether it is set."""
+        raise NotImplementedError
+
+
+class SystemClock(Clock):
+    """The real clock."""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when it is advanced.
+
+    Sleeping advances it at once instead of blocking, and so does waiting
+    for an event that is not set. Callbacks scheduled with ``call_later``
+    run in time order, with the clock set to when they were due, as it
+    advances past them, so a simulation can be written as timers.
+    """
+
+    def __init__(self, start: float = VIRTUAL_EPOCH):
+        self._start = start
+        self._now = start
+        self._lock = threading.RLock()
+        self._timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self._order = itertools.count()  # keeps timers due at the same time in the order they were set
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now - self._start
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        if not event.is_set() and timeout:
+            self.advance(timeout)
+        return event.is_set()
+
+    def call_later(self, delay: float, callback: Callable[[], None]):
+        """Run ``callback`` once the clock has advanced by ``delay``."""
+        with self._lock:
+            heapq.heappush(self._timers, (self._now + max(0.0, delay), next(self._order), callback))
+
+    def call_every(self, interval: float, callback: Callable[[], None], delay: Optional[float] = None):
+        """Run ``callback`` every ``interval`` seconds, first after ``delay`` (default ``interval``)."""
+        def repeat():
+            callback()
+            self.call_later(interval, repeat)
+        self.call_later(interval if delay is None else delay, repeat)
+
+    def advance(self, seconds: float):
+        """Move the clock forward, running the timers that fall due on the way."""
+        self.advance_to(self._now + max(0.0, seconds))
+
+    def advance_to(self, when: float):
+        """Move the clock forward to ``when``, running the timers that fall due on the way."""
+        with self._lock:
+            while self._timers and self._timers[0][0] <= when:
+                due, _, callback = heapq.heappop(self._timers)
+                self._now = max(self._now, due)
+                callback()
+            self._now = max(self._now, when)
+
+    @property
+    def pending(self) -> int:
+        """Number of timers waiting to run."""
+        return len(self._timers)
+
+
+system_clock = SystemClock()
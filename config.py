@@ -9,17 +9,51 @@ NETWORK_CONFIG = {
     'audio_port': 5003,          # Port for audio transmission
     'broadcast_port': 5001,      # Port for broadcast messages
     'timeout': 1.0,              # Network timeout in seconds
-    'max_audio_packet_size': 65536,  # Maximum audio packet size
+    'bind_address': '',          # Local address every socket binds to (empty = all interfaces)
+    'user_prune_age': 24 * 3600, # Forget peers offline for this long, and state for senders idle as long (seconds)
+    'presence_interval': 60.0,   # Seconds between presence re-broadcasts, so peers can tell we are still there
+    'max_audio_packet_size': 1200,   # Audio datagram budget in bytes (kept below the MTU)
+    'report_interval': 1.0,      # Receiver report interval in seconds (control port)
+    'ping_interval': 2.0,        # RTT probe interval in seconds (control port)
+    'adaptive_bitrate': True,    # Adapt codec, frame size and FEC per peer from reports
+    'spurt_end_repeats': 3,      # Times a talk spurt end marker is sent
+    'spurt_timeout': 2.0,        # End an incoming talk spurt after this many silent seconds
+    'interface_refresh_interval': 30.0,  # Seconds between network interface re-scans
+    'peer_cache_file': 'peer_cache.json',  # Recently seen peers, next to settings.json
+    'peer_cache_max_age': 7 * 24 * 3600,   # Forget cached peers not seen for this long (seconds)
+    'peer_probe_timeout': 3.0,   # Seconds for a cached peer to answer before it is shown offline
+    'gossip_enabled': False,     # Also spread presence by swapping digests with random peers
+    'gossip_interval': 1.0,      # Seconds between gossip rounds
+    'gossip_fanout': 2,          # Peers contacted per gossip round
+    'gossip_max_bytes': 1200,    # Encoded size of gossip digests and deltas (the audio budget, below the MTU)
+    'capture_file': '',          # Record every datagram sent and received to this file (empty = off)
+    'voice_messages': True,      # Spool talk spurts to offline peers and deliver them when they return
+    'voice_spool_dir': 'voice_spool',  # Directory for undelivered voice messages
+    'voice_spool_max_mb': 50,    # Discard the oldest undelivered messages beyond this size
+    'voice_message_max_age': 7 * 24 * 3600,  # Discard undelivered messages older than this (seconds)
+    'voice_message_max_seconds': 120,  # Longest voice message kept; the rest of a longer spurt is dropped
+    'voice_transfer_window': 32, # Unacknowledged chunks in flight per voice message transfer
+    'voice_transfer_rate': 256 * 1024,  # Voice message transfer pacing (bytes/s), well below a LAN's capacity
+    'voice_transfer_timeout': 15.0,  # Give up on a transfer after this many seconds without progress
 }
 
 # Audio Configuration
 AUDIO_CONFIG = {
     'sample_rate': 44100,        # Audio sample rate (Hz)
-    'chunk_size': 1024,          # Audio chunk size for processing
+    'chunk_size': 1024,          # Maximum samples per captured chunk and per audio frame
+    'codec': 'pcm16',            # Audio codec on the wire ('pcm16' or 'ulaw')
     'channels': 1,               # Number of audio channels (1 = mono)
     'format': 'int16',           # Audio format
     'noise_gate_threshold': 500, # Noise gate threshold
     'buffer_size': 4096,         # Audio buffer size
+    'preroll_ms': 0,             # Keep the input stream warm and send this much audio from before PTT (0 = off)
+    'backend': 'pyaudio',        # Audio device: 'pyaudio' (sound card), 'file' or 'null' (no hardware)
+    'backend_source': '',        # File backend: WAV file to capture from (empty = silence)
+    'backend_sink': '',          # File backend: WAV file to play into (empty = memory)
+    'backend_realtime': True,    # File and null backends: pace like a sound card, or run flat out
+    'call_recording': False,     # Record incoming messages to a ring file for "replay last message"
+    'recording_file': 'recordings.tlrec',  # Memory-mapped ring file for recorded messages
+    'recording_max_mb': 64,      # Size of the ring file; the oldest messages are overwritten
 }
 
 # Hotkey Configuration
@@ -37,6 +71,8 @@ UI_CONFIG = {
     'minimize_to_tray': True,    # Minimize to system tray on close
     'show_notifications': True,  # Show system notifications
     'notification_duration': 3000,  # Notification display time (ms)
+    'ui_frame_interval': 50,     # Coalesce GUI updates from worker threads over this many ms
+    'notification_rate_limit': 10.0,  # Minimum seconds between notifications per sender
 }
 
 # System Configuration
@@ -59,7 +95,7 @@ SHOP_CONFIG = {
         'Office'
     ],
     'max_users_per_shop': 10,    # Maximum users per shop
-    'user_timeout': 300,         # User timeout in seconds
+    'user_timeout': 300,         # Show a peer offline after this many seconds without its presence (it crashed or lost power)
 }
 
 # Performance Configuration
@@ -68,14 +104,28 @@ PERFORMANCE_CONFIG = {
     'network_scan_interval': 1000,   # Network scan interval (ms)
     'user_list_update_interval': 2000,  # User list update interval (ms)
     'max_audio_queue_size': 100,     # Maximum audio packets in queue
+    'send_queue_policy': 'drop_oldest',      # Per-peer send queue policy when full
+    'playout_queue_policy': 'skip_silence',  # Per-sender playout queue policy when full
+    'receive_buffer_count': 32,      # Preallocated 64 KB buffers for receiving audio datagrams
+    'audio_engine_process': False,   # Run audio and networking in a child process, away from the GUI
+    'network_io_mode': 'threads',    # 'threads' (one per socket) or 'selector' (one thread for all sockets)
+    'low_latency_mode': False,       # Raise audio and network thread priority, tune the audio socket
+    'socket_buffer_size': 1 << 20,   # Audio socket SO_RCVBUF/SO_SNDBUF in low-latency mode (bytes)
+    'audio_tos': 0xB8,               # Audio socket TOS byte in low-latency mode (DSCP 46, Expedited Forwarding)
 }
 
 # Security Configuration
 SECURITY_CONFIG = {
-    'encrypt_audio': False,      # Encrypt audio data (not implemented in MVP)
+    'encrypt_audio': False,      # Encrypt audio data (not implemented; see authenticate_audio)
+    'authenticate_audio': False, # Sign audio packets and drop forged or replayed ones
+    'shared_secret': '',         # Chain-wide secret that audio keys are derived from
     'require_authentication': False,  # Require user authentication
     'allowed_networks': [],      # List of allowed network ranges
     'block_external_access': True,    # Block external network access
+    'discovery_rate_limit': 20,  # Discovery packets/s accepted per source (burst 2x)
+    'audio_rate_limit': 250,     # Audio packets/s accepted per source (burst 2x)
+    'control_rate_limit': 50,    # Control packets/s accepted per source (burst 2x)
+    'voice_rate_limit': 500,     # Voice message chunks and acks/s accepted per source (burst 2x)
 }
 
 def get_config(section: str, key: str, default=None):
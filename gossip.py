@@ -0,0 +1,171 @@
+"""
+Gossip-based presence dissemination.
+
+Presence and offline messages are broadcast once, so a terminal that misses
+one (another subnet, a dropped datagram, started later) never hears of it.
+In gossip mode every terminal also keeps the latest versioned presence or
+offline message of each user, and each round swaps a compact digest
+(user key and version) with a few random peers:
+
+1. A sends B a digest of its most recently changed entries plus a rotating
+   slice of the older ones.
+2. B replies with the entries it has that are newer than A's, and asks for
+   the keys where A's are newer.
+3. A sends the entries B asked for.
+
+Digests and replies are capped by their encoded size, so the traffic per
+terminal per round stays the same however large the chain gets and no
+datagram is fragmented, while a change reaches every terminal in a number
+of rounds that grows with the log of its size (see gossip_simulation.py).
+"""
+
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Encoded size of a digest or delta datagram: the audio datagram budget, below the MTU
+MAX_MESSAGE_BYTES = 1200
+
+
+def new_version(now: Optional[float] = None) -> int:
+    """Get a version for a change to our own entry.
+
+    Milliseconds since the epoch, so a restarted terminal supersedes what
+    the chain remembers of its previous run.
+    """
+    return int((time.time() if now is None else now) * 1000)
+
+
+def entry_key(entry: dict) -> str:
+    """Get the user key an entry describes."""
+    return f"{entry['username']}@{entry['shop_location']}"
+
+
+def pack_deltas(entries: List[dict], wanted: List[str], max_bytes: int = MAX_MESSAGE_BYTES) -> List[bytes]:
+    """Encode entries and wanted keys as ``gossip_delta`` datagrams of at most ``max_bytes`` each.
+
+    Only an entry that is larger than ``max_bytes`` on its own is sent in a
+    larger datagram.
+    """
+    datagrams = []
+    delta = {'type': 'gossip_delta', 'entries': []}
+    data = None
+    for field, item in [('want', key) for key in wanted] + [('entries', entry) for entry in entries]:
+        delta.setdefault(field, []).append(item)
+        encoded = json.dumps(delta).encode()
+        if len(encoded) > max_bytes and data is not None:
+            datagrams.append(data)
+            delta = {'type': 'gossip_delta', 'entries': []}
+            delta.setdefault(field, []).append(item)
+            encoded = json.dumps(delta).encode()
+        data = encoded
+
+    if data is not None:
+        datagrams.append(data)
+    return datagrams
+
+
+class GossipDirectory:
+    """Latest versioned presence or offline entry for each user.
+
+    Entries are kept in the order they last changed here, so the newest
+    (the ones still spreading) are at the end.
+    """
+
+    def __init__(self, max_bytes: int = MAX_MESSAGE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, dict] = {}
+        self._cursor = 0
+
+        # Metrics
+        self.updates = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def version(self, key: str) -> int:
+        """Get the version we have for a user, or 0."""
+        entry = self.entries.get(key)
+        return entry['version'] if entry else 0
+
+    def update(self, entry: dict) -> bool:
+        """Store an entry if it is newer than ours. Returns whether it was."""
+        key = entry_key(entry)
+        if entry['version'] <= self.version(key):
+            return False
+
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+        self.updates += 1
+        return True
+
+    def forget(self, key: str):
+        """Drop a user's entry."""
+        self.entries.pop(key, None)
+
+    def _digest_bytes(self, key: str) -> int:
+        """Get the encoded size of a key's digest pair, with the separator after it."""
+        return len(json.dumps(key)) + len(str(self.version(key))) + 6  # ["key", 123],
+
+    def digest(self, max_bytes: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Get (key, version) pairs for the newest entries and a rotating slice of the rest.
+
+        The pairs encode to at most ``max_bytes`` (default ``self.max_bytes``)
+        as a JSON list; the newest entries get half of it.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        keys = list(self.entries)
+        used = 2  # the list's brackets
+        recent = len(keys)
+        while recent and used + self._digest_bytes(keys[recent - 1]) <= max_bytes // 2:
+            used += self._digest_bytes(keys[recent - 1])
+            recent -= 1
+        older = keys[:recent]
+        selected = keys[recent:]
+
+        # Walk through the older entries a slice at a time, so lost updates are repaired too
+        if older:
+            start = self._cursor % len(older)
+            count = 0
+            while count < len(older):
+                key = older[(start + count) % len(older)]
+                if used + self._digest_bytes(key) > max_bytes:
+                    break
+                used += self._digest_bytes(key)
+                selected.append(key)
+                count += 1
+            self._cursor = start + count
+
+        return [(key, self.version(key)) for key in selected]
+
+    def digest_message(self, username: str, shop_location: str) -> bytes:
+        """Encode a ``gossip_digest`` datagram of at most ``self.max_bytes``."""
+        message = {
+            'type': 'gossip_digest',
+            'username': username,
+            'shop_location': shop_location,
+            'digest': [],
+        }
+        # The empty list's brackets are counted by both the envelope and the digest
+        message['digest'] = self.digest(self.max_bytes - len(json.dumps(message)) + 2)
+        return json.dumps(message).encode()
+
+    def compare(self, digest: Iterable) -> Tuple[List[dict], List[str]]:
+        """Compare a peer's digest with ours.
+
+        Returns our entries that are newer than the peer's and the keys
+        where the peer's are newer.
+        """
+        newer = []
+        wanted = []
+        for key, version in digest:
+            ours = self.version(key)
+            if ours > version:
+                newer.append(self.entries[key])
+            elif ours < version:
+                wanted.append(key)
+        return newer, wanted
+
+    def get_entries(self, keys: Iterable[str]) -> List[dict]:
+        """Get our entries for the given keys, skipping unknown ones."""
+        return [self.entries[key] for key in keys if key in self.entries]
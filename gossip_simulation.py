@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Simulation of gossip-based presence dissemination.
+
+Builds a chain of N terminals that all know each other, changes the
+presence of some of them, and runs gossip rounds (digest, reply, requested
+entries, as NetworkManager sends them) until every terminal has every
+change. Reports the rounds needed, the bytes each terminal sent per
+round and the largest datagram, for increasing chain sizes. Rounds should
+grow with log N while the bytes per terminal stay flat and every datagram
+stays within the gossip byte budget; for contrast, the size a digest of
+the whole directory would have is shown too.
+
+Usage: python gossip_simulation.py [--nodes 16 64 256 1024] [--changes 1] [--loss 0.0]
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+
+from config import NETWORK_CONFIG
+from gossip import GossipDirectory, pack_deltas
+
+
+def _presence(index: int, version: int) -> dict:
+    """Build the presence entry of a simulated terminal."""
+    return {
+        'type': 'presence',
+        'username': f"terminal{index}",
+        'shop_location': f"Shop {index // 4}",
+        'ip_address': f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+        'port': NETWORK_CONFIG['discovery_port'] + 1,
+        'max_packet_size': NETWORK_CONFIG['max_audio_packet_size'],
+        'chunk_size': 1024,
+        'codecs': ['pcm16', 'ulaw'],
+        'version': version,
+        'timestamp': 0.0,
+    }
+
+
+def simulate(nodes: int, changes: int, fanout: int, max_bytes: int, loss: float,
+             rng: random.Random, max_rounds: int = 200) -> dict:
+    """Run gossip rounds until every terminal has every change."""
+    steady = [_presence(i, 1) for i in range(nodes)]
+    directories = []
+    for _ in range(nodes):
+        directory = GossipDirectory(max_bytes)
+        for entry in steady:
+            directory.update(entry)
+        directory._cursor = rng.randrange(nodes)
+        directories.append(directory)
+
+    # Some terminals restart or change their audio limits at once
+    changed = rng.sample(range(nodes), changes)
+    for index in changed:
+        directories[index].update(_presence(index, 2))
+    changed_keys = [f"terminal{i}@Shop {i // 4}" for i in changed]
+
+    def converged() -> bool:
+        return all(directory.version(key) == 2 for directory in directories for key in changed_keys)
+
+    sent = [0] * nodes
+    largest = 0
+    rounds = 0
+
+    def send(datagrams: list) -> int:
+        nonlocal largest
+        largest = max([largest] + [len(data) for data in datagrams])
+        return sum(len(data) for data in datagrams)
+
+    while not converged() and rounds < max_rounds:
+        rounds += 1
+        for a in rng.sample(range(nodes), nodes):
+            peers = rng.sample(range(nodes - 1), fanout)
+            for b in (peer if peer < a else peer + 1 for peer in peers):
+                message = directories[a].digest_message(f"terminal{a}", f"Shop {a // 4}")
+                sent[a] += send([message])
+                if rng.random() < loss:
+                    continue
+
+                newer, wanted = directories[b].compare(json.loads(message)['digest'])
+                sent[b] += send(pack_deltas(newer, wanted, max_bytes))
+                if rng.random() < loss:
+                    continue
+                for entry in newer:
+                    directories[a].update(entry)
+
+                requested = directories[a].get_entries(wanted)
+                sent[a] += send(pack_deltas(requested, [], max_bytes))
+                if rng.random() < loss:
+                    continue
+                for entry in requested:
+                    directories[b].update(entry)
+
+    return {
+        'rounds': rounds if converged() else None,
+        'bytes_per_node_round': sum(sent) / nodes / max(rounds, 1),
+        'max_bytes_per_node_round': max(sent) / max(rounds, 1),
+        'largest_datagram': largest,
+        'full_digest_bytes': len(json.dumps([[key, 1] for key in directories[0].entries])),
+    }
+
+
+def main():
+    """Simulate gossip for each chain size and print the results."""
+    parser = argparse.ArgumentParser(description="Simulate gossip presence dissemination")
+    parser.add_argument('--nodes', type=int, nargs='+', default=[16, 64, 256, 1024])
+    parser.add_argument('--changes', type=int, default=1, help="terminals whose presence changes")
+    parser.add_argument('--loss', type=float, default=0.0, help="datagram loss probability")
+    parser.add_argument('--runs', type=int, default=3, help="runs averaged per chain size")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    fanout = NETWORK_CONFIG['gossip_fanout']
+    max_bytes = NETWORK_CONFIG['gossip_max_bytes']
+    rng = random.Random(args.seed)
+
+    print("Tradelink Intercom gossip simulation")
+    print("=" * 50)
+    print(f"Fanout {fanout}, datagrams up to {max_bytes} bytes, {args.changes} change(s), "
+          f"{args.loss:.0%} loss, {args.runs} run(s) per size\n")
+    print(f"{'nodes':>6} {'rounds':>7} {'log2 N':>7} {'bytes/node/round':>17} "
+          f"{'max':>7} {'largest':>8} {'full digest':>12}")
+
+    failed = False
+    for nodes in args.nodes:
+        results = [
+            simulate(nodes, min(args.changes, nodes), fanout, max_bytes, args.loss, rng)
+            for _ in range(args.runs)
+        ]
+        if any(result['rounds'] is None for result in results):
+            print(f"{nodes:>6} {'✗ did not converge':>30}")
+            failed = True
+            continue
+
+        rounds = sum(result['rounds'] for result in results) / len(results)
+        average = sum(result['bytes_per_node_round'] for result in results) / len(results)
+        peak = max(result['max_bytes_per_node_round'] for result in results)
+        largest = max(result['largest_datagram'] for result in results)
+        print(f"{nodes:>6} {rounds:7.1f} {math.log2(nodes):7.1f} {average:17.0f} "
+              f"{peak:7.0f} {largest:8} {results[0]['full_digest_bytes']:12}")
+        if largest > max_bytes:
+            print(f"{'':>6} ✗ a datagram exceeded {max_bytes} bytes")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
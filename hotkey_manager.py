@@ -1,15 +1,17 @@
 import keyboard
 import threading
-import time
 from typing import Optional, Callable
 import win32api
 import win32con
 import win32gui
 
+from clock import Clock, system_clock
+
 class HotkeyManager:
     """Manages global hotkeys for the intercom system."""
     
-    def __init__(self):
+    def __init__(self, clock: Optional[Clock] = None):
+        self.clock = clock or system_clock
         self.is_listening = False
         self.listening_thread: Optional[threading.Thread] = None
         
@@ -195,9 +197,9 @@ class HotkeyManager:
             
     def _test_hotkey_sequence(self):
         """Test sequence for hotkey functionality."""
-        time.sleep(0.1)
+        self.clock.sleep(0.1)
         self._handle_f5_press()
-        time.sleep(0.1)
+        self.clock.sleep(0.1)
         self._handle_f5_release()
         
     def cleanup(self):
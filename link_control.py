@@ -0,0 +1,164 @@
+"""
+Receiver statistics and sender-side rate control for the intercom link.
+
+Receivers keep RTCP-style statistics for every sender and report them over
+the control socket. Senders feed those reports, along with ping/pong round
+trip times, into a per-peer controller that picks the codec, maximum frame
+duration and forward error correction to use for that peer.
+"""
+
+from typing import Optional
+
+
+class ReceiverStats:
+    """Tracks loss, jitter and sequence numbers for one incoming audio stream."""
+
+    # A sequence number this far behind the highest one means the sender restarted
+    RESTART_GAP = 1000
+
+    def __init__(self):
+        self.base_seq: Optional[int] = None
+        self.highest_seq: Optional[int] = None
+        self.received = 0
+        self.jitter = 0.0  # seconds
+        self.last_packet_time = 0.0
+
+        # State at the previous report, for interval loss fraction
+        self._expected_prior = 0
+        self._received_prior = 0
+        self._last_transit: Optional[float] = None
+
+    def on_packet(self, sequence_number: int, sent_at: float, arrived_at: float):
+        """Record the arrival of a packet."""
+        if self.highest_seq is not None and sequence_number < self.highest_seq - self.RESTART_GAP:
+            # The sender restarted and its sequence numbers started over
+            self.__init__()
+
+        if self.base_seq is None:
+            self.base_seq = sequence_number
+            self.highest_seq = sequence_number
+        elif sequence_number > self.highest_seq:
+            self.highest_seq = sequence_number
+
+        self.received += 1
+        self.last_packet_time = arrived_at
+
+        # Interarrival jitter estimate from RFC 3550, section 6.4.1
+        transit = arrived_at - sent_at
+        if self._last_transit is not None:
+            delta = abs(transit - self._last_transit)
+            self.jitter += (delta - self.jitter) / 16.0
+        self._last_transit = transit
+
+    @property
+    def expected(self) -> int:
+        """Number of packets expected from the first to the highest sequence number."""
+        if self.base_seq is None:
+            return 0
+        return self.highest_seq - self.base_seq + 1
+
+    @property
+    def cumulative_lost(self) -> int:
+        """Number of packets lost since the stream started."""
+        return max(0, self.expected - self.received)
+
+    def make_report(self) -> dict:
+        """Build a receiver report and start a new reporting interval."""
+        expected_interval = self.expected - self._expected_prior
+        received_interval = self.received - self._received_prior
+        self._expected_prior = self.expected
+        self._received_prior = self.received
+
+        lost_interval = expected_interval - received_interval
+        if expected_interval <= 0 or lost_interval <= 0:
+            loss_fraction = 0.0
+        else:
+            loss_fraction = lost_interval / expected_interval
+
+        return {
+            'loss_fraction': round(loss_fraction, 4),
+            'cumulative_lost': self.cumulative_lost,
+            'highest_seq': self.highest_seq,
+            'jitter_ms': round(self.jitter * 1000.0, 2),
+        }
+
+
+class LinkController:
+    """Chooses per-peer audio settings from receiver reports and round trip times.
+
+    The controller moves between three levels:
+
+    0. the configured codec with frames of up to 20 ms on a clean link
+    1. ``ulaw`` with up to 40 ms frames to halve the bitrate and packet rate
+    2. ``ulaw`` with redundant frames (FEC) to ride out heavy loss
+
+    It steps down as soon as a report shows trouble and steps back up only
+    after several consecutive clean reports, so it does not oscillate.
+    """
+
+    def __init__(self, codec: str = 'pcm16', loss_threshold: float = 0.02, heavy_loss_threshold: float = 0.10,
+                 rtt_threshold: float = 0.25, jitter_threshold_ms: float = 30.0,
+                 recovery_reports: int = 5):
+        self.loss_threshold = loss_threshold
+        self.heavy_loss_threshold = heavy_loss_threshold
+        self.rtt_threshold = rtt_threshold
+        self.jitter_threshold_ms = jitter_threshold_ms
+        self.recovery_reports = recovery_reports
+
+        self.levels = (
+            {'codec': codec, 'max_frame_ms': 20, 'fec': False},
+            {'codec': 'ulaw', 'max_frame_ms': 40, 'fec': False},
+            {'codec': 'ulaw', 'max_frame_ms': 40, 'fec': True},
+        )
+
+        self.level = 0
+        self.rtt: Optional[float] = None
+        self.last_report: Optional[dict] = None
+        self._clean_reports = 0
+
+    @property
+    def settings(self) -> dict:
+        """Current codec, maximum frame duration and FEC setting."""
+        return self.levels[self.level]
+
+    def on_rtt(self, rtt: float):
+        """Record a round trip time measurement (seconds), smoothed."""
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt += (rtt - self.rtt) / 8.0
+
+    def on_report(self, report: dict) -> bool:
+        """Update the level from a receiver report.
+
+        Returns True if the peer's settings changed.
+        """
+        self.last_report = report
+        loss = report.get('loss_fraction', 0.0)
+        congested = (
+            report.get('jitter_ms', 0.0) > self.jitter_threshold_ms
+            or (self.rtt is not None and self.rtt > self.rtt_threshold)
+        )
+
+        if loss >= self.heavy_loss_threshold:
+            target = 2
+        elif loss >= self.loss_threshold or congested:
+            target = 1
+        else:
+            target = 0
+
+        if target > self.level:
+            self.level = target
+            self._clean_reports = 0
+            return True
+
+        if target < self.level:
+            self._clean_reports += 1
+            if self._clean_reports >= self.recovery_reports:
+                self.level -= 1
+                self._clean_reports = 0
+                return True
+        else:
+            self._clean_reports = 0
+
+        return False
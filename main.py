@@ -8,34 +8,59 @@ A high-quality, push-to-talk intercom system for shop-to-shop communication.
 import sys
 import os
 import time
+import collections
 import threading
+import multiprocessing
+from typing import TYPE_CHECKING, Deque, Optional
+
+# Enable the startup profiler before anything heavy is imported
+from startup_profiler import profiler
+if '--profile-startup' in sys.argv:
+    profiler.enable()
+
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import QTimer, QThread, pyqtSignal, pyqtSlot
 
-# Import our custom modules
+# Import our custom modules. The audio, network and hotkey managers (and with
+# them numpy, pyaudio, keyboard and win32) are imported by the startup worker
+# threads, after the window is already on screen.
 from main_window import MainWindow
-from audio_manager import AudioManager
-from network_manager import NetworkManager, User
-from hotkey_manager import HotkeyManager
+from ui_bridge import UIEventBridge
+from config import AUDIO_CONFIG, UI_CONFIG, PERFORMANCE_CONFIG
+
+if TYPE_CHECKING:
+    from network_manager import User, TalkSpurt, VoiceMessage
 
 class IntercomController:
     """Main controller that coordinates all intercom system components."""
     
     def __init__(self):
-        self.app = QApplication(sys.argv)
+        with profiler.span("QApplication"):
+            self.app = QApplication(sys.argv)
         self.app.setApplicationName("Tradelink Intercom")
         self.app.setApplicationVersion("1.0.0")
         
         # Initialize components
-        self.main_window = MainWindow()
+        with profiler.span("MainWindow"):
+            self.main_window = MainWindow()
+        self.ui_bridge = UIEventBridge(
+            self.main_window.show_notification,
+            interval_ms=UI_CONFIG['ui_frame_interval'],
+            notification_interval=UI_CONFIG['notification_rate_limit']
+        )
         self.audio_manager = None
         self.network_manager = None
         self.hotkey_manager = None
+        self.engine = None  # audio and network in a child process, if enabled
         
         # State
         self.is_initialized = False
         self.current_target_user = None
         
+        # Push-to-talk latency: key press to first audio frame handed to the network
+        self.ptt_pressed_at: Optional[float] = None
+        self.ptt_latencies: Deque[float] = collections.deque(maxlen=1000)  # most recent presses
+        
         # Timers
         self.audio_level_timer = QTimer()
         self.audio_level_timer.timeout.connect(self.update_audio_levels)
@@ -48,116 +73,283 @@ class IntercomController:
         """Setup signal connections between components."""
         # Main window signals
         self.main_window.audio_level_updated.connect(self.audio_manager.get_audio_levels if self.audio_manager else lambda: 0.0)
+        self.main_window.replay_requested.connect(self.on_replay_requested)
+        self.main_window.set_replay_available(AUDIO_CONFIG['call_recording'])
         
     def initialize_system(self):
-        """Initialize the intercom system components."""
-        try:
-            print("Initializing Tradelink Intercom System...")
-            
-            # Initialize audio manager
-            self.audio_manager = AudioManager()
-            print("Audio manager initialized")
-            
-            # Initialize network manager
-            self.network_manager = NetworkManager(
-                username=self.main_window.username,
-                shop_location=self.main_window.shop_location
-            )
-            
-            # Set network callbacks
-            self.network_manager.on_user_discovered = self.on_user_discovered
-            self.network_manager.on_user_offline = self.on_user_offline
-            self.network_manager.on_audio_received = self.on_audio_received
-            
-            print("Network manager initialized")
-            
-            # Initialize hotkey manager
-            self.hotkey_manager = HotkeyManager()
-            self.hotkey_manager.set_push_to_talk_callbacks(
-                self.on_push_to_talk_start,
-                self.on_push_to_talk_stop
+        """Initialize the intercom system components.
+        
+        Audio device enumeration, network address lookup and hotkey
+        registration can each take a noticeable time, so every subsystem
+        starts on its own worker thread and reports back to the GUI thread
+        when ready. The window stays responsive and startup takes as long
+        as the slowest subsystem.
+        """
+        print("Initializing Tradelink Intercom System...")
+        profiler.mark("event loop running, window shown")
+        self.main_window.update_status("Starting...")
+        
+        self.startup_started_at = time.perf_counter()
+        self.subsystem_timings = {}
+        
+        if PERFORMANCE_CONFIG['audio_engine_process']:
+            subsystems = (('engine', self.start_engine),
+                          ('hotkey', self.start_hotkeys))
+        else:
+            subsystems = (('audio', self.start_audio),
+                          ('network', self.start_network),
+                          ('hotkey', self.start_hotkeys))
+        self.pending_subsystems = {name for name, _ in subsystems}
+        
+        for name, start in subsystems:
+            thread = threading.Thread(
+                target=self._run_subsystem_startup,
+                args=(name, start),
+                name=f"startup-{name}",
+                daemon=True
             )
+            thread.start()
             
-            print("Hotkey manager initialized")
-            
-            # Start components
-            self.start_components()
+    def _run_subsystem_startup(self, name: str, start):
+        """Start one subsystem on a worker thread and report the result to the GUI thread."""
+        started_at = time.perf_counter()
+        
+        try:
+            with profiler.span(f"start {name}"):
+                start()
+        except Exception as e:
+            print(f"Error starting {name}: {e}")
+            self.ui_bridge.post_update(f"startup-{name}", self.on_subsystem_failed, name, str(e))
+            return
             
-            self.is_initialized = True
-            print("System initialization complete!")
+        elapsed = time.perf_counter() - started_at
+        self.ui_bridge.post_update(f"startup-{name}", self.on_subsystem_ready, name, elapsed)
+        
+    def start_audio(self):
+        """Create the audio manager and warm up the input stream."""
+        from audio_manager import AudioManager
+        
+        audio_manager = AudioManager(
+            sample_rate=AUDIO_CONFIG['sample_rate'],
+            chunk_size=AUDIO_CONFIG['chunk_size']
+        )
+        if AUDIO_CONFIG['preroll_ms'] > 0:
+            audio_manager.start_monitoring(AUDIO_CONFIG['preroll_ms'])
             
-        except Exception as e:
-            print(f"Error initializing system: {e}")
-            self.show_error_dialog("Initialization Error", str(e))
+        self.audio_manager = audio_manager
+        
+    def start_network(self):
+        """Create and start the network manager."""
+        from network_manager import NetworkManager
+        
+        network_manager = NetworkManager(
+            username=self.main_window.username,
+            shop_location=self.main_window.shop_location
+        )
+        
+        # Set network callbacks
+        network_manager.on_user_discovered = self.on_user_discovered
+        network_manager.on_user_offline = self.on_user_offline
+        network_manager.on_directory_changed = self.on_directory_changed
+        network_manager.on_audio_received = self.on_audio_received
+        network_manager.on_spurt_start = self.on_spurt_start
+        network_manager.on_spurt_end = self.on_spurt_end
+        network_manager.on_voice_message = self.on_voice_message
+        
+        self.network_manager = network_manager
+        network_manager.start()
+        
+    def start_engine(self):
+        """Start the audio and network engine in a child process."""
+        from audio_engine import AudioEngineClient
+        
+        engine = AudioEngineClient(
+            username=self.main_window.username,
+            shop_location=self.main_window.shop_location
+        )
+        
+        # Set engine callbacks
+        engine.on_user_discovered = self.on_user_discovered
+        engine.on_user_offline = self.on_user_offline
+        engine.on_directory_changed = self.on_directory_changed
+        engine.on_spurt_start = self.on_spurt_start
+        engine.on_spurt_end = self.on_spurt_end
+        engine.on_voice_message = self.on_voice_message
+        
+        engine.start()
+        self.engine = engine
+        
+    def start_hotkeys(self):
+        """Create the hotkey manager and start listening."""
+        from hotkey_manager import HotkeyManager
+        
+        hotkey_manager = HotkeyManager()
+        hotkey_manager.set_push_to_talk_callbacks(
+            self.on_push_to_talk_start,
+            self.on_push_to_talk_stop
+        )
+        hotkey_manager.start_listening()
+        
+        self.hotkey_manager = hotkey_manager
+        
+    def on_subsystem_ready(self, name: str, elapsed: float):
+        """Handle a subsystem finishing startup (GUI thread)."""
+        self.subsystem_timings[name] = elapsed
+        self.pending_subsystems.discard(name)
+        print(f"{name.capitalize()} manager initialized in {elapsed * 1000:.0f} ms")
+        
+        if name == 'network':
+            self.main_window.update_status("Connected", self.network_manager.running)
+        elif name == 'engine':
+            self.main_window.update_status("Connected", self.engine.running)
             
-    def start_components(self):
-        """Start all system components."""
-        try:
-            # Start network manager
-            self.network_manager.start()
-            self.main_window.update_status("Connected", True)
+        if not self.pending_subsystems:
+            self.on_startup_complete()
             
-            # Start hotkey manager
-            self.hotkey_manager.start_listening()
+    def on_subsystem_failed(self, name: str, error: str):
+        """Handle a subsystem that failed to start (GUI thread)."""
+        self.pending_subsystems.discard(name)
+        self.show_error_dialog("Initialization Error", f"{name.capitalize()} failed to start: {error}")
+        
+        if not self.pending_subsystems:
+            self.on_startup_complete()
             
-            # Start audio level monitoring
-            self.audio_level_timer.start()
+    def on_startup_complete(self):
+        """Handle every subsystem having finished startup (GUI thread)."""
+        total = time.perf_counter() - self.startup_started_at
+        self.is_initialized = True
+        
+        if self.subsystem_timings:
+            slowest = max(self.subsystem_timings, key=self.subsystem_timings.get)
+            print(f"System initialization complete in {total * 1000:.0f} ms "
+                  f"(slowest: {slowest}, {self.subsystem_timings[slowest] * 1000:.0f} ms)")
+        else:
+            print("System initialization failed")
             
-            print("All components started successfully")
+        # Capture and playout threads tune themselves once audio flows, so report a little later
+        if PERFORMANCE_CONFIG['low_latency_mode'] and not self.engine:
+            QTimer.singleShot(2000, self.print_realtime_report)
             
-        except Exception as e:
-            print(f"Error starting components: {e}")
-            self.show_error_dialog("Startup Error", str(e))
+        if profiler.enabled:
+            profiler.mark("all subsystems ready")
+            profiler.write_report('startup_profile.txt')
+            profiler.disable()
             
-    def on_user_discovered(self, user: User):
+    def print_realtime_report(self):
+        """Print which low-latency settings took effect."""
+        import realtime
+        print(realtime.diagnostics.report())
+        
+    def on_user_discovered(self, user: 'User'):
         """Handle new user discovery."""
         print(f"User discovered: {user.username} at {user.shop_location}")
         
         # Update UI on main thread
-        self.main_window.update_users_list(self.network_manager.get_online_users())
+        self.ui_bridge.post_update('users', self.refresh_users_list)
         
         # Show notification
-        self.main_window.show_notification(
+        self.ui_bridge.post_notification(
+            f"{user.username}@{user.shop_location}",
             "New User Online",
             f"{user.username} at {user.shop_location} is now available"
         )
         
-    def on_user_offline(self, user: User):
+    def on_user_offline(self, user: 'User'):
         """Handle user going offline."""
         print(f"User offline: {user.username} at {user.shop_location}")
         
         # Update UI on main thread
-        self.main_window.update_users_list(self.network_manager.get_online_users())
+        self.ui_bridge.post_update('users', self.refresh_users_list)
         
         # Show notification
-        self.main_window.show_notification(
+        self.ui_bridge.post_notification(
+            f"{user.username}@{user.shop_location}",
             "User Offline",
             f"{user.username} at {user.shop_location} is no longer available"
         )
         
-    def on_audio_received(self, audio_packet):
-        """Handle received audio data."""
-        print(f"Audio received from {audio_packet.sender}")
+    def on_directory_changed(self):
+        """Handle cached peers being listed, confirmed or timing out."""
+        self.ui_bridge.post_update('users', self.refresh_users_list)
         
-        # Play the audio
-        if self.audio_manager:
-            self.audio_manager.play_audio(audio_packet.audio_data)
+    def refresh_users_list(self):
+        """Show the current online users (GUI thread)."""
+        source = self.network_manager or self.engine
+        if source:
+            self.main_window.update_users_list(source.get_online_users())
             
+    def on_spurt_start(self, spurt: 'TalkSpurt'):
+        """Handle the start of an incoming transmission."""
+        print(f"Audio from {spurt.sender} at {spurt.sender_shop} (session {spurt.session_id}, {spurt.codec})")
+        
         # Show notification
-        self.main_window.show_notification(
+        self.ui_bridge.post_notification(
+            f"{spurt.sender}@{spurt.sender_shop}",
             "Incoming Call",
-            f"Audio from {audio_packet.sender} at {audio_packet.sender_shop}"
+            f"Audio from {spurt.sender} at {spurt.sender_shop}"
+        )
+        
+    def on_spurt_end(self, spurt: 'TalkSpurt'):
+        """Handle the end of an incoming transmission."""
+        print(f"Audio from {spurt.sender} ended after {time.time() - spurt.started_at:.1f}s")
+        
+        # Free the sender's playout queue once it has played out
+        if self.audio_manager:
+            self.audio_manager.release_source(f"{spurt.sender}@{spurt.sender_shop}")
+            
+    def on_voice_message(self, message: 'VoiceMessage'):
+        """Play a voice message left while we were offline."""
+        # In engine mode the engine plays it; the message carries no audio here
+        if self.audio_manager and message.audio_data:
+            self.audio_manager.play_message(message.audio_data, f"{message.sender}@{message.sender_shop}")
+            
+        self.ui_bridge.post_notification(
+            f"{message.sender}@{message.sender_shop}",
+            "Voice Message",
+            f"Message from {message.sender} at {message.sender_shop}, left at "
+            f"{time.strftime('%H:%M', time.localtime(message.timestamp))}"
         )
         
+    def on_audio_received(self, audio_packet):
+        """Handle received audio data."""
+        # Queue the audio for playback
+        if self.audio_manager:
+            self.audio_manager.play_audio(
+                audio_packet.audio_data,
+                f"{audio_packet.sender}@{audio_packet.sender_shop}"
+            )
+            
+    def on_replay_requested(self):
+        """Play the last recorded incoming message again (GUI thread)."""
+        source = self.engine or self.audio_manager
+        message = source.replay_last_message() if source else None
+        
+        if message:
+            self.main_window.ptt_status.setText(
+                f"Replaying message from {message.sender} at {message.sender_shop} "
+                f"({time.strftime('%H:%M:%S', time.localtime(message.timestamp))})"
+            )
+        else:
+            self.main_window.ptt_status.setText("No message to replay")
+            
     def on_push_to_talk_start(self):
         """Handle push-to-talk activation."""
         print("Push-to-Talk activated")
         
         # Update UI
-        self.main_window.set_ptt_active(True)
+        self.ui_bridge.post_update('ptt', self.main_window.set_ptt_active, True)
         
+        # In engine mode, capture and sending happen in the engine process
+        if self.engine and self.current_target_user:
+            self.engine.start_transmit(
+                self.current_target_user['username'],
+                self.current_target_user['shop_location']
+            )
+            return
+            
         # Start audio recording
         if self.audio_manager and self.current_target_user:
+            self.ptt_pressed_at = time.perf_counter()
             self.audio_manager.start_recording(self.on_audio_data_ready)
             
     def on_push_to_talk_stop(self):
@@ -165,14 +357,31 @@ class IntercomController:
         print("Push-to-Talk deactivated")
         
         # Update UI
-        self.main_window.set_ptt_active(False)
+        self.ui_bridge.post_update('ptt', self.main_window.set_ptt_active, False)
         
+        if self.engine:
+            self.engine.stop_transmit()
+            return
+            
         # Stop audio recording
         if self.audio_manager:
             self.audio_manager.stop_recording()
             
+        # Send the final partial frame and end the transmission
+        if self.current_target_user and self.network_manager:
+            self.network_manager.end_talk_spurt(
+                target_user=self.current_target_user['username'],
+                target_shop=self.current_target_user['shop_location']
+            )
+            
     def on_audio_data_ready(self, audio_data: bytes):
         """Handle audio data ready for transmission."""
+        if self.ptt_pressed_at is not None:
+            latency = time.perf_counter() - self.ptt_pressed_at
+            self.ptt_pressed_at = None
+            self.ptt_latencies.append(latency)
+            print(f"Push-to-Talk latency: {latency * 1000:.1f} ms to first frame")
+            
         if self.current_target_user and self.network_manager:
             # Send audio to target user
             self.network_manager.send_audio(
@@ -183,8 +392,9 @@ class IntercomController:
             
     def update_audio_levels(self):
         """Update audio level display."""
-        if self.audio_manager:
-            level = self.audio_manager.get_audio_levels()
+        source = self.audio_manager or self.engine
+        if source:
+            level = source.get_audio_levels()
             self.main_window.update_audio_level(level)
             
     def set_target_user(self, username: str, shop_location: str):
@@ -210,6 +420,9 @@ class IntercomController:
         if self.network_manager:
             self.network_manager.cleanup()
             
+        if self.engine:
+            self.engine.cleanup()
+            
         if self.hotkey_manager:
             self.hotkey_manager.cleanup()
             
@@ -222,7 +435,7 @@ class IntercomController:
             self.main_window.show()
             
             # Initialize system after window is shown
-            QTimer.singleShot(100, self.initialize_system)
+            QTimer.singleShot(0, self.initialize_system)
             
             # Run the application
             return self.app.exec()
@@ -246,4 +459,6 @@ def main():
         return 1
 
 if __name__ == "__main__":
+    # The audio engine process re-runs this module in the packaged executable
+    multiprocessing.freeze_support()
     sys.exit(main())
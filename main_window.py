@@ -2,11 +2,11 @@ import sys
 import os
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QComboBox, 
-                             QTextEdit, QSystemTrayIcon, QMenu, QAction, 
+                             QTextEdit, QSystemTrayIcon, QMenu,
                              QMessageBox, QFrame, QProgressBar, QGroupBox,
                              QLineEdit, QDialog, QDialogButtonBox, QFormLayout)
 from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QThread, pyqtSlot
-from PyQt6.QtGui import QIcon, QFont, QPixmap, QPainter, QColor
+from PyQt6.QtGui import QIcon, QFont, QPixmap, QPainter, QColor, QAction
 import json
 
 class SetupDialog(QDialog):
@@ -87,6 +87,7 @@ class MainWindow(QMainWindow):
     # Signals
     audio_level_updated = pyqtSignal(float)
     user_list_updated = pyqtSignal(list)
+    replay_requested = pyqtSignal()
     
     def __init__(self):
         super().__init__()
@@ -100,6 +101,7 @@ class MainWindow(QMainWindow):
         # State
         self.is_minimized = False
         self.current_target_user = None
+        self.displayed_users: list = []
         
         # Load settings
         self.load_settings()
@@ -199,6 +201,11 @@ class MainWindow(QMainWindow):
         # Control buttons
         button_layout = QHBoxLayout()
         
+        self.replay_button = QPushButton("Replay Last Message")
+        self.replay_button.clicked.connect(self.replay_requested.emit)
+        self.replay_button.setVisible(False)
+        button_layout.addWidget(self.replay_button)
+        
         self.minimize_button = QPushButton("Minimize to Tray")
         self.minimize_button.clicked.connect(self.minimize_to_tray)
         button_layout.addWidget(self.minimize_button)
@@ -288,14 +295,33 @@ class MainWindow(QMainWindow):
         
     def update_users_list(self, users: list):
         """Update the list of online users."""
+        entries = [(user.username, user.shop_location, user.confirmed) for user in users]
+        if entries == self.displayed_users:
+            return
+        self.displayed_users = entries
+        
+        # Rebuild without firing selection changes, then restore the selection
+        selected = self.users_combo.currentText()
+        self.users_combo.blockSignals(True)
         self.users_combo.clear()
         self.users_combo.addItem("Select a user to call...")
         
-        self.users_text.clear()
+        for username, shop_location, _ in entries:
+            self.users_combo.addItem(f"{username} ({shop_location})")
+            
+        index = self.users_combo.findText(selected)
+        self.users_combo.setCurrentIndex(max(0, index))
+        self.users_combo.blockSignals(False)
         
-        for user in users:
-            self.users_combo.addItem(f"{user.username} ({user.shop_location})")
-            self.users_text.append(f"• {user.username} at {user.shop_location}")
+        if index < 0:
+            self.on_user_selected(self.users_combo.currentText())
+            
+        self.users_text.setPlainText(
+            "\n".join(
+                f"• {username} at {shop_location}" + ("" if confirmed else " (likely online)")
+                for username, shop_location, confirmed in entries
+            )
+        )
             
     def on_user_selected(self, text: str):
         """Handle user selection from combo box."""
@@ -314,6 +340,10 @@ class MainWindow(QMainWindow):
                 self.ptt_status.setText("Press Fn+F5 to talk")
                 self.ptt_button.setEnabled(True)
                 
+    def set_replay_available(self, available: bool):
+        """Show the replay button when incoming messages are being recorded."""
+        self.replay_button.setVisible(available)
+        
     def toggle_ptt(self):
         """Toggle push-to-talk manually (for testing)."""
         # This will be connected to the hotkey manager
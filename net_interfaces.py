@@ -0,0 +1,107 @@
+"""
+Network interface discovery for the intercom system.
+
+Finds every IPv4 interface that is up and computes its directed broadcast
+address without needing a route to the internet, so presence reaches every
+LAN the machine is attached to. Results are cached and refreshed
+periodically, and callers are told when the set of interfaces changes.
+"""
+
+import ipaddress
+import socket
+from dataclasses import dataclass
+from typing import List, Optional
+
+from clock import Clock, system_clock
+
+
+@dataclass(frozen=True)
+class Interface:
+    """An IPv4 address on an interface that is up."""
+    name: str
+    address: str
+    netmask: str
+    broadcast: str
+
+
+def _is_usable(address: str) -> bool:
+    """Check whether an address can reach other machines on the LAN."""
+    ip = ipaddress.IPv4Address(address)
+    return not (ip.is_loopback or ip.is_link_local or ip.is_unspecified)
+
+
+def _make_interface(name: str, address: str, netmask: str) -> Interface:
+    """Build an interface entry, computing its directed broadcast address."""
+    network = ipaddress.IPv4Network(f"{address}/{netmask}", strict=False)
+    return Interface(name, address, str(network.netmask), str(network.broadcast_address))
+
+
+def enumerate_interfaces() -> List[Interface]:
+    """List the usable IPv4 interfaces that are up, most likely LAN first."""
+    interfaces = []
+
+    try:
+        import psutil
+
+        stats = psutil.net_if_stats()
+        for name, addresses in psutil.net_if_addrs().items():
+            if name in stats and not stats[name].isup:
+                continue
+            for address in addresses:
+                if address.family != socket.AF_INET or not address.netmask:
+                    continue
+                if _is_usable(address.address):
+                    interfaces.append(_make_interface(name, address.address, address.netmask))
+
+    except ImportError:
+        # Without psutil, use the host's own addresses and assume /24 networks
+        try:
+            _, _, addresses = socket.gethostbyname_ex(socket.gethostname())
+        except OSError:
+            addresses = []
+        for address in addresses:
+            if _is_usable(address):
+                interfaces.append(_make_interface('host', address, '255.255.255.0'))
+
+    # Private (RFC 1918) addresses are the shop LANs; list them first
+    interfaces.sort(key=lambda interface: not ipaddress.IPv4Address(interface.address).is_private)
+    return interfaces
+
+
+class InterfaceCache:
+    """Cached interface list, refreshed at most once per ``refresh_interval``."""
+
+    def __init__(self, refresh_interval: float = 30.0, clock: Optional[Clock] = None):
+        self.refresh_interval = refresh_interval
+        self.clock = clock or system_clock
+        self.interfaces: List[Interface] = enumerate_interfaces()
+        self.last_refresh = self.clock.monotonic()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-enumerate interfaces if due. Returns True if they changed."""
+        now = self.clock.monotonic()
+        if not force and now - self.last_refresh < self.refresh_interval:
+            return False
+
+        self.last_refresh = now
+        interfaces = enumerate_interfaces()
+        if interfaces == self.interfaces:
+            return False
+
+        self.interfaces = interfaces
+        return True
+
+    @property
+    def primary_address(self) -> Optional[str]:
+        """The address most likely to be on the shop LAN, if any."""
+        return self.interfaces[0].address if self.interfaces else None
+
+    @property
+    def broadcast_addresses(self) -> List[str]:
+        """Directed broadcast address of every interface, without duplicates.
+
+        Falls back to the limited broadcast address when no interface is
+        known, which still reaches the local segment.
+        """
+        addresses = list(dict.fromkeys(interface.broadcast for interface in self.interfaces))
+        return addresses or ['255.255.255.255']
@@ -1,37 +1,125 @@
 import socket
+import select
+import selectors
 import threading
 import json
 import time
+import random
+import hmac
 from typing import Dict, List, Optional, Callable
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 
-@dataclass
-class User:
+from config import NETWORK_CONFIG, AUDIO_CONFIG, PERFORMANCE_CONFIG, SECURITY_CONFIG, SHOP_CONFIG
+import audio_protocol
+from audio_queue import AudioQueue
+from buffer_pool import BufferPool
+from clock import Clock, system_clock
+from link_control import ReceiverStats, LinkController
+from net_interfaces import InterfaceCache
+from packet_filter import PacketFilter, build_allowed_networks
+import packet_auth
+import peer_cache
+import realtime
+import packet_capture
+from gossip import GossipDirectory, entry_key, new_version, pack_deltas
+import voice_transfer
+from voice_spool import SpooledMessage, VoiceSpool
+
+class SlottedRecord:
+    """Base for small records kept without a per-instance __dict__.
+    
+    Subclasses list their fields in ``__slots__``. Equivalent to a dataclass
+    with ``slots=True``, which needs Python 3.10.
+    """
+    __slots__ = ()
+    
+    def to_dict(self) -> dict:
+        """Get the fields as a dict, e.g. to send to another process."""
+        return {name: getattr(self, name) for name in self.__slots__}
+        
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+        
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+class User(SlottedRecord):
     """Represents a user in the intercom system."""
-    username: str
-    shop_location: str
-    ip_address: str
-    port: int
-    last_seen: float
-    is_online: bool = True
+    __slots__ = ('username', 'shop_location', 'ip_address', 'port', 'last_seen', 'is_online',
+                 'max_packet_size', 'chunk_size', 'codecs', 'confirmed')
+    
+    def __init__(self, username: str, shop_location: str, ip_address: str, port: int,
+                 last_seen: float, is_online: bool = True,
+                 max_packet_size: int = NETWORK_CONFIG['max_audio_packet_size'],
+                 chunk_size: int = AUDIO_CONFIG['chunk_size'],
+                 codecs: Optional[List[str]] = None, confirmed: bool = True):
+        self.username = username
+        self.shop_location = shop_location
+        self.ip_address = ip_address
+        self.port = port
+        self.last_seen = last_seen
+        self.is_online = is_online
+        self.max_packet_size = max_packet_size
+        self.chunk_size = chunk_size
+        self.codecs = codecs if codecs is not None else ['pcm16']
+        self.confirmed = confirmed  # False while only known from the peer cache ("likely online")
+
+class AudioPacket(SlottedRecord):
+    """Represents an audio packet for transmission.
+    
+    Received audio_data is a view of a receive buffer, only valid during the
+    on_audio_received callback.
+    """
+    __slots__ = ('sender', 'sender_shop', 'timestamp', 'audio_data', 'sequence_number',
+                 'codec', 'session_id')
+    
+    def __init__(self, sender: str, sender_shop: str, timestamp: float, audio_data: bytes,
+                 sequence_number: int, codec: str = 'pcm16', session_id: int = 0):
+        self.sender = sender
+        self.sender_shop = sender_shop
+        self.timestamp = timestamp
+        self.audio_data = audio_data
+        self.sequence_number = sequence_number
+        self.codec = codec
+        self.session_id = session_id
+
+class VoiceMessage(SlottedRecord):
+    """A talk spurt recorded while we were offline, delivered when we came back."""
+    __slots__ = ('sender', 'sender_shop', 'timestamp', 'sample_rate', 'audio_data')
+    
+    def __init__(self, sender: str, sender_shop: str, timestamp: float, sample_rate: int, audio_data: bytes):
+        self.sender = sender
+        self.sender_shop = sender_shop
+        self.timestamp = timestamp
+        self.sample_rate = sample_rate
+        self.audio_data = audio_data
 
 @dataclass
-class AudioPacket:
-    """Represents an audio packet for transmission."""
+class TalkSpurt:
+    """Represents one push-to-talk transmission between a start and end marker."""
     sender: str
     sender_shop: str
-    timestamp: float
-    audio_data: bytes
-    sequence_number: int
+    session_id: int
+    codec: str
+    started_at: float
+    last_packet_time: float
 
 class NetworkManager:
     """Manages network communication between shops."""
     
-    def __init__(self, username: str, shop_location: str, port: int = 5000):
+    def __init__(self, username: str, shop_location: str, port: int = 5000, clock: Optional[Clock] = None):
         self.username = username
         self.shop_location = shop_location
         self.port = port
         
+        # Every timestamp, timeout and expiry reads this clock; simulations pass a VirtualClock
+        self.clock = clock or system_clock
+        
         # Network settings
         self.broadcast_port = 5001
         self.discovery_port = 5002
@@ -44,20 +132,140 @@ class NetworkManager:
         
         # User management
         self.users: Dict[str, User] = {}
+        self.user_prune_age = NETWORK_CONFIG['user_prune_age']
+        self._last_prune_time = self.clock.time()
+        self.presence_interval = NETWORK_CONFIG['presence_interval']
+        self.presence_timeout = SHOP_CONFIG['user_timeout']
+        self._last_presence_time = self.clock.time()
+        self.bind_address = NETWORK_CONFIG['bind_address']
+        self.interfaces = InterfaceCache(NETWORK_CONFIG['interface_refresh_interval'], self.clock)
         self.local_ip = self._get_local_ip()
         
+        # Source filtering, applied to every datagram before it is parsed
+        allowed = build_allowed_networks(
+            SECURITY_CONFIG['allowed_networks'],
+            SECURITY_CONFIG['block_external_access']
+        )
+        self.discovery_filter = PacketFilter(allowed, SECURITY_CONFIG['discovery_rate_limit'], clock=self.clock)
+        self.audio_filter = PacketFilter(allowed, SECURITY_CONFIG['audio_rate_limit'], clock=self.clock)
+        self.control_filter = PacketFilter(allowed, SECURITY_CONFIG['control_rate_limit'], clock=self.clock)
+        self.voice_filter = PacketFilter(allowed, SECURITY_CONFIG['voice_rate_limit'], clock=self.clock)
+        
+        # Audio authentication: one key per direction per peer, agreed on the control socket
+        self.auth_secret = SECURITY_CONFIG['shared_secret'].encode() or None
+        self.authenticate_audio = SECURITY_CONFIG['authenticate_audio']
+        if self.authenticate_audio and not self.auth_secret:
+            print("Audio authentication needs a shared secret; sending unauthenticated audio")
+            self.authenticate_audio = False
+        self.send_auth: Dict[str, packet_auth.PacketAuthenticator] = {}
+        self.receive_auth: Dict[str, packet_auth.PacketAuthenticator] = {}
+        self._pending_receive_auth: Dict[str, packet_auth.PacketAuthenticator] = {}
+        self._control_key = packet_auth.control_key(self.auth_secret) if self.auth_secret else None
+        self._key_offers: Dict[str, tuple] = {}  # user key -> (nonce, sent at)
+        self._key_rejects_sent: Dict[str, float] = {}
+        self._key_offer_versions: Dict[str, int] = {}  # user key -> version of the last key offer answered
+        self.auth_failures = 0
+        self.auth_replays = 0
+        
         # Callbacks
         self.on_user_discovered: Optional[Callable[[User], None]] = None
         self.on_user_offline: Optional[Callable[[User], None]] = None
         self.on_audio_received: Optional[Callable[[AudioPacket], None]] = None
+        self.on_spurt_start: Optional[Callable[[TalkSpurt], None]] = None
+        self.on_spurt_end: Optional[Callable[[TalkSpurt], None]] = None
+        self.on_directory_changed: Optional[Callable[[], None]] = None  # list changed, nothing to announce
+        self.on_voice_message: Optional[Callable[[VoiceMessage], None]] = None
+        
+        # Peers remembered from earlier runs
+        self.peer_cache_file = NETWORK_CONFIG['peer_cache_file']
+        self.peer_cache_max_age = NETWORK_CONFIG['peer_cache_max_age']
+        self.peer_probe_timeout = NETWORK_CONFIG['peer_probe_timeout']
+        self._peers_probed_at = 0.0
+        self._peer_cache_dirty = False
+        self._last_peer_cache_save = self.clock.time()
+        
+        # Versioned directory of presence and offline messages, swapped with peers in gossip mode
+        self.gossip_enabled = NETWORK_CONFIG['gossip_enabled']
+        self.gossip_interval = NETWORK_CONFIG['gossip_interval']
+        self.gossip_fanout = NETWORK_CONFIG['gossip_fanout']
+        self.gossip = GossipDirectory(NETWORK_CONFIG['gossip_max_bytes'])
+        self._presence_version = 0
+        self._last_gossip_time = 0.0
+        
+        # Voice messages: talk spurts to offline peers are spooled and sent when they return
+        self.voice_messages = NETWORK_CONFIG['voice_messages']
+        self.voice_spool: Optional[VoiceSpool] = None
+        self.voice_transfer_window = NETWORK_CONFIG['voice_transfer_window']
+        self.voice_transfer_rate = NETWORK_CONFIG['voice_transfer_rate']
+        self.voice_transfer_timeout = NETWORK_CONFIG['voice_transfer_timeout']
+        self.max_voice_message_bytes = NETWORK_CONFIG['voice_message_max_seconds'] * AUDIO_CONFIG['sample_rate']
+        self.outgoing_transfers: Dict[str, voice_transfer.OutgoingTransfer] = {}  # user key -> transfer
+        self._transfer_messages: Dict[str, SpooledMessage] = {}  # user key -> message being sent
+        self.incoming_transfers: Dict[tuple, voice_transfer.IncomingTransfer] = {}  # (ip, transfer id)
+        self._completed_transfers: Dict[tuple, tuple] = {}  # (ip, transfer id) -> (chunks, completed at)
+        self._voice_retry_at: Dict[str, float] = {}
+        self._last_voice_check = 0.0
         
         # Threads
         self.discovery_thread: Optional[threading.Thread] = None
         self.audio_thread: Optional[threading.Thread] = None
+        self.control_thread: Optional[threading.Thread] = None
+        self.sender_thread: Optional[threading.Thread] = None
+        self.io_thread: Optional[threading.Thread] = None
         self.running = False
         
-        # Audio sequence tracking
-        self.audio_sequence = 0
+        # Audio sequence numbers, one series per peer so each receiver sees its own without gaps
+        self.audio_sequences: Dict[str, int] = {}  # user key -> next sequence number
+        
+        # Received datagrams are read into pooled buffers and decoded in place
+        self.receive_pool = BufferPool(PERFORMANCE_CONFIG['receive_buffer_count'], 65536)
+        self._decode_buffer = bytearray(65536)
+        
+        # Audio framing limits, negotiated per peer from presence messages
+        self.sample_rate = AUDIO_CONFIG['sample_rate']
+        self.chunk_size = AUDIO_CONFIG['chunk_size']
+        self.max_audio_packet_size = NETWORK_CONFIG['max_audio_packet_size']
+        self.codec = AUDIO_CONFIG['codec']
+        self.packetizers: Dict[str, audio_protocol.Packetizer] = {}
+        self._stale_packetizers = set()
+        
+        # Outgoing audio: one bounded queue per peer, drained by the sender thread
+        self.send_queues: Dict[str, AudioQueue] = {}
+        self._flush_requests = set()
+        self._send_event = threading.Event()
+        self.send_wait_timeout = 0.05  # seconds a send waits for room in a full socket buffer
+        self.send_drops = 0
+        
+        # Selector mode: one thread waits on every socket and a wakeup socket pair
+        self.io_mode = PERFORMANCE_CONFIG['network_io_mode']
+        self.low_latency = PERFORMANCE_CONFIG['low_latency_mode']
+        
+        # Datagram capture for reproducing problems offline (see replay_capture.py)
+        self.capture_file = NETWORK_CONFIG['capture_file']
+        self.capture: Optional[packet_capture.PacketCapture] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wakeup_sockets: Optional[tuple] = None
+        
+        # Talk spurts we are sending and receiving
+        self.outgoing_spurts: Dict[str, TalkSpurt] = {}
+        self.incoming_spurts: Dict[str, TalkSpurt] = {}
+        self._ended_sessions: Dict[str, int] = {}
+        self._spurt_lock = threading.Lock()
+        self._next_session_id = random.randrange(0x10000)
+        self._end_marker_resends: List[list] = []  # [due time, message, address, remaining]
+        self.spurt_end_repeats = NETWORK_CONFIG['spurt_end_repeats']
+        self.spurt_end_interval = 0.02
+        self.spurt_timeout = NETWORK_CONFIG['spurt_timeout']
+        
+        # Link quality: stats for streams we receive, controllers for streams we send
+        self.receiver_stats: Dict[str, ReceiverStats] = {}
+        self.receiver_addresses: Dict[str, str] = {}
+        self.link_controllers: Dict[str, LinkController] = {}
+        self.adaptive_bitrate = NETWORK_CONFIG['adaptive_bitrate']
+        self.report_interval = NETWORK_CONFIG['report_interval']
+        self.ping_interval = NETWORK_CONFIG['ping_interval']
+        self._last_report_time = 0.0
+        self._last_ping_time = 0.0
         
     def start(self):
         """Start the network manager."""
@@ -70,27 +278,60 @@ class NetworkManager:
             # Create UDP socket for general communication
             self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.udp_socket.bind(('', self.port))
+            self.udp_socket.bind((self.bind_address, self.port))
             
             # Create discovery socket
             self.discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.discovery_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.discovery_socket.bind(('', self.discovery_port))
+            self.discovery_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self.discovery_socket.bind((self.bind_address, self.discovery_port))
             
             # Create audio socket
             self.audio_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.audio_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.audio_socket.bind(('', self.audio_port))
+            self.audio_socket.bind((self.bind_address, self.audio_port))
             
-            # Start discovery thread
-            self.discovery_thread = threading.Thread(target=self._discovery_worker, daemon=True)
-            self.discovery_thread.start()
+            if self.capture_file:
+                self.capture = packet_capture.PacketCapture(self.capture_file)
+                print(f"Capturing datagrams to {self.capture_file}")
+                
+            if self.voice_messages:
+                try:
+                    self.voice_spool = VoiceSpool(
+                        NETWORK_CONFIG['voice_spool_dir'],
+                        NETWORK_CONFIG['voice_spool_max_mb'] * 1024 * 1024,
+                        NETWORK_CONFIG['voice_message_max_age'],
+                        self.max_voice_message_bytes,
+                        self.clock
+                    )
+                except OSError as e:
+                    print(f"Error opening voice spool: {e}")
+                
+            if self.low_latency:
+                realtime.tune_socket(self.audio_socket, 'audio socket',
+                                     PERFORMANCE_CONFIG['socket_buffer_size'], PERFORMANCE_CONFIG['audio_tos'])
             
-            # Start audio thread
-            self.audio_thread = threading.Thread(target=self._audio_worker, daemon=True)
-            self.audio_thread.start()
+            if self.io_mode == 'selector':
+                self._start_selector()
+            else:
+                # Start discovery thread
+                self.discovery_thread = threading.Thread(target=self._discovery_worker, name='network-discovery', daemon=True)
+                self.discovery_thread.start()
+                
+                # Start audio thread
+                self.audio_thread = threading.Thread(target=self._audio_worker, name='network-audio', daemon=True)
+                self.audio_thread.start()
+                
+                # Start control thread
+                self.control_thread = threading.Thread(target=self._control_worker, name='network-control', daemon=True)
+                self.control_thread.start()
+                
+                # Start sender thread
+                self.sender_thread = threading.Thread(target=self._sender_worker, name='network-sender', daemon=True)
+                self.sender_thread.start()
             
-            # Broadcast presence
+            # List cached peers and probe them directly, then broadcast presence
+            self._load_peer_cache()
             self._broadcast_presence()
             
             print(f"Network manager started on port {self.port}")
@@ -101,66 +342,226 @@ class NetworkManager:
             
     def stop(self):
         """Stop the network manager."""
+        was_running = self.running
         self.running = False
+        self._wake_sender()
         
+        # The selector thread wakes at once, so wait for it rather than closing sockets under it
+        if self.io_thread and self.io_thread is not threading.current_thread():
+            self.io_thread.join(1.0)
+            
+        if was_running:
+            self._save_peer_cache()
+            
         if self.udp_socket:
             self.udp_socket.close()
         if self.discovery_socket:
             self.discovery_socket.close()
         if self.audio_socket:
             self.audio_socket.close()
+        if self._selector:
+            self._selector.close()
+            self._selector = None
+        if self._wakeup_sockets:
+            for wakeup_socket in self._wakeup_sockets:
+                wakeup_socket.close()
+            self._wakeup_sockets = None
+        if self.capture:
+            self.capture.close()
+            print(f"Captured {self.capture.recorded} datagrams ({self.capture.dropped} dropped)")
+            self.capture = None
             
         print("Network manager stopped")
         
     def _get_local_ip(self) -> str:
-        """Get the local IP address."""
-        try:
-            # Create a socket to get local IP
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            return local_ip
-        except:
-            return "127.0.0.1"
+        """Get the local IP address from the interface list, without needing internet access."""
+        return self.interfaces.primary_address or "127.0.0.1"
+        
+    def _refresh_interfaces(self):
+        """Re-enumerate interfaces if due, and announce ourselves on any new network."""
+        if self.interfaces.refresh():
+            self.local_ip = self._get_local_ip()
+            print(f"Network interfaces changed: {[i.address for i in self.interfaces.interfaces]}")
+            self._broadcast_presence()
             
+    def _presence_data(self) -> dict:
+        """Build a presence message advertising our address and audio limits."""
+        return {
+            'type': 'presence',
+            'username': self.username,
+            'shop_location': self.shop_location,
+            'ip_address': self.local_ip,
+            'port': self.port,
+            'max_packet_size': self.max_audio_packet_size,
+            'chunk_size': self.chunk_size,
+            'codecs': list(audio_protocol.CODECS),
+            'version': self._presence_version,
+            'timestamp': self.clock.time()
+        }
+        
     def _broadcast_presence(self):
-        """Broadcast presence to other users on the network."""
+        """Broadcast presence to other users on every attached network."""
         if not self.running:
             return
             
         try:
-            presence_data = {
-                'type': 'presence',
-                'username': self.username,
-                'shop_location': self.shop_location,
-                'ip_address': self.local_ip,
-                'port': self.port,
-                'timestamp': time.time()
-            }
+            self._last_presence_time = self.clock.time()
+            self._presence_version = new_version(self._last_presence_time)
+            presence_data = self._presence_data()
+            self.gossip.update(dict(presence_data))
             
-            # Broadcast to discovery port
-            message = json.dumps(presence_data).encode()
-            self.discovery_socket.sendto(message, ('<broadcast>', self.discovery_port))
+            # One message per interface, each advertising that interface's address
+            messages = []
+            for interface in self.interfaces.interfaces:
+                presence_data['ip_address'] = interface.address
+                messages.append((json.dumps(presence_data).encode(), interface.broadcast))
+            if not messages:
+                messages.append((json.dumps(presence_data).encode(), '255.255.255.255'))
+                
+            self._send_discovery(messages)
             
         except Exception as e:
             print(f"Error broadcasting presence: {e}")
             
+    def _load_peer_cache(self):
+        """List peers from the cache as likely online and probe them in one burst."""
+        own_key = f"{self.username}@{self.shop_location}"
+        peers = []
+        
+        for fields in peer_cache.load_peers(self.peer_cache_file, self.peer_cache_max_age, self.clock.time()):
+            try:
+                user = User(**fields, confirmed=False)
+            except TypeError:
+                continue
+            user_key = f"{user.username}@{user.shop_location}"
+            if user_key != own_key and user_key not in self.users:
+                self.users[user_key] = user
+                peers.append(user)
+                
+        if not peers:
+            return
+            
+        print(f"Probing {len(peers)} cached peers")
+        if self.on_directory_changed:
+            self.on_directory_changed()
+            
+        presence_data = self._presence_data()
+        presence_data['probe'] = True
+        message = json.dumps(presence_data).encode()
+        self._peers_probed_at = self.clock.time()
+        self._send_discovery([(message, user.ip_address) for user in peers])
+        
+    def _expire_unconfirmed_peers(self, now: float):
+        """Show cached peers that did not answer their probe as offline."""
+        if not self._peers_probed_at or now - self._peers_probed_at < self.peer_probe_timeout:
+            return
+        self._peers_probed_at = 0.0
+        
+        expired = [user for user in list(self.users.values()) if not user.confirmed and user.is_online]
+        for user in expired:
+            user.is_online = False
+            
+        if expired and self.on_directory_changed:
+            self.on_directory_changed()
+            
+    def _expire_silent_peers(self, now: float):
+        """Show peers offline whose presence has not been heard for ``presence_timeout``.
+        
+        A terminal that crashes or loses power never says it is going
+        offline. Its gossip entry becomes an offline entry one version
+        newer, so the chain agrees and pruning forgets it as usual, while
+        the peer's next real presence still supersedes it.
+        """
+        cutoff = now - self.presence_timeout
+        silent = [user for user in list(self.users.values())
+                  if user.is_online and user.confirmed and user.last_seen < cutoff]
+        for user in silent:
+            user.is_online = False
+            user_key = f"{user.username}@{user.shop_location}"
+            entry = self.gossip.entries.get(user_key)
+            if entry and entry['type'] == 'presence':
+                self.gossip.update({
+                    'type': 'offline',
+                    'username': user.username,
+                    'shop_location': user.shop_location,
+                    'version': entry['version'] + 1,
+                    'timestamp': now,
+                })
+            if self.on_user_offline:
+                self.on_user_offline(user)
+                
+        if silent:
+            print(f"{len(silent)} peers not heard from for {self.presence_timeout:.0f} s; shown offline")
+            
+    def _prune_peers(self, now: float):
+        """Forget peers offline for ``user_prune_age``, and state kept for senders idle as long.
+        
+        A terminal runs all day, and would otherwise keep an entry for every
+        peer and sender it has ever seen.
+        """
+        cutoff = now - self.user_prune_age
+        forgotten = [user_key for user_key, user in list(self.users.items())
+                     if not user.is_online and user.last_seen < cutoff]
+        for user_key in forgotten:
+            self.users.pop(user_key, None)
+            self._forget_peer_state(user_key)
+            # Stale offline entries come back from peers that still have them, and are pruned again
+            if self.gossip.entries.get(user_key, {}).get('type') == 'offline':
+                self.gossip.forget(user_key)
+                
+        # Streams from senders that never announced themselves, or have been forgotten
+        for sender_key, stats in list(self.receiver_stats.items()):
+            if sender_key not in self.users and stats.last_packet_time < cutoff:
+                self._forget_peer_state(sender_key)
+                
+        for sender_key, sent_at in list(self._key_rejects_sent.items()):
+            if now - sent_at > 60.0:
+                self._key_rejects_sent.pop(sender_key, None)
+                
+        if forgotten:
+            self._peer_cache_dirty = True
+            print(f"Forgot {len(forgotten)} peers offline for over {self.user_prune_age:.0f} s")
+            
+    def _forget_peer_state(self, user_key: str):
+        """Drop everything kept for a peer, unless it is in the middle of a talk spurt or transfer."""
+        if user_key in self.outgoing_spurts or user_key in self.incoming_spurts or user_key in self.outgoing_transfers:
+            return
+            
+        for state in (self.send_queues, self.packetizers, self.link_controllers, self.send_auth,
+                      self.receive_auth, self._pending_receive_auth, self._key_offers, self._key_rejects_sent,
+                      self.receiver_stats, self.receiver_addresses, self._ended_sessions, self._voice_retry_at,
+                      self.audio_sequences, self._key_offer_versions):
+            state.pop(user_key, None)
+        self._stale_packetizers.discard(user_key)
+        self._flush_requests.discard(user_key)
+        
+    def _save_peer_cache(self):
+        """Write recently seen peers to the cache file."""
+        self._peer_cache_dirty = False
+        self._last_peer_cache_save = self.clock.time()
+        peer_cache.save_peers(self.peer_cache_file, list(self.users.values()), self.peer_cache_max_age,
+                              now=self._last_peer_cache_save)
+        
+    def _send_discovery(self, messages: List[tuple]):
+        """Send (message, address) pairs to the discovery port in one pass."""
+        for message, address in messages:
+            try:
+                if not self._sendto(self.discovery_socket, message, (address, self.discovery_port)):
+                    continue
+                if self.capture:
+                    self.capture.record(packet_capture.OUTGOING, packet_capture.CHANNEL_DISCOVERY,
+                                        (address, self.discovery_port), message)
+            except OSError as e:
+                print(f"Error sending discovery to {address}: {e}")
+                
     def _discovery_worker(self):
         """Worker thread for discovering other users."""
         while self.running:
             try:
                 self.discovery_socket.settimeout(1.0)
-                data, addr = self.discovery_socket.recvfrom(1024)
+                data, addr = self.discovery_socket.recvfrom(65535)
+                self._handle_discovery_datagram(data, addr)
                 
-                if data:
-                    message = json.loads(data.decode())
-                    
-                    if message['type'] == 'presence':
-                        self._handle_presence(message, addr[0])
-                    elif message['type'] == 'offline':
-                        self._handle_offline(message)
-                        
             except socket.timeout:
                 continue
             except Exception as e:
@@ -168,42 +569,585 @@ class NetworkManager:
                 
         print("Discovery worker stopped")
         
+    def _handle_discovery_datagram(self, data: bytes, addr):
+        """Handle a datagram received on the discovery socket."""
+        if self.capture:
+            self.capture.record(packet_capture.INCOMING, packet_capture.CHANNEL_DISCOVERY, addr, data)
+        if data and self.discovery_filter.accept(addr[0]):
+            message = json.loads(data.decode())
+            
+            if message['type'] in ('presence', 'offline'):
+                self._handle_directory_message(message, addr[0])
+            elif message['type'] == 'gossip_digest':
+                self._handle_gossip_digest(message, addr[0])
+            elif message['type'] == 'gossip_delta':
+                self._handle_gossip_delta(message, addr[0])
+                
+    def _handle_directory_message(self, message: dict, ip_address: str):
+        """Handle a presence or offline message, unless we already know a newer one."""
+        if entry_key(message) == f"{self.username}@{self.shop_location}":
+            return
+            
+        # Unversioned messages come from terminals without gossip support
+        if 'version' in message:
+            entry = {key: value for key, value in message.items() if key != 'probe'}
+            if not self.gossip.update(entry) and not message.get('probe'):
+                return
+                
+        if message['type'] == 'presence':
+            self._handle_presence(message, ip_address)
+        else:
+            self._handle_offline(message)
+            
+    def _gossip_round(self):
+        """Send our directory digest to a few random peers."""
+        peers = [user for user in list(self.users.values()) if user.is_online]
+        if not peers:
+            return
+            
+        message = self.gossip.digest_message(self.username, self.shop_location)
+        
+        targets = random.sample(peers, min(self.gossip_fanout, len(peers)))
+        self._send_discovery([(message, user.ip_address) for user in targets])
+        
+    def _handle_gossip_digest(self, message: dict, ip_address: str):
+        """Reply to a peer's digest with our newer entries and the keys we want."""
+        newer, wanted = self.gossip.compare(message['digest'])
+        self._send_gossip_entries(newer, ip_address, wanted)
+        
+    def _handle_gossip_delta(self, message: dict, ip_address: str):
+        """Apply entries from a peer, and send any it asked for."""
+        for entry in message['entries']:
+            self._handle_directory_message(entry, entry.get('ip_address', ip_address))
+            
+        if message.get('want'):
+            self._send_gossip_entries(self.gossip.get_entries(message['want']), ip_address)
+            
+    def _send_gossip_entries(self, entries: List[dict], ip_address: str, wanted: Optional[List[str]] = None):
+        """Send directory entries, and the keys we want, to a peer in datagrams that fit the MTU."""
+        datagrams = pack_deltas(entries, wanted or [], self.gossip.max_bytes)
+        self._send_discovery([(data, ip_address) for data in datagrams])
+        
     def _audio_worker(self):
-        """Worker thread for receiving audio data."""
+        """Worker thread for receiving audio data.
+        
+        Each wakeup drains every queued datagram into pooled buffers before
+        handling them, so a burst costs one wakeup and no new buffers.
+        """
+        self.audio_socket.setblocking(False)
+        self._tune_worker_thread()
+        
         while self.running:
             try:
-                self.audio_socket.settimeout(1.0)
-                data, addr = self.audio_socket.recvfrom(65536)  # Large buffer for audio
-                
-                if data:
-                    # Parse audio packet
-                    try:
-                        packet_data = json.loads(data.decode())
-                        audio_packet = AudioPacket(
-                            sender=packet_data['sender'],
-                            sender_shop=packet_data['sender_shop'],
-                            timestamp=packet_data['timestamp'],
-                            audio_data=bytes.fromhex(packet_data['audio_data']),
-                            sequence_number=packet_data['sequence_number']
-                        )
-                        
-                        if self.on_audio_received:
-                            self.on_audio_received(audio_packet)
-                            
-                    except Exception as e:
-                        print(f"Error parsing audio packet: {e}")
-                        
-            except socket.timeout:
+                readable, _, _ = select.select([self.audio_socket], [], [], 1.0)
+                if readable:
+                    self._drain_audio()
+                    
+            except Exception as e:
+                if self.running:
+                    print(f"Audio worker error: {e}")
+                    
+        print("Audio worker stopped")
+        
+    def _drain_audio(self):
+        """Receive and handle the audio datagrams queued on the audio socket."""
+        capture = self.capture
+        for buffer, nbytes, addr in self._receive_batch():
+            try:
+                if capture:
+                    capture.record(packet_capture.INCOMING, packet_capture.CHANNEL_AUDIO, addr, buffer[:nbytes])
+                if nbytes and self.audio_filter.accept(addr[0]):
+                    self._handle_audio_packet(buffer[:nbytes], addr)
+            except Exception as e:
+                print(f"Error parsing audio packet: {e}")
+            finally:
+                # Playout has copied the audio by now
+                self.receive_pool.release(buffer)
+                
+    def _receive_batch(self) -> List[tuple]:
+        """Read queued datagrams into pooled buffers until none are left or the pool is empty."""
+        batch = []
+        pool = self.receive_pool
+        receive_into = self.audio_socket.recvfrom_into
+        
+        for _ in range(pool.count):
+            buffer = pool.acquire()
+            try:
+                nbytes, addr = receive_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                pool.release(buffer)
+                break
+            except ConnectionResetError:
+                # Windows reports an earlier send to a closed port here
+                pool.release(buffer)
                 continue
+            batch.append((buffer, nbytes, addr))
+            
+        return batch
+        
+    def _handle_audio_packet(self, data: bytes, addr):
+        """Handle an audio frame or talk spurt marker."""
+        packet_data = audio_protocol.unpack_packet(data)
+        sender_key = f"{packet_data['sender']}@{packet_data['sender_shop']}"
+        if not self._check_authentication(sender_key, packet_data, data, addr):
+            return
+        self.receiver_addresses[sender_key] = addr[0]
+        
+        if packet_data['type'] == audio_protocol.PACKET_SPURT_START:
+            self._handle_spurt_start(sender_key, packet_data)
+            return
+        if packet_data['type'] == audio_protocol.PACKET_SPURT_END:
+            self._handle_spurt_end(sender_key, packet_data)
+            return
+            
+        # A frame from a spurt that already ended arrived late; its playout is gone
+        spurt = self._handle_spurt_start(sender_key, packet_data)
+        if spurt is None:
+            return
+        spurt.last_packet_time = self.clock.time()
+        
+        sequence_number = packet_data['sequence_number']
+        stats = self.receiver_stats.get(sender_key)
+        if stats is None:
+            stats = self.receiver_stats[sender_key] = ReceiverStats()
+            
+        # Recover a single lost frame from the redundant copy
+        if packet_data['redundant'] is not None and stats.highest_seq == sequence_number - 2:
+            self._deliver_audio(packet_data, packet_data['redundant'], sequence_number - 1)
+            
+        stats.on_packet(sequence_number, packet_data['timestamp'], self.clock.time())
+        self._deliver_audio(packet_data, packet_data['payload'], sequence_number)
+        
+    def _check_authentication(self, sender_key: str, packet_data: dict, data: bytes, addr) -> bool:
+        """Verify a packet's tag and sequence number. Returns False if it must be dropped."""
+        if not packet_data['authenticated']:
+            if self.authenticate_audio:
+                self.auth_failures += 1
+                return False
+            return True
+            
+        authenticator = self._receive_authenticator(sender_key, lambda authenticator: authenticator.verify(data))
+        if authenticator is None:
+            self.auth_failures += 1
+            self._reject_key(sender_key, addr)
+            return False
+            
+        sequence_number = packet_data['sequence_number']
+        if packet_data['type'] == audio_protocol.PACKET_AUDIO:
+            fresh = authenticator.replay.check(sequence_number)
+        else:
+            fresh = authenticator.replay.is_fresh(sequence_number)
+            
+        if not fresh:
+            self.auth_replays += 1
+        return fresh
+        
+    def _receive_authenticator(self, sender_key: str, verify) -> Optional[packet_auth.PacketAuthenticator]:
+        """Find the key from a peer that ``verify`` accepts, or None."""
+        authenticator = self.receive_auth.get(sender_key)
+        if authenticator is not None and verify(authenticator):
+            return authenticator
+            
+        # The sender may have switched to the key it agreed with us most recently
+        authenticator = self._pending_receive_auth.get(sender_key)
+        if authenticator is not None and verify(authenticator):
+            self.receive_auth[sender_key] = self._pending_receive_auth.pop(sender_key)
+            return authenticator
+        return None
+        
+    def _handle_spurt_start(self, sender_key: str, packet_data: dict) -> Optional[TalkSpurt]:
+        """Open an incoming talk spurt unless it is already open or already ended.
+        
+        Audio frames also call this, so a spurt whose start marker was lost
+        still opens on its first frame.
+        """
+        session_id = packet_data['session_id']
+        
+        with self._spurt_lock:
+            spurt = self.incoming_spurts.get(sender_key)
+            if spurt and spurt.session_id == session_id:
+                return spurt
+            if self._ended_sessions.get(sender_key) == session_id:
+                return None
+                
+            previous = self.incoming_spurts.pop(sender_key, None)
+            now = self.clock.time()
+            spurt = TalkSpurt(
+                sender=packet_data['sender'],
+                sender_shop=packet_data['sender_shop'],
+                session_id=session_id,
+                codec=packet_data['codec'],
+                started_at=now,
+                last_packet_time=now
+            )
+            self.incoming_spurts[sender_key] = spurt
+            
+        # The previous spurt never got its end marker
+        if previous:
+            self._finish_incoming_spurt(sender_key, previous)
+            
+        if self.on_spurt_start:
+            self.on_spurt_start(spurt)
+            
+        return spurt
+        
+    def _handle_spurt_end(self, sender_key: str, packet_data: dict):
+        """Close an incoming talk spurt. Repeated end markers are ignored."""
+        with self._spurt_lock:
+            spurt = self.incoming_spurts.get(sender_key)
+            if not spurt or spurt.session_id != packet_data['session_id']:
+                return
+            del self.incoming_spurts[sender_key]
+            
+        self._finish_incoming_spurt(sender_key, spurt)
+        
+    def _finish_incoming_spurt(self, sender_key: str, spurt: TalkSpurt):
+        """Record that an incoming spurt ended and notify."""
+        self._ended_sessions[sender_key] = spurt.session_id
+        
+        if self.on_spurt_end:
+            self.on_spurt_end(spurt)
+            
+    def _expire_incoming_spurts(self, now: float):
+        """End incoming spurts whose end markers were all lost."""
+        with self._spurt_lock:
+            expired = [
+                (sender_key, spurt) for sender_key, spurt in self.incoming_spurts.items()
+                if now - spurt.last_packet_time > self.spurt_timeout
+            ]
+            for sender_key, _ in expired:
+                del self.incoming_spurts[sender_key]
+                
+        for sender_key, spurt in expired:
+            self._finish_incoming_spurt(sender_key, spurt)
+            
+    def _deliver_audio(self, packet_data: dict, payload: bytes, sequence_number: int):
+        """Decode a frame and pass it to the audio callback."""
+        audio_packet = AudioPacket(
+            sender=packet_data['sender'],
+            sender_shop=packet_data['sender_shop'],
+            timestamp=packet_data['timestamp'],
+            audio_data=audio_protocol.decode_payload(packet_data['codec'], payload, self._decode_buffer),
+            sequence_number=sequence_number,
+            codec=packet_data['codec'],
+            session_id=packet_data['session_id']
+        )
+        
+        if self.on_audio_received:
+            self.on_audio_received(audio_packet)
+            
+    def _control_worker(self):
+        """Worker thread for receiver reports and RTT probes on the control socket."""
+        while self.running:
+            try:
+                self.udp_socket.settimeout(self._voice_timeout(min(self.report_interval, self.ping_interval) / 2))
+                data, addr = self.udp_socket.recvfrom(2048)
+                self._handle_control_datagram(data, addr)
+                
+            except socket.timeout:
+                pass
             except Exception as e:
-                print(f"Audio worker error: {e}")
+                if self.running:
+                    print(f"Control error: {e}")
+                    
+            try:
+                self._control_tick()
+                self._service_voice_transfers(self.clock.time())
+            except Exception as e:
+                if self.running:
+                    print(f"Control error: {e}")
+                    
+        print("Control worker stopped")
+        
+    def _handle_control_datagram(self, data: bytes, addr):
+        """Handle a datagram received on the control socket."""
+        if self.capture:
+            self.capture.record(packet_capture.INCOMING, packet_capture.CHANNEL_CONTROL, addr, data)
+        if voice_transfer.is_chunk(data):
+            if self.voice_filter.accept(addr[0]):
+                self._handle_voice_chunk(data, addr)
+        elif voice_transfer.is_ack(data):
+            if self.voice_filter.accept(addr[0]):
+                self._handle_voice_ack(voice_transfer.unpack_ack(data), addr)
+        elif data and self.control_filter.accept(addr[0]):
+            message = json.loads(data.decode())
+            
+            if message['type'] == 'report':
+                self._handle_report(message)
+            elif message['type'] == 'ping':
+                self._handle_ping(message, addr)
+            elif message['type'] == 'pong':
+                self._handle_pong(message)
+            elif message['type'] == 'key_offer':
+                self._handle_key_offer(message, addr)
+            elif message['type'] == 'key_accept':
+                self._handle_key_accept(message)
+            elif message['type'] == 'key_reject':
+                self._handle_key_reject(message)
+            elif message['type'] == 'voice_offer':
+                self._handle_voice_offer(message, addr)
+            elif message['type'] == 'voice_reject':
+                self._handle_voice_reject(message, addr)
                 
-        print("Audio worker stopped")
+    def _control_tick(self):
+        """Send receiver reports and RTT probes that are due."""
+        now = self.clock.time()
+        
+        self._expire_incoming_spurts(now)
+        self._expire_unconfirmed_peers(now)
+        self._refresh_interfaces()
+        
+        if self.gossip_enabled and now - self._last_gossip_time >= self.gossip_interval:
+            self._last_gossip_time = now
+            self._gossip_round()
+        
+        if self._peer_cache_dirty and now - self._last_peer_cache_save >= 60.0:
+            self._save_peer_cache()
+            
+        if now - self._last_presence_time >= self.presence_interval:
+            self._broadcast_presence()
+            self._expire_silent_peers(now)
+            
+        if now - self._last_prune_time >= min(60.0, self.user_prune_age):
+            self._last_prune_time = now
+            self._prune_peers(now)
+        
+        if now - self._last_report_time >= self.report_interval:
+            self._last_report_time = now
+            
+            for sender_key, stats in list(self.receiver_stats.items()):
+                # Only report on streams that are still active
+                if now - stats.last_packet_time > self.report_interval * 2:
+                    continue
+                    
+                report = stats.make_report()
+                report.update({
+                    'type': 'report',
+                    'username': self.username,
+                    'shop_location': self.shop_location,
+                })
+                self._send_control(sender_key, report)
+                
+        if now - self._last_ping_time >= self.ping_interval:
+            self._last_ping_time = now
+            
+            for user_key in list(self.link_controllers):
+                self._send_control(user_key, {
+                    'type': 'ping',
+                    'username': self.username,
+                    'shop_location': self.shop_location,
+                    'sent_at': now,
+                })
+                
+    def _send_control(self, user_key: str, message: dict):
+        """Send a control message to a peer's control socket."""
+        user = self.users.get(user_key)
+        if user:
+            address = (user.ip_address, user.port)
+        elif user_key in self.receiver_addresses:
+            address = (self.receiver_addresses[user_key], self.port)
+        else:
+            return
+            
+        self._send_control_datagram(json.dumps(message).encode(), address)
+        
+    def _sendto(self, sock: socket.socket, data: bytes, address: tuple) -> bool:
+        """Send a datagram, waiting for room if the socket's send buffer is full.
+        
+        Receiving keeps the sockets non-blocking, so a full buffer raises
+        instead of blocking. The datagram is dropped, and counted, only if
+        no room frees up within ``send_wait_timeout``.
+        """
+        try:
+            sock.sendto(data, address)
+            return True
+        except BlockingIOError:
+            pass
+            
+        deadline = time.monotonic() + self.send_wait_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.send_drops += 1
+                return False
+            select.select([], [sock], [], remaining)
+            try:
+                sock.sendto(data, address)
+                return True
+            except BlockingIOError:
+                continue
+                
+    def _send_control_datagram(self, data: bytes, address: tuple):
+        """Send a datagram from the control socket, recording it when capturing."""
+        if self._sendto(self.udp_socket, data, address) and self.capture:
+            self.capture.record(packet_capture.OUTGOING, packet_capture.CHANNEL_CONTROL, address, data)
+            
+    def _send_audio_datagram(self, data: bytes, address: tuple):
+        """Send a datagram from the audio socket, recording it when capturing."""
+        if self._sendto(self.audio_socket, data, address) and self.capture:
+            self.capture.record(packet_capture.OUTGOING, packet_capture.CHANNEL_AUDIO, address, data)
+            
+    def _handle_report(self, message: dict):
+        """Handle a receiver report about audio we are sending."""
+        user_key = f"{message['username']}@{message['shop_location']}"
+        controller = self.link_controllers.get(user_key)
+        
+        if controller and self.adaptive_bitrate and controller.on_report(message):
+            self._stale_packetizers.add(user_key)
+            print(f"Link to {user_key} adjusted: {controller.settings} "
+                  f"(loss {message.get('loss_fraction', 0.0):.1%}, "
+                  f"jitter {message.get('jitter_ms', 0.0)} ms)")
+            
+    def _handle_ping(self, message: dict, addr):
+        """Answer an RTT probe."""
+        pong = {
+            'type': 'pong',
+            'username': self.username,
+            'shop_location': self.shop_location,
+            'sent_at': message['sent_at'],
+        }
+        self._send_control_datagram(json.dumps(pong).encode(), addr)
+        
+    def _handle_pong(self, message: dict):
+        """Handle an RTT probe answer."""
+        user_key = f"{message['username']}@{message['shop_location']}"
+        controller = self.link_controllers.get(user_key)
+        
+        if controller:
+            controller.on_rtt(self.clock.time() - message['sent_at'])
+        
+    def _request_key(self, user_key: str):
+        """Offer a nonce to a peer to agree a key for the audio we send it."""
+        offer = self._key_offers.get(user_key)
+        now = self.clock.time()
+        if offer and now - offer[1] < 1.0:
+            return
+            
+        nonce = packet_auth.new_nonce()
+        self._key_offers[user_key] = (nonce, now)
+        self._send_control(user_key, packet_auth.sign_message(self._control_key, {
+            'type': 'key_offer',
+            'username': self.username,
+            'shop_location': self.shop_location,
+            'nonce': nonce.hex(),
+            'version': new_version(now),
+        }))
+        
+    def _handle_key_offer(self, message: dict, addr):
+        """Agree a key for audio a peer will send us, and prove we derived it.
+        
+        Offers carry the sender's own increasing version, so a replayed one
+        cannot replace the key the sender is about to switch to.
+        """
+        if not self.auth_secret or not packet_auth.verify_message(self._control_key, message):
+            return
+            
+        sender_key = f"{message['username']}@{message['shop_location']}"
+        version = message.get('version', 0)
+        if version <= self._key_offer_versions.get(sender_key, 0):
+            return
+        self._key_offer_versions[sender_key] = version
+        
+        sender_nonce = bytes.fromhex(message['nonce'])
+        receiver_nonce = packet_auth.new_nonce()
+        key = packet_auth.derive_key(
+            self.auth_secret, sender_nonce, receiver_nonce,
+            sender_key, f"{self.username}@{self.shop_location}"
+        )
+        
+        # Keep the current key until the sender's packets show it switched
+        self._pending_receive_auth[sender_key] = packet_auth.PacketAuthenticator(key)
+        
+        accept = {
+            'type': 'key_accept',
+            'username': self.username,
+            'shop_location': self.shop_location,
+            'nonce': message['nonce'],
+            'reply_nonce': receiver_nonce.hex(),
+            'proof': packet_auth.key_proof(key),
+        }
+        self._send_control_datagram(json.dumps(accept).encode(), addr)
+        
+    def _handle_key_accept(self, message: dict):
+        """Start signing audio to a peer once it has proven it derived our key."""
+        user_key = f"{message['username']}@{message['shop_location']}"
+        offer = self._key_offers.get(user_key)
+        if offer is None or message['nonce'] != offer[0].hex():
+            return
+            
+        key = packet_auth.derive_key(
+            self.auth_secret, offer[0], bytes.fromhex(message['reply_nonce']),
+            f"{self.username}@{self.shop_location}", user_key
+        )
+        if not hmac.compare_digest(packet_auth.key_proof(key), message['proof']):
+            print(f"Key proof from {user_key} did not match; check the shared secret")
+            return
+            
+        del self._key_offers[user_key]
+        self.send_auth[user_key] = packet_auth.PacketAuthenticator(key)
+        
+        # A voice message offered under the old key is offered again under the new one
+        if self.outgoing_transfers.pop(user_key, None) is not None:
+            self._transfer_messages.pop(user_key, None)
+            self._last_voice_check = 0.0
+        self._wake_sender()
+        print(f"Audio to {user_key} is authenticated")
+        
+    def _reject_key(self, sender_key: str, addr):
+        """Tell a sender we cannot verify its audio, at most once a second."""
+        now = self.clock.time()
+        if now - self._key_rejects_sent.get(sender_key, 0.0) < 1.0:
+            return
+        self._key_rejects_sent[sender_key] = now
+        
+        reject = packet_auth.sign_message(self._control_key, {
+            'type': 'key_reject',
+            'username': self.username,
+            'shop_location': self.shop_location,
+        })
+        self._send_control_datagram(json.dumps(reject).encode(), (addr[0], self.port))
+        
+    def _handle_key_reject(self, message: dict):
+        """Agree a new key with a peer that could not verify our audio, e.g. after it restarted.
+        
+        The current key stays in use until the peer accepts the new one, so
+        a replayed rejection costs a key exchange, never a working key.
+        """
+        if not self.auth_secret or not packet_auth.verify_message(self._control_key, message):
+            return
+        user_key = f"{message['username']}@{message['shop_location']}"
+        if user_key in self.send_auth:
+            self._request_key(user_key)
+            
+    def _seal(self, user_key: str, message: bytes):
+        """Append the authentication tag for a peer, if audio to it is authenticated."""
+        authenticator = self.send_auth.get(user_key)
+        return authenticator.sign(message) if authenticator else message
+        
+    def get_auth_stats(self) -> dict:
+        """Get audio authentication counters."""
+        return {
+            'enabled': self.authenticate_audio,
+            'send_keys': len(self.send_auth),
+            'receive_keys': len(self.receive_auth),
+            'failures': self.auth_failures,
+            'replays': self.auth_replays,
+        }
         
     def _handle_presence(self, message: dict, ip_address: str):
         """Handle presence message from another user."""
         user_key = f"{message['username']}@{message['shop_location']}"
         
+        # Our own broadcasts loop back to us
+        if user_key == f"{self.username}@{self.shop_location}":
+            return
+            
+        # A peer that found us in its cache wants an answer straight away
+        if message.get('probe'):
+            self._send_discovery([(json.dumps(self._presence_data()).encode(), ip_address)])
+            
+        self._peer_cache_dirty = True
+        
         if user_key not in self.users:
             # New user discovered
             user = User(
@@ -211,19 +1155,90 @@ class NetworkManager:
                 shop_location=message['shop_location'],
                 ip_address=ip_address,
                 port=message['port'],
-                last_seen=time.time()
+                last_seen=self.clock.time()
             )
+            self._update_limits(user, message)
             
             self.users[user_key] = user
             
+            # Agree a key now so the first transmission is not delayed
+            if self.authenticate_audio:
+                self._request_key(user_key)
+                
             if self.on_user_discovered:
                 self.on_user_discovered(user)
                 
             print(f"User discovered: {user.username} at {user.shop_location}")
         else:
             # Update existing user
-            self.users[user_key].last_seen = time.time()
-            self.users[user_key].is_online = True
+            user = self.users[user_key]
+            was_confirmed = user.confirmed
+            user.last_seen = self.clock.time()
+            user.is_online = True
+            user.confirmed = True
+            user.ip_address = ip_address
+            self._update_limits(user, message)
+            
+            # A cached peer answered; it is no longer just "likely online"
+            if not was_confirmed and self.on_directory_changed:
+                self.on_directory_changed()
+            
+    def _update_limits(self, user: User, message: dict):
+        """Record the audio limits a peer advertised and renegotiate framing."""
+        limits = (
+            message.get('max_packet_size', user.max_packet_size),
+            message.get('chunk_size', user.chunk_size),
+            message.get('codecs', user.codecs),
+        )
+        
+        if limits != (user.max_packet_size, user.chunk_size, user.codecs):
+            user.max_packet_size, user.chunk_size, user.codecs = limits
+            self._stale_packetizers.add(f"{user.username}@{user.shop_location}")
+            
+    def _get_packetizer(self, user_key: str, user: User) -> audio_protocol.Packetizer:
+        """Get the packetizer for a peer, renegotiating framing when limits change."""
+        packetizer = self.packetizers.get(user_key)
+        if packetizer is not None and user_key not in self._stale_packetizers:
+            return packetizer
+            
+        self._stale_packetizers.discard(user_key)
+        pending = packetizer.take_pending() if packetizer else b''
+        
+        controller = self.link_controllers.get(user_key)
+        if controller is None:
+            controller = self.link_controllers[user_key] = LinkController(self.codec)
+            
+        if self.adaptive_bitrate:
+            settings = controller.settings
+        else:
+            settings = {'codec': self.codec, 'max_frame_ms': 40, 'fec': False}
+            
+        codec = settings['codec'] if settings['codec'] in user.codecs else 'pcm16'
+        budget = min(self.max_audio_packet_size, user.max_packet_size)
+        chunk_size = min(self.chunk_size, user.chunk_size)
+        overhead = audio_protocol.header_overhead(
+            self.username, self.shop_location, self.authenticate_audio
+        )
+        
+        # Drop FEC before failing if the redundant copy does not fit the budget
+        fec = settings['fec']
+        try:
+            frame_ms = audio_protocol.choose_frame_duration(
+                codec, self.sample_rate, budget, chunk_size, overhead,
+                settings['max_frame_ms'], fec
+            )
+        except ValueError:
+            fec = False
+            frame_ms = audio_protocol.choose_frame_duration(
+                codec, self.sample_rate, budget, chunk_size, overhead,
+                settings['max_frame_ms']
+            )
+            
+        packetizer = audio_protocol.Packetizer(codec, self.sample_rate, frame_ms, fec, pending)
+        self.packetizers[user_key] = packetizer
+        print(f"Audio to {user_key}: {codec}, {frame_ms} ms frames, FEC {'on' if fec else 'off'}")
+        
+        return packetizer
             
     def _handle_offline(self, message: dict):
         """Handle offline message from another user."""
@@ -238,48 +1253,556 @@ class NetworkManager:
             print(f"User went offline: {self.users[user_key].username}")
             
     def send_audio(self, target_user: str, target_shop: str, audio_data: bytes):
-        """Send audio data to a specific user."""
+        """Queue audio data for sending to a specific user."""
         if not self.running:
             return
             
         try:
             user_key = f"{target_user}@{target_shop}"
             
-            if user_key not in self.users:
-                print(f"User {user_key} not found")
+            user = self.users.get(user_key)
+            if user is None or not user.is_online or self._is_spooling(user_key):
+                self._spool_audio(user_key, audio_data)
                 return
                 
-            user = self.users[user_key]
+            queue = self.send_queues.get(user_key)
+            if queue is None:
+                queue = self.send_queues[user_key] = AudioQueue(
+                    PERFORMANCE_CONFIG['max_audio_queue_size'],
+                    self.chunk_size * 2,
+                    PERFORMANCE_CONFIG['send_queue_policy'],
+                    AUDIO_CONFIG['noise_gate_threshold']
+                )
+                
+            for offset in range(0, len(audio_data), queue.slot_size):
+                queue.put(audio_data[offset:offset + queue.slot_size])
+                
+            self._wake_sender()
             
-            # Create audio packet
-            packet = AudioPacket(
-                sender=self.username,
-                sender_shop=self.shop_location,
-                timestamp=time.time(),
-                audio_data=audio_data,
-                sequence_number=self.audio_sequence
-            )
+        except Exception as e:
+            print(f"Error sending audio: {e}")
+            
+    def end_talk_spurt(self, target_user: str, target_shop: str):
+        """End the current transmission to a user once its queued audio is sent.
+        
+        The final partial frame is flushed and an end marker follows it.
+        """
+        if not self.running:
+            return
+            
+        user_key = f"{target_user}@{target_shop}"
+        if self._is_spooling(user_key):
+            message = self.voice_spool.finish(user_key)
+            if message:
+                print(f"Voice message for {user_key} spooled ({message.size} bytes)")
+            return
+            
+        self._flush_requests.add(user_key)
+        self._wake_sender()
+        
+    def _is_spooling(self, user_key: str) -> bool:
+        """Check if a talk spurt to a user is being recorded as a voice message."""
+        return self.voice_spool is not None and self.voice_spool.is_recording(user_key)
+        
+    def _spool_audio(self, user_key: str, audio_data: bytes):
+        """Record audio for an offline user as a voice message, or drop it if spooling is off."""
+        if self.voice_spool is None:
+            print(f"User {user_key} not found")
+            return
+            
+        if not self.voice_spool.is_recording(user_key):
+            print(f"User {user_key} is offline; recording a voice message")
+        self.voice_spool.append(user_key, self.username, self.shop_location, self.sample_rate, audio_data)
+        
+    def _voice_timeout(self, timeout: float) -> float:
+        """Get how long to wait, at most ``timeout``, before a voice transfer has something due."""
+        if not self.outgoing_transfers and not self.incoming_transfers:
+            return timeout
+            
+        now = self.clock.time()
+        if not (self.outgoing_spurts or self.incoming_spurts):
+            for transfer in list(self.outgoing_transfers.values()):
+                timeout = min(timeout, transfer.next_due(now))
+        for incoming in list(self.incoming_transfers.values()):
+            if incoming.ack_due is not None:
+                timeout = min(timeout, incoming.ack_due - now)
+        return max(0.001, timeout)
+        
+    def _service_voice_transfers(self, now: float):
+        """Start deliveries to peers that are back, and send what transfers have due."""
+        if self.voice_spool and now - self._last_voice_check >= 1.0:
+            self._last_voice_check = now
+            self._start_voice_transfers(now)
             
-            # Convert to JSON and send
-            packet_data = {
-                'sender': packet.sender,
-                'sender_shop': packet.sender_shop,
-                'timestamp': packet.timestamp,
-                'audio_data': packet.audio_data.hex(),
-                'sequence_number': packet.sequence_number
+        # Live audio goes first; transfers pause for the length of a talk spurt
+        live = bool(self.outgoing_spurts or self.incoming_spurts)
+        
+        for user_key, transfer in list(self.outgoing_transfers.items()):
+            user = self.users.get(user_key)
+            if live:
+                transfer.last_progress = now  # paused, not stalled
+                continue
+            if user is None or now - transfer.last_progress > self.voice_transfer_timeout:
+                print(f"Voice message to {user_key} not delivered; will retry")
+                self.outgoing_transfers.pop(user_key, None)
+                self._transfer_messages.pop(user_key, None)
+                self._voice_retry_at[user_key] = now + 30.0
+                continue
+                
+            for datagram in transfer.poll(now):
+                if self.authenticate_audio and voice_transfer.is_chunk(datagram):
+                    datagram = self._seal(user_key, datagram)
+                self._send_control_datagram(datagram, (user.ip_address, user.port))
+                
+        for key, incoming in list(self.incoming_transfers.items()):
+            if live:
+                incoming.last_activity = now
+            if incoming.ack_due is not None and now >= incoming.ack_due:
+                self._send_control_datagram(voice_transfer.pack_ack(incoming.ack()), incoming.address)
+            elif now - incoming.last_activity > self.voice_transfer_timeout * 2:
+                self.incoming_transfers.pop(key, None)
+                
+        for key, (_, completed_at) in list(self._completed_transfers.items()):
+            if now - completed_at > 60.0:
+                del self._completed_transfers[key]
+                
+    def _start_voice_transfers(self, now: float):
+        """Start sending the oldest spooled message to each peer that is online again."""
+        self.voice_spool.expire(now)
+        
+        for user_key in self.voice_spool.targets():
+            if user_key in self.outgoing_transfers or self._voice_retry_at.get(user_key, 0.0) > now:
+                continue
+            user = self.users.get(user_key)
+            if user is None or not user.is_online or not user.confirmed:
+                continue
+            if self.authenticate_audio and user_key not in self.send_auth:
+                self._request_key(user_key)
+                continue
+                
+            message = self.voice_spool.next_message(user_key)
+            try:
+                audio = self.voice_spool.read_audio(message)
+            except OSError as e:
+                print(f"Error reading voice message for {user_key}: {e}")
+                self.voice_spool.remove(message, delivered=False)
+                continue
+                
+            offer = {
+                'type': 'voice_offer',
+                'transfer_id': random.getrandbits(32),
+                'username': self.username,
+                'shop_location': self.shop_location,
+                'timestamp': message.timestamp,
+                'sample_rate': message.sample_rate,
+                'codec': message.codec,
+                'size': len(audio),
             }
+            if self.authenticate_audio:
+                offer = packet_auth.sign_message(self.send_auth[user_key].key, offer)
+            self.outgoing_transfers[user_key] = voice_transfer.OutgoingTransfer(
+                offer, audio, self.voice_transfer_window, self.voice_transfer_rate, now
+            )
+            self._transfer_messages[user_key] = message
+            print(f"Delivering voice message to {user_key} ({len(audio)} bytes)")
             
-            message = json.dumps(packet_data).encode()
-            self.audio_socket.sendto(message, (user.ip_address, self.audio_port))
+    def _handle_voice_ack(self, message: dict, addr):
+        """Handle a voice transfer acknowledgement from the receiving peer."""
+        for user_key, transfer in list(self.outgoing_transfers.items()):
+            user = self.users.get(user_key)
+            if transfer.transfer_id == message['transfer_id'] and user and user.ip_address == addr[0]:
+                break
+        else:
+            return
             
-            self.audio_sequence += 1
+        transfer.on_ack(message, self.clock.time())
+        if transfer.done:
+            self.outgoing_transfers.pop(user_key, None)
+            self.voice_spool.remove(self._transfer_messages.pop(user_key))
+            self._voice_retry_at.pop(user_key, None)
+            self._last_voice_check = 0.0  # start the next message for this peer straight away
+            print(f"Voice message delivered to {user_key}: {transfer.stats()}")
             
-        except Exception as e:
-            print(f"Error sending audio: {e}")
+    def _handle_voice_reject(self, message: dict, addr):
+        """Discard a voice message the receiving peer will never accept."""
+        for user_key, transfer in list(self.outgoing_transfers.items()):
+            user = self.users.get(user_key)
+            if transfer.transfer_id == message['transfer_id'] and user and user.ip_address == addr[0]:
+                break
+        else:
+            return
+            
+        self.outgoing_transfers.pop(user_key, None)
+        self.voice_spool.remove(self._transfer_messages.pop(user_key), delivered=False)
+        self._voice_retry_at.pop(user_key, None)
+        self._last_voice_check = 0.0  # start the next message for this peer straight away
+        print(f"Voice message to {user_key} discarded: {message.get('reason', 'rejected')}")
+        
+    def _handle_voice_offer(self, message: dict, addr):
+        """Accept a voice message a peer spooled for us while we were away.
+        
+        Only offers from a known peer at its address are accepted, signed
+        with its audio key when audio is authenticated.
+        """
+        sender_key = f"{message['username']}@{message['shop_location']}"
+        user = self.users.get(sender_key)
+        if user is None or user.ip_address != addr[0]:
+            return
+        if self.authenticate_audio and self._receive_authenticator(
+                sender_key, lambda authenticator: packet_auth.verify_message(authenticator.key, message)) is None:
+            self.auth_failures += 1
+            self._reject_key(sender_key, addr)
+            return
+            
+        key = (addr[0], message['transfer_id'])
+        if key in self._completed_transfers:
+            self._send_voice_done(message['transfer_id'], key, addr)
+            return
+            
+        incoming = self.incoming_transfers.get(key)
+        if incoming is None:
+            # Bounded: a peer cannot make us hold more than a few maximum-length messages
+            if message['size'] > self.max_voice_message_bytes:
+                # Too long to ever accept: tell the sender, so it stops offering it
+                reject = {'type': 'voice_reject', 'transfer_id': message['transfer_id'], 'reason': 'too long'}
+                self._send_control_datagram(json.dumps(reject).encode(), addr)
+                return
+            if len(self.incoming_transfers) >= 8:
+                return  # busy: the sender offers it again later
+            incoming = self.incoming_transfers[key] = voice_transfer.IncomingTransfer(message, addr, self.clock.time())
+            
+        self._send_control_datagram(voice_transfer.pack_ack(incoming.ack()), addr)
+        
+    def _handle_voice_chunk(self, data: bytes, addr):
+        """Store a chunk of an incoming voice message, delivering the message once it is complete."""
+        if self.authenticate_audio:
+            if len(data) < voice_transfer.CHUNK.size + packet_auth.TAG_SIZE:
+                return
+            signed, data = data, memoryview(data)[:-packet_auth.TAG_SIZE]
+            
+        transfer_id, index, payload = voice_transfer.unpack_chunk(data)
+        key = (addr[0], transfer_id)
+        incoming = self.incoming_transfers.get(key)
+        if incoming is None:
+            if key in self._completed_transfers:
+                self._send_voice_done(transfer_id, key, addr)
+            return
+            
+        if self.authenticate_audio:
+            sender_key = f"{incoming.offer['username']}@{incoming.offer['shop_location']}"
+            if self._receive_authenticator(sender_key, lambda authenticator: authenticator.verify(signed)) is None:
+                self.auth_failures += 1
+                self._reject_key(sender_key, addr)
+                return
+                
+        if incoming.on_chunk(index, payload, self.clock.time()):
+            self._send_control_datagram(voice_transfer.pack_ack(incoming.ack()), addr)
+            
+        if incoming.complete:
+            del self.incoming_transfers[key]
+            self._completed_transfers[key] = (incoming.chunks, self.clock.time())
+            self._deliver_voice_message(incoming.offer, bytes(incoming.data))
+            
+    def _send_voice_done(self, transfer_id: int, key: tuple, addr):
+        """Acknowledge every chunk of a transfer already delivered, whose last ack was lost."""
+        ack = {
+            'type': 'voice_ack',
+            'transfer_id': transfer_id,
+            'next': self._completed_transfers[key][0],
+            'received': [],
+        }
+        self._send_control_datagram(voice_transfer.pack_ack(ack), addr)
+        
+    def _deliver_voice_message(self, offer: dict, data: bytes):
+        """Decode a received voice message and hand it to the application."""
+        message = VoiceMessage(
+            sender=offer['username'],
+            sender_shop=offer['shop_location'],
+            timestamp=offer['timestamp'],
+            sample_rate=offer['sample_rate'],
+            audio_data=audio_protocol.decode_payload(offer['codec'], data)
+        )
+        print(f"Voice message from {message.sender} at {message.sender_shop} "
+              f"({len(message.audio_data) / 2 / message.sample_rate:.1f}s)")
+        
+        if self.on_voice_message:
+            self.on_voice_message(message)
+            
+    def get_voice_stats(self) -> dict:
+        """Get voice spool and transfer metrics."""
+        return {
+            'spool': self.voice_spool.stats() if self.voice_spool else None,
+            'outgoing': {user_key: transfer.stats() for user_key, transfer in list(self.outgoing_transfers.items())},
+            'incoming': len(self.incoming_transfers),
+        }
+        
+    def _tune_worker_thread(self):
+        """Raise the calling audio path thread's priority in low-latency mode."""
+        if self.low_latency:
+            realtime.raise_thread_priority('network')
+            
+    def _wake_sender(self):
+        """Wake whichever thread sends audio."""
+        self._send_event.set()
+        wakeup_sockets = self._wakeup_sockets
+        if wakeup_sockets:
+            try:
+                wakeup_sockets[1].send(b'\0')
+            except (BlockingIOError, OSError):
+                pass  # Already has a wakeup pending, or is shutting down
+                
+    def _resend_timeout(self, timeout: float) -> float:
+        """Get how long to wait, at most ``timeout``, before the next end marker resend is due."""
+        if self._end_marker_resends:
+            timeout = min(timeout, max(0.0, min(entry[0] for entry in self._end_marker_resends) - self.clock.time()))
+        return timeout
+        
+    def _sender_worker(self):
+        """Worker thread that packetizes and sends queued outgoing audio."""
+        self._tune_worker_thread()
+        
+        while self.running:
+            self._send_event.wait(self._resend_timeout(1.0))
+            self._send_event.clear()
+            self._send_pending()
+            
+        print("Sender worker stopped")
+        
+    def _send_pending(self):
+        """Resend due end markers and send everything queued for each peer."""
+        self._send_end_marker_resends()
+        
+        for user_key, queue in list(self.send_queues.items()):
+            flush = False
+            try:
+                # Hold audio (the queue is bounded) until the peer has agreed a key
+                if self.authenticate_audio and user_key not in self.send_auth:
+                    if user_key in self.users:
+                        self._request_key(user_key)
+                    continue
+                    
+                # Check for a flush before draining, so it applies to audio queued before it
+                flush = user_key in self._flush_requests
+                self._flush_requests.discard(user_key)
+                
+                user = self.users.get(user_key)
+                if user is None:
+                    queue.clear()
+                    continue
+                    
+                item = queue.get()
+                while item is not None:
+                    packetizer = self._get_packetizer(user_key, user)
+                    if user_key not in self.outgoing_spurts:
+                        self._start_outgoing_spurt(user_key, user, packetizer)
+                    self._send_frames(user, packetizer, packetizer.feed(item[0]))
+                    item = queue.get()
+                    
+                if flush and user_key in self.outgoing_spurts:
+                    packetizer = self._get_packetizer(user_key, user)
+                    self._send_frames(user, packetizer, packetizer.flush())
+                    self._end_outgoing_spurt(user_key, user, packetizer)
+                    
+            except Exception as e:
+                # Keep the flush, so the spurt still ends once sending works again
+                if flush:
+                    self._flush_requests.add(user_key)
+                if self.running:
+                    print(f"Error sending audio: {e}")
+                    
+    def _start_selector(self):
+        """Start the single worker thread that serves every socket (selector mode)."""
+        self._wakeup_sockets = socket.socketpair()
+        for sock in (self.discovery_socket, self.audio_socket, self.udp_socket) + self._wakeup_sockets:
+            sock.setblocking(False)
+            
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.discovery_socket, selectors.EVENT_READ, lambda: self._drain_datagrams(
+            self.discovery_socket, 65535, self._handle_discovery_datagram
+        ))
+        self._selector.register(self.audio_socket, selectors.EVENT_READ, self._drain_audio)
+        self._selector.register(self.udp_socket, selectors.EVENT_READ, lambda: self._drain_datagrams(
+            self.udp_socket, 2048, self._handle_control_datagram
+        ))
+        self._selector.register(self._wakeup_sockets[0], selectors.EVENT_READ, self._drain_wakeup)
+        
+        self.io_thread = threading.Thread(target=self._io_worker, name='network-io', daemon=True)
+        self.io_thread.start()
+        
+    def _io_worker(self):
+        """Worker thread that waits on every socket at once and sends queued audio.
+        
+        Readable sockets are drained in batches. A byte on the wakeup socket
+        pair means audio was queued or the manager is stopping, so stopping
+        takes no longer than the handler already running.
+        """
+        tick_interval = min(self.report_interval, self.ping_interval) / 2
+        next_tick = 0.0
+        self._tune_worker_thread()
+        
+        while self.running:
+            try:
+                timeout = self._voice_timeout(self._resend_timeout(max(0.0, next_tick - self.clock.time())))
+                for key, _ in self._selector.select(timeout):
+                    if not self.running:
+                        break
+                    key.data()
+                    
+                if self._end_marker_resends:
+                    self._send_end_marker_resends()
+                    
+                if self.clock.time() >= next_tick:
+                    next_tick = self.clock.time() + tick_interval
+                    self._control_tick()
+                    
+                self._service_voice_transfers(self.clock.time())
+                    
+            except Exception as e:
+                if self.running:
+                    print(f"Network I/O error: {e}")
+                    
+        print("Network I/O worker stopped")
+        
+    def _drain_datagrams(self, sock: socket.socket, size: int, handle: Callable, limit: int = 64):
+        """Receive and handle up to ``limit`` queued datagrams from a non-blocking socket."""
+        for _ in range(limit):
+            try:
+                data, addr = sock.recvfrom(size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                # Windows reports an earlier send's ICMP port unreachable here
+                continue
+                
+            try:
+                handle(data, addr)
+            except Exception as e:
+                print(f"Error handling datagram from {addr[0]}: {e}")
+                
+    def _drain_wakeup(self):
+        """Clear pending wakeups and send whatever audio was queued."""
+        try:
+            self._wakeup_sockets[0].recv(4096)
+        except (BlockingIOError, InterruptedError):
+            pass
+        self._send_pending()
+        
+    def get_queue_stats(self) -> Dict[str, dict]:
+        """Get occupancy and drop metrics for every send queue."""
+        return {user_key: queue.stats() for user_key, queue in list(self.send_queues.items())}
+        
+    def get_receive_stats(self) -> dict:
+        """Get receive buffer pool metrics."""
+        return self.receive_pool.stats()
+        
+    def get_capture_stats(self) -> Optional[dict]:
+        """Get datagram capture metrics, or None when not capturing."""
+        return self.capture.stats() if self.capture else None
+        
+    def get_filter_stats(self) -> Dict[str, dict]:
+        """Get accept and drop counters for every socket's packet filter."""
+        return {
+            'discovery': self.discovery_filter.stats(),
+            'audio': self.audio_filter.stats(),
+            'control': self.control_filter.stats(),
+            'voice': self.voice_filter.stats(),
+        }
+        
+    def _start_outgoing_spurt(self, user_key: str, user: User, packetizer: audio_protocol.Packetizer):
+        """Open a talk spurt to a user with a new session id."""
+        session_id = self._next_session_id
+        self._next_session_id = (self._next_session_id + 1) & 0xFFFF
+        
+        now = self.clock.time()
+        self.outgoing_spurts[user_key] = TalkSpurt(
+            sender=self.username,
+            sender_shop=self.shop_location,
+            session_id=session_id,
+            codec=packetizer.codec,
+            started_at=now,
+            last_packet_time=now
+        )
+        packetizer.previous = None
+        
+        message = audio_protocol.pack_spurt_marker(
+            audio_protocol.PACKET_SPURT_START, self.username, self.shop_location,
+            session_id, self.audio_sequences.get(user_key, 0), now, packetizer.codec, user_key in self.send_auth
+        )
+        self._send_audio_datagram(self._seal(user_key, message), (user.ip_address, self.audio_port))
+        
+    def _end_outgoing_spurt(self, user_key: str, user: User, packetizer: audio_protocol.Packetizer):
+        """Close a talk spurt to a user, repeating the end marker in case it is lost."""
+        spurt = self.outgoing_spurts.pop(user_key)
+        
+        message = audio_protocol.pack_spurt_marker(
+            audio_protocol.PACKET_SPURT_END, self.username, self.shop_location,
+            spurt.session_id, self.audio_sequences.get(user_key, 0), self.clock.time(), packetizer.codec,
+            user_key in self.send_auth
+        )
+        message = bytes(self._seal(user_key, message))  # kept for resends
+        address = (user.ip_address, self.audio_port)
+        self._send_audio_datagram(message, address)
+        
+        if self.spurt_end_repeats > 1:
+            self._end_marker_resends.append(
+                [self.clock.time() + self.spurt_end_interval, message, address, self.spurt_end_repeats - 1]
+            )
+            
+    def _send_end_marker_resends(self):
+        """Resend end markers that are due."""
+        now = self.clock.time()
+        
+        for entry in list(self._end_marker_resends):
+            due, message, address, remaining = entry
+            if due > now:
+                continue
+                
+            try:
+                self._send_audio_datagram(message, address)
+            except Exception as e:
+                if self.running:
+                    print(f"Error resending talk spurt end: {e}")
+                    
+            if remaining > 1:
+                entry[0] = now + self.spurt_end_interval
+                entry[3] = remaining - 1
+            else:
+                self._end_marker_resends.remove(entry)
+                
+    def _send_frames(self, user: User, packetizer: audio_protocol.Packetizer, frames: List[bytes]):
+        """Send encoded frames to a user, one datagram per frame."""
+        user_key = f"{user.username}@{user.shop_location}"
+        spurt = self.outgoing_spurts.get(user_key)
+        session_id = spurt.session_id if spurt else 0
+        authenticator = self.send_auth.get(user_key)
+        sequence_number = self.audio_sequences.get(user_key, 0)
+        
+        for payload in frames:
+            message = audio_protocol.pack_audio(
+                self.username,
+                self.shop_location,
+                sequence_number,
+                self.clock.time(),
+                packetizer.codec,
+                packetizer.frame_ms,
+                payload,
+                packetizer.previous if packetizer.fec else None,
+                session_id,
+                authenticator is not None
+            )
+            if authenticator:
+                message = authenticator.sign(message)
+            self._send_audio_datagram(message, (user.ip_address, self.audio_port))
+            packetizer.previous = payload
+            
+            # The wire carries 32 bits; receivers treat the wrap like a sender restart
+            sequence_number = (sequence_number + 1) & 0xFFFFFFFF
+            
+        self.audio_sequences[user_key] = sequence_number
             
     def get_online_users(self) -> List[User]:
         """Get list of online users."""
-        return [user for user in self.users.values() if user.is_online]
+        return [user for user in list(self.users.values()) if user.is_online]
         
     def send_offline_notification(self):
         """Send offline notification to other users."""
@@ -291,11 +1814,21 @@ class NetworkManager:
                 'type': 'offline',
                 'username': self.username,
                 'shop_location': self.shop_location,
-                'timestamp': time.time()
+                'version': new_version(self.clock.time()),
+                'timestamp': self.clock.time()
             }
+            self.gossip.update(offline_data)
             
             message = json.dumps(offline_data).encode()
-            self.discovery_socket.sendto(message, ('<broadcast>', self.discovery_port))
+            self._send_discovery([
+                (message, address) for address in self.interfaces.broadcast_addresses
+            ])
+            
+            # Peers beyond the broadcast domain hear it from the ones we tell directly
+            if self.gossip_enabled:
+                peers = [user for user in list(self.users.values()) if user.is_online]
+                for user in random.sample(peers, min(self.gossip_fanout, len(peers))):
+                    self._send_gossip_entries([offline_data], user.ip_address)
             
         except Exception as e:
             print(f"Error sending offline notification: {e}")
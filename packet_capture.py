@@ -0,0 +1,152 @@
+"""
+Capture of the datagrams a NetworkManager sends and receives.
+
+Choppy audio at a shop is hard to reproduce, so with
+``NETWORK_CONFIG['capture_file']`` set every datagram on the discovery,
+audio and control sockets is recorded with a monotonic timestamp. The
+receive and send paths only append a copy of the datagram to a queue; a
+background thread writes the queue to disk. ``replay_capture.py`` feeds a
+capture back through the receive pipeline.
+
+File format: an 8-byte header (``MAGIC``, version), then one record per
+datagram: ``RECORD`` (seconds since the capture started, direction,
+channel, IPv4 address, port, length) followed by the datagram itself.
+"""
+
+import collections
+import socket
+import struct
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+MAGIC = b'TLCAP'
+VERSION = 1
+HEADER = struct.Struct('<5sBxx')
+RECORD = struct.Struct('<dBB4sHH')
+
+# Directions
+INCOMING = 0
+OUTGOING = 1
+
+# Channels (the socket a datagram used)
+CHANNEL_DISCOVERY = 0
+CHANNEL_AUDIO = 1
+CHANNEL_CONTROL = 2
+
+CHANNEL_NAMES = {CHANNEL_DISCOVERY: 'discovery', CHANNEL_AUDIO: 'audio', CHANNEL_CONTROL: 'control'}
+
+
+class CapturedPacket(NamedTuple):
+    """One datagram read back from a capture file."""
+    timestamp: float
+    direction: int
+    channel: int
+    address: tuple
+    data: bytes
+
+
+class PacketCapture:
+    """Records datagrams to a capture file from a background writer thread.
+
+    If the writer falls more than ``max_pending`` datagrams behind, new
+    ones are dropped (and counted) rather than slowing the network threads.
+    """
+
+    def __init__(self, path: str, max_pending: int = 8192, flush_interval: float = 0.1):
+        self.path = path
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.started_at = time.perf_counter()
+
+        self._pending = collections.deque()
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+        self._running = True
+        self._wakeup = threading.Event()
+        self._writer = threading.Thread(target=self._writer_worker, name='packet-capture', daemon=True)
+        self._writer.start()
+
+        # Metrics
+        self.recorded = 0
+        self.dropped = 0
+        self.bytes_written = HEADER.size
+
+    def record(self, direction: int, channel: int, address: tuple, data: bytes):
+        """Queue a datagram for writing. The data is copied, so pooled buffers may be reused."""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((time.perf_counter(), direction, channel, address, bytes(data)))
+
+    def _writer_worker(self):
+        """Worker thread that writes queued datagrams in batches."""
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._write_pending()
+
+        self._write_pending()
+
+    def _write_pending(self):
+        """Write every queued datagram to the file."""
+        pending = self._pending
+        chunks = []
+        count = 0
+
+        while pending:
+            timestamp, direction, channel, address, data = pending.popleft()
+            try:
+                packed_address = socket.inet_aton(address[0])
+            except OSError:
+                packed_address = bytes(4)
+            chunks.append(RECORD.pack(timestamp - self.started_at, direction, channel,
+                                      packed_address, address[1], len(data)))
+            chunks.append(data)
+            count += 1
+
+        if chunks:
+            data = b''.join(chunks)
+            self._file.write(data)
+            self._file.flush()
+            self.recorded += count
+            self.bytes_written += len(data)
+
+    def close(self):
+        """Write what is queued and close the file."""
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup.set()
+        self._writer.join(timeout=5.0)
+        self._file.close()
+
+    def stats(self) -> dict:
+        """Get capture metrics."""
+        return {
+            'path': self.path,
+            'recorded': self.recorded,
+            'pending': len(self._pending),
+            'dropped': self.dropped,
+            'bytes_written': self.bytes_written,
+        }
+
+
+def read_capture(path: str) -> Iterator[CapturedPacket]:
+    """Read the datagrams in a capture file, in the order they were recorded."""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not a capture file")
+        magic, version = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} capture file")
+
+        while True:
+            record = f.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return  # End of file, or a record cut short when the app stopped
+            timestamp, direction, channel, packed_address, port, length = RECORD.unpack(record)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield CapturedPacket(timestamp, direction, channel, (socket.inet_ntoa(packed_address), port), data)
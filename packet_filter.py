@@ -0,0 +1,154 @@
+"""
+Early packet filtering for the intercom sockets.
+
+Every datagram is checked against the allowed networks and a per-source
+token bucket before anything is parsed, so traffic from outside the shop
+networks or a flooding host is dropped in microseconds instead of costing
+a JSON decode, an audio decode and a GUI update.
+"""
+
+import socket
+import struct
+from typing import Dict, Iterable, List, Optional
+
+from clock import Clock, system_clock
+
+# Networks a LAN intercom may hear from when external access is blocked
+PRIVATE_NETWORKS = [
+    '10.0.0.0/8',
+    '172.16.0.0/12',
+    '192.168.0.0/16',
+    '169.254.0.0/16',
+    '127.0.0.0/8',
+]
+
+_IPV4 = struct.Struct('!I')
+
+
+def ip_to_int(address: str) -> int:
+    """Convert a dotted IPv4 address to an integer."""
+    return _IPV4.unpack(socket.inet_aton(address))[0]
+
+
+class PrefixIndex:
+    """Set of IPv4 networks with lookups of one hash probe per distinct prefix length."""
+
+    def __init__(self, networks: Iterable[str] = ()):
+        self._prefixes: Dict[int, set] = {}
+        self._lookups: List[tuple] = []
+        for network in networks:
+            self.add(network)
+
+    def add(self, network: str):
+        """Add a network in CIDR notation (a bare address means /32)."""
+        address, _, length = network.partition('/')
+        prefix_len = int(length) if length else 32
+        if not 0 <= prefix_len <= 32:
+            raise ValueError(f"Invalid prefix length in {network}")
+
+        shift = 32 - prefix_len
+        self._prefixes.setdefault(prefix_len, set()).add(ip_to_int(address) >> shift)
+        self._lookups = sorted((32 - length, keys) for length, keys in self._prefixes.items())
+
+    def __bool__(self) -> bool:
+        return bool(self._prefixes)
+
+    def contains(self, address: int) -> bool:
+        """Check whether an address (as an integer) is inside any network."""
+        for shift, keys in self._lookups:
+            if (address >> shift) in keys:
+                return True
+        return False
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second up to ``burst``."""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+
+class PacketFilter:
+    """Accepts or drops datagrams by source address before they are parsed."""
+
+    def __init__(self, allowed: Optional[PrefixIndex], rate: float, burst: Optional[float] = None,
+                 max_sources: int = 1024, clock: Optional[Clock] = None):
+        self.allowed = allowed
+        self.rate = rate
+        self.burst = burst if burst is not None else rate * 2
+        self.max_sources = max_sources
+        self.clock = clock or system_clock
+
+        self._decisions: Dict[str, bool] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+        # Metrics
+        self.accepted = 0
+        self.dropped_blocked = 0
+        self.dropped_rate = 0
+
+    def accept(self, address: str) -> bool:
+        """Check a datagram's source address. Returns False if it should be dropped."""
+        allowed = self._decisions.get(address)
+        if allowed is None:
+            allowed = self.allowed is None or self.allowed.contains(ip_to_int(address))
+            if len(self._decisions) >= self.max_sources:
+                self._decisions.clear()
+            self._decisions[address] = allowed
+
+        if not allowed:
+            self.dropped_blocked += 1
+            return False
+
+        if self.rate > 0:
+            now = self.clock.monotonic()
+            bucket = self._buckets.get(address)
+            if bucket is None:
+                if len(self._buckets) >= self.max_sources:
+                    self._prune(now)
+                bucket = self._buckets[address] = TokenBucket(self.burst, now)
+            else:
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens < 1.0:
+                self.dropped_rate += 1
+                return False
+            bucket.tokens -= 1.0
+
+        self.accepted += 1
+        return True
+
+    def _prune(self, now: float):
+        """Forget sources whose buckets have refilled, or all of them if none have."""
+        full = [address for address, bucket in self._buckets.items()
+                if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst]
+        for address in full:
+            del self._buckets[address]
+        if len(self._buckets) >= self.max_sources:
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        """Get accept and drop counters."""
+        return {
+            'accepted': self.accepted,
+            'dropped_blocked': self.dropped_blocked,
+            'dropped_rate': self.dropped_rate,
+        }
+
+
+def build_allowed_networks(allowed_networks: List[str], block_external_access: bool) -> Optional[PrefixIndex]:
+    """Build the allow list from the security configuration.
+
+    Explicit ``allowed_networks`` win; otherwise private and loopback ranges
+    are allowed when external access is blocked. Returns None when every
+    source is allowed.
+    """
+    if allowed_networks:
+        return PrefixIndex(list(allowed_networks) + ['127.0.0.0/8'])
+    if block_external_access:
+        return PrefixIndex(PRIVATE_NETWORKS)
+    return None
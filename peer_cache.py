@@ -0,0 +1,65 @@
+"""
+On-disk cache of recently seen peers.
+
+Saved next to ``settings.json`` so the next launch can list the peers it
+knew about straight away, as "likely online", and probe them directly
+instead of waiting for their broadcasts.
+"""
+
+import json
+import os
+import time
+from typing import Iterable, List, Optional
+
+CACHE_VERSION = 1
+
+# Order of the fields in each cached row
+_FIELDS = ('username', 'shop_location', 'ip_address', 'port', 'last_seen',
+           'max_packet_size', 'chunk_size', 'codecs')
+
+
+def load_peers(path: str, max_age: float, now: Optional[float] = None) -> List[dict]:
+    """Load the fields of cached peers seen within ``max_age`` seconds."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"Error loading peer cache: {e}")
+        return []
+
+    if cache.get('version') != CACHE_VERSION:
+        return []
+
+    cutoff = (time.time() if now is None else now) - max_age
+    peers = []
+    for row in cache.get('peers', []):
+        fields = dict(zip(_FIELDS, row))
+        if len(fields) == len(_FIELDS) and fields['last_seen'] >= cutoff:
+            peers.append(fields)
+
+    return peers
+
+
+def save_peers(path: str, users: Iterable, max_age: float, max_peers: int = 1000, now: Optional[float] = None):
+    """Save the most recently seen peers, replacing the cache file atomically."""
+    cutoff = (time.time() if now is None else now) - max_age
+    recent = sorted(
+        (user for user in users if user.last_seen >= cutoff),
+        key=lambda user: user.last_seen,
+        reverse=True
+    )[:max_peers]
+
+    cache = {
+        'version': CACHE_VERSION,
+        'peers': [[getattr(user, name) for name in _FIELDS] for user in recent],
+    }
+
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, separators=(',', ':'))
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"Error saving peer cache: {e}")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Accelerated simulation of a terminal's peer directory on a virtual clock.
+
+One NetworkManager, driven by a ``VirtualClock`` instead of its worker
+threads, hears presence and offline messages from thousands of simulated
+peers over hours of shop time. Peers come online, repeat their presence
+every ``presence_interval`` while they are up, and go offline and come
+back; some crash without saying so, and some are retired for good and
+replaced by new ones, so the directory sees the churn of a long day. The
+manager's periodic work (``_control_tick``: presence, expiry of silent
+peers, gossip rounds, probe expiry, pruning) runs at the interval its
+control worker would run it.
+
+At the end it checks that the directory agrees with what every peer last
+announced, allowing crashed peers the presence timeout to be noticed, and
+that retired peers were pruned, then runs again with the same seed and
+checks the result is identical.
+
+Usage: python presence_simulation.py [--peers 2000] [--hours 12] [--prune-hours 4] [--gossip]
+                                     [--seed 1]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import random
+import sys
+import time
+from typing import Optional
+
+from clock import VirtualClock
+from config import NETWORK_CONFIG
+from gossip import new_version
+from network_manager import NetworkManager
+
+
+class SimulatedNetworkManager(NetworkManager):
+    """NetworkManager that sends nothing and keeps nothing on disk.
+
+    Datagrams it would send are counted instead, and the interface list is
+    not re-enumerated, so the run depends only on the seed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.datagrams_sent = 0
+        self.bytes_sent = 0
+
+    def _send_discovery(self, messages: list):
+        self.datagrams_sent += len(messages)
+        self.bytes_sent += sum(len(message) for message, _ in messages)
+
+    def _send_control_datagram(self, data: bytes, address: tuple):
+        self.datagrams_sent += 1
+        self.bytes_sent += len(data)
+
+    def _send_audio_datagram(self, data: bytes, address: tuple):
+        pass
+
+    def _save_peer_cache(self):
+        self._peer_cache_dirty = False
+        self._last_peer_cache_save = self.clock.time()
+
+    def _refresh_interfaces(self):
+        pass
+
+
+class Peer:
+    """A simulated terminal that comes and goes."""
+
+    def __init__(self, index: int, generation: int = 0):
+        self.index = index
+        self.generation = generation
+        self.online = False
+        self.session = 0       # bumped each time it comes online, ending the last session's heartbeats
+        self.crashed_at = None
+        self.retired_at = None
+
+    @property
+    def username(self) -> str:
+        return f"terminal{self.index}" + (f"-{self.generation}" if self.generation else '')
+
+    @property
+    def ip_address(self) -> str:
+        return f"10.{self.index // 65536 % 256}.{self.index // 256 % 256}.{self.index % 256}"
+
+    def message(self, kind: str, now: float) -> bytes:
+        return json.dumps({
+            'type': kind,
+            'username': self.username,
+            'shop_location': f"Shop {self.index // 4}",
+            'ip_address': self.ip_address,
+            'port': NETWORK_CONFIG['discovery_port'] + 1,
+            'version': new_version(now),
+            'timestamp': now,
+        }).encode()
+
+
+def simulate(peers: int, hours: float, prune_age: float, gossip: bool, seed: int) -> dict:
+    """Run the simulation and return its results."""
+    rng = random.Random(seed)
+    random.seed(seed)  # NetworkManager picks gossip targets with the random module
+    clock = VirtualClock()
+    network = SimulatedNetworkManager('simulator', 'Simulation', clock=clock)
+    network.running = True
+    network.user_prune_age = prune_age
+    network.gossip_enabled = gossip
+
+    population = [Peer(index) for index in range(peers)]
+    retired = []
+    counts = {'presence': 0, 'heartbeat': 0, 'offline': 0, 'retired': 0, 'crashed': 0}
+
+    def announce(peer: Peer, kind: str, counted_as: Optional[str] = None):
+        counts[counted_as or kind] += 1
+        data = peer.message(kind, clock.time())
+        network._handle_discovery_datagram(data, (peer.ip_address, NETWORK_CONFIG['discovery_port']))
+
+    def come_online(peer: Peer):
+        if peer.retired_at is not None:
+            return
+        peer.online = True
+        peer.crashed_at = None
+        peer.session += 1
+        announce(peer, 'presence')
+        clock.call_later(network.presence_interval, lambda session=peer.session: heartbeat(peer, session))
+        # Shifts of about two hours
+        clock.call_later(rng.expovariate(1 / 7200.0), lambda: go_offline(peer))
+
+    def heartbeat(peer: Peer, session: int):
+        if peer.online and peer.session == session:
+            announce(peer, 'presence', 'heartbeat')
+            clock.call_later(network.presence_interval, lambda: heartbeat(peer, session))
+
+    def go_offline(peer: Peer):
+        peer.online = False
+        if rng.random() < 0.1:
+            # Crashed or lost power: never says it is going
+            peer.crashed_at = clock.time()
+            counts['crashed'] += 1
+        else:
+            announce(peer, 'offline')
+        if rng.random() < 0.2:
+            # Renamed or replaced: the old name never comes back, a new terminal takes its place
+            peer.retired_at = clock.time()
+            retired.append(peer)
+            counts['retired'] += 1
+            replacement = Peer(peer.index, peer.generation + 1)
+            population[peer.index] = replacement
+            clock.call_later(rng.expovariate(1 / 600.0), lambda: come_online(replacement))
+        else:
+            clock.call_later(rng.expovariate(1 / 3600.0), lambda: come_online(peer))
+
+    for peer in population:
+        clock.call_later(rng.uniform(0.0, 600.0), lambda peer=peer: come_online(peer))
+
+    tick_interval = min(network.report_interval, network.ping_interval) / 2
+    clock.call_every(tick_interval, network._control_tick)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        clock.advance(hours * 3600)
+    elapsed = time.perf_counter() - started
+
+    # The directory should match what every current peer last announced, once a crash has had time to show
+    notice = network.presence_timeout + network.presence_interval
+    mismatched = 0
+    for peer in population:
+        user = network.users.get(f"{peer.username}@Shop {peer.index // 4}")
+        if peer.crashed_at is not None and clock.time() - peer.crashed_at < notice:
+            continue
+        if peer.online != (user is not None and user.is_online):
+            mismatched += 1
+
+    # Retired peers should be forgotten once they have been offline for the prune age (checked each minute)
+    overdue = sum(
+        1 for peer in retired
+        if clock.time() - peer.retired_at > prune_age + 60.0
+        and f"{peer.username}@Shop {peer.index // 4}" in network.users
+    )
+
+    directory = sorted((key, user.is_online, user.last_seen) for key, user in network.users.items())
+    return {
+        'elapsed': elapsed,
+        'messages': counts['presence'] + counts['offline'],
+        'retired': counts['retired'],
+        'crashed': counts['crashed'],
+        'heartbeats': counts['heartbeat'],
+        'online': sum(1 for peer in population if peer.online),
+        'directory': len(network.users),
+        'gossip_entries': len(network.gossip.entries),
+        'mismatched': mismatched,
+        'overdue': overdue,
+        'datagrams_sent': network.datagrams_sent,
+        'bytes_sent': network.bytes_sent,
+        'digest': hashlib.sha256(repr(directory).encode()).hexdigest()[:16],
+    }
+
+
+def main():
+    """Simulate a day of peer churn and check the directory kept up."""
+    parser = argparse.ArgumentParser(description="Simulate peer churn against one terminal on a virtual clock")
+    parser.add_argument('--peers', type=int, default=2000, help="simulated peers")
+    parser.add_argument('--hours', type=float, default=12.0, help="hours of shop time to simulate")
+    parser.add_argument('--prune-hours', type=float, default=4.0, help="hours offline before a peer is forgotten")
+    parser.add_argument('--gossip', action='store_true', help="send gossip rounds, as in gossip mode")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print("Tradelink Intercom presence simulation")
+    print("=" * 50)
+    print(f"{args.peers} peers over {args.hours:g} h of shop time, pruned after {args.prune_hours:g} h offline")
+
+    result = simulate(args.peers, args.hours, args.prune_hours * 3600, args.gossip, args.seed)
+    print(f"\n  Simulated in         {result['elapsed']:8.2f} s "
+          f"({args.hours * 3600 / result['elapsed']:,.0f}x real time)")
+    print(f"  Messages heard       {result['messages']:8d}")
+    print(f"  Heartbeats heard     {result['heartbeats']:8d}")
+    print(f"  Peers crashed        {result['crashed']:8d}")
+    print(f"  Peers retired        {result['retired']:8d}")
+    print(f"  Peers online         {result['online']:8d}")
+    print(f"  Directory entries    {result['directory']:8d}")
+    print(f"  Gossip entries       {result['gossip_entries']:8d}")
+    print(f"  Datagrams sent       {result['datagrams_sent']:8d} ({result['bytes_sent'] / 1e6:.1f} MB)")
+    print(f"  Directory digest     {result['digest']:>16}")
+
+    failures = []
+    if result['mismatched']:
+        failures.append(f"{result['mismatched']} peers shown in the wrong state")
+    if result['overdue']:
+        failures.append(f"{result['overdue']} retired peers not pruned")
+
+    repeat = simulate(args.peers, args.hours, args.prune_hours * 3600, args.gossip, args.seed)
+    if {**repeat, 'elapsed': 0} != {**result, 'elapsed': 0}:
+        failures.append("a second run with the same seed gave a different result")
+
+    print()
+    for failure in failures:
+        print(f"✗ {failure}")
+    if failures:
+        return 1
+
+    print("✓ Directory matches every peer, retired peers were pruned, and the run is repeatable")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Low-latency scheduling and socket tuning.
+
+Shop PCs also run point-of-sale software, which competes with the intercom's
+audio and network threads for the CPU. With
+``PERFORMANCE_CONFIG['low_latency_mode']`` those threads raise their own
+scheduling priority and the audio socket gets larger buffers and a DSCP
+marking that managed switches can prioritize. The OS may refuse any of
+these (no privileges, no QoS policy), so every setting records what was
+asked for and what took effect in ``diagnostics``.
+"""
+
+import os
+import socket
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+# Windows thread priorities: THREAD_PRIORITY_TIME_CRITICAL and THREAD_PRIORITY_HIGHEST
+_WINDOWS_PRIORITIES = {'audio': 15, 'network': 2}
+
+# Linux real-time (SCHED_FIFO) priorities, and the nice values used when those are refused
+_FIFO_PRIORITIES = {'audio': 70, 'network': 60}
+_NICE_VALUES = {'audio': -15, 'network': -10}
+
+
+class Diagnostics:
+    """Requested and effective value of each low-latency setting."""
+
+    def __init__(self):
+        self.settings: Dict[str, Tuple[object, object, bool]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, requested, effective, applied: bool):
+        """Record the outcome of a setting."""
+        with self._lock:
+            self.settings[name] = (requested, effective, applied)
+
+    def report(self) -> str:
+        """Format the settings as a report, marking the ones that did not take effect."""
+        with self._lock:
+            settings = sorted(self.settings.items())
+
+        if not settings:
+            return "Low-latency mode: no settings applied yet"
+
+        lines = ["Low-latency mode:"]
+        for name, (requested, effective, applied) in settings:
+            lines.append(f"  {'✓' if applied else '✗'} {name:<32} requested {requested}, effective {effective}")
+        return "\n".join(lines)
+
+
+diagnostics = Diagnostics()
+
+
+def raise_thread_priority(role: str) -> bool:
+    """Raise the calling thread's scheduling priority for its role ('audio' or 'network')."""
+    name = f"{threading.current_thread().name} priority"
+
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        thread = kernel32.GetCurrentThread()
+        requested = _WINDOWS_PRIORITIES[role]
+        applied = bool(kernel32.SetThreadPriority(thread, requested))
+        diagnostics.record(name, requested, kernel32.GetThreadPriority(thread), applied)
+
+        # Let the multimedia class scheduler boost audio threads as it does for players
+        if role == 'audio':
+            try:
+                task_index = ctypes.c_ulong(0)
+                handle = ctypes.windll.avrt.AvSetMmThreadCharacteristicsW("Pro Audio", ctypes.byref(task_index))
+                diagnostics.record(f"{name} MMCSS", "Pro Audio", "Pro Audio" if handle else "none", bool(handle))
+            except (AttributeError, OSError) as e:
+                diagnostics.record(f"{name} MMCSS", "Pro Audio", f"unavailable ({e})", False)
+        return applied
+
+    # On Linux, pid 0 means the calling thread
+    requested = f"SCHED_FIFO {_FIFO_PRIORITIES[role]}"
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(_FIFO_PRIORITIES[role]))
+        diagnostics.record(name, requested, f"SCHED_FIFO {os.sched_getparam(0).sched_priority}", True)
+        return True
+    except (AttributeError, OSError) as e:
+        refused = f"refused ({e.__class__.__name__})"
+
+    # Fall back to a lower nice value for just this thread
+    nice = _NICE_VALUES[role]
+    try:
+        thread_id = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, thread_id, nice)
+        effective = os.getpriority(os.PRIO_PROCESS, thread_id)
+        diagnostics.record(name, requested, f"{refused}, nice {effective}", effective <= nice)
+        return effective <= nice
+    except (AttributeError, OSError) as e:
+        diagnostics.record(name, requested, f"{refused}, nice refused ({e.__class__.__name__})", False)
+        return False
+
+
+def tune_socket(sock: socket.socket, name: str, buffer_size: int, tos: Optional[int] = None):
+    """Enlarge a socket's buffers and optionally set its TOS byte, recording what took effect."""
+    for option, label in ((socket.SO_RCVBUF, 'SO_RCVBUF'), (socket.SO_SNDBUF, 'SO_SNDBUF')):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, buffer_size)
+            # Linux reports double the size it was given, capped by net.core.[rw]mem_max
+            effective = sock.getsockopt(socket.SOL_SOCKET, option)
+            diagnostics.record(f"{name} {label}", buffer_size, effective, effective >= buffer_size)
+        except OSError as e:
+            diagnostics.record(f"{name} {label}", buffer_size, f"refused ({e})", False)
+
+    if tos is None:
+        return
+
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, tos)
+        effective = sock.getsockopt(socket.IPPROTO_IP, socket.IP_TOS)
+        if sys.platform == 'win32':
+            # Windows accepts IP_TOS but only marks packets under a Group Policy QoS rule
+            effective = f"{effective:#04x} (needs a QoS policy to be sent)"
+            diagnostics.record(f"{name} IP_TOS", f"{tos:#04x}", effective, False)
+        else:
+            diagnostics.record(f"{name} IP_TOS", f"{tos:#04x}", f"{effective:#04x}", effective == tos)
+    except (AttributeError, OSError) as e:
+        diagnostics.record(f"{name} IP_TOS", f"{tos:#04x}", f"refused ({e})", False)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Replay a datagram capture through the Tradelink Intercom receive pipeline.
+
+Feeds the audio datagrams recorded with ``NETWORK_CONFIG['capture_file']``
+through NetworkManager's packet handling (parsing, talk spurts, loss and
+jitter statistics, FEC recovery, decoding) into AudioManager's playout
+queues, either at their original timing or as fast as possible. Played
+audio goes to a WAV file or is discarded, so no sound hardware is needed.
+
+Usage: python replay_capture.py CAPTURE [--fast] [--output replay.wav]
+                                [--direction in|out] [--profile]
+"""
+
+import argparse
+import cProfile
+import pstats
+import sys
+import time
+
+import packet_capture
+from audio_backends import FileBackend, NullBackend
+from audio_manager import AudioManager
+from config import AUDIO_CONFIG
+from network_manager import NetworkManager
+
+
+class ReplayNetworkManager(NetworkManager):
+    """NetworkManager that only receives: nothing is sent while replaying.
+
+    Audio keys are not in the capture, so authenticated packets are
+    accepted without checking their tags.
+    """
+
+    def _check_authentication(self, sender_key: str, packet_data: dict, data: bytes, addr) -> bool:
+        return True
+
+    def _send_audio_datagram(self, data: bytes, address: tuple):
+        pass
+
+    def _send_control_datagram(self, data: bytes, address: tuple):
+        pass
+
+    def _send_discovery(self, messages: list):
+        pass
+
+
+def replay(packets: list, network: NetworkManager, fast: bool) -> float:
+    """Feed packets to the receive pipeline and return the time spent handling them."""
+    handling = 0.0
+    first = packets[0].timestamp
+    start = time.perf_counter()
+
+    for packet in packets:
+        if not fast:
+            delay = start + (packet.timestamp - first) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        handle_start = time.perf_counter()
+        try:
+            network._handle_audio_packet(packet.data, packet.address)
+        except Exception as e:
+            print(f"Error handling packet from {packet.address[0]}: {e}")
+        handling += time.perf_counter() - handle_start
+
+    return handling
+
+
+def main():
+    """Replay a capture file and report what the receive pipeline made of it."""
+    parser = argparse.ArgumentParser(description="Replay a datagram capture through the receive pipeline")
+    parser.add_argument('capture', help="capture file recorded with NETWORK_CONFIG['capture_file']")
+    parser.add_argument('--fast', action='store_true', help="replay as fast as possible instead of in real time")
+    parser.add_argument('--output', help="write the played audio to this WAV file")
+    parser.add_argument('--direction', choices=('in', 'out'), default='in',
+                        help="replay the audio this terminal received (in) or sent (out)")
+    parser.add_argument('--profile', action='store_true', help="profile the receive pipeline")
+    args = parser.parse_args()
+
+    direction = packet_capture.INCOMING if args.direction == 'in' else packet_capture.OUTGOING
+    try:
+        packets = [
+            packet for packet in packet_capture.read_capture(args.capture)
+            if packet.channel == packet_capture.CHANNEL_AUDIO and packet.direction == direction
+        ]
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+
+    if not packets:
+        print("✗ No audio datagrams to replay")
+        return 1
+
+    duration = packets[-1].timestamp - packets[0].timestamp
+    print("Tradelink Intercom capture replay")
+    print("=" * 50)
+    print(f"{len(packets)} audio datagrams over {duration:.1f} s, "
+          f"replayed {'as fast as possible' if args.fast else 'in real time'}")
+
+    if args.output:
+        backend = FileBackend(sink_path=args.output, realtime=not args.fast, keep_output=False)
+    else:
+        backend = NullBackend(realtime=not args.fast)
+    audio_manager = AudioManager(AUDIO_CONFIG['sample_rate'], AUDIO_CONFIG['chunk_size'], backend)
+
+    network = ReplayNetworkManager('replay', 'Replay')
+    frames = [0]
+    spurts = [0]
+    queue_stats = {}
+
+    def on_audio(packet):
+        frames[0] += 1
+        audio_manager.play_audio(packet.audio_data, f"{packet.sender}@{packet.sender_shop}")
+
+    def on_spurt_end(spurt):
+        source = f"{spurt.sender}@{spurt.sender_shop}"
+        spurts[0] += 1
+        if source in audio_manager.playout_queues:
+            queue_stats[source] = audio_manager.playout_queues[source].stats()
+        audio_manager.release_source(source)
+
+    network.on_audio_received = on_audio
+    network.on_spurt_end = on_spurt_end
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    started = time.perf_counter()
+    handling = replay(packets, network, args.fast)
+    elapsed = time.perf_counter() - started
+    if profiler:
+        profiler.disable()
+
+    # Let playout finish, then end any talk spurt the capture cut off
+    time.sleep(audio_manager.playout_idle_timeout if not args.fast else 0.2)
+    network._expire_incoming_spurts(time.time() + network.spurt_timeout + 1)
+    played = sum(stream.frames_written for stream in backend.output_streams) / AUDIO_CONFIG['sample_rate']
+    audio_manager.cleanup()
+
+    print(f"\n  Replayed in        {elapsed:8.2f} s")
+    print(f"  Handling           {handling / len(packets) * 1e6:8.1f} us per datagram")
+    print(f"  Frames delivered   {frames[0]:8d}")
+    print(f"  Talk spurts ended  {spurts[0]:8d}")
+    print(f"  Audio played       {played:8.2f} s")
+
+    for sender_key, stats in network.receiver_stats.items():
+        report = stats.make_report()
+        print(f"  {sender_key}: {stats.received} received, {report['cumulative_lost']} lost, "
+              f"jitter {report['jitter_ms']} ms{' (not meaningful when fast)' if args.fast else ''}")
+    for source, stats in queue_stats.items():
+        print(f"  Playout {source}: {stats}")
+
+    if profiler:
+        print()
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Shared-memory ring buffer between two processes.
+
+One process writes variable-length records and the other reads them, with
+no locks and no pickling: the writer only ever advances the write counter
+and the reader only ever advances the read counter. Used to stream meters
+and audio between the audio engine process and the GUI.
+"""
+
+import struct
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+# capacity, bytes ever written, bytes ever read; padded to a cache line
+_HEADER = struct.Struct('=QQQ')
+_HEADER_SIZE = 64
+_WRITE_OFFSET = 8
+_READ_OFFSET = 16
+_COUNTER = struct.Struct('=Q')
+_LENGTH = struct.Struct('=I')
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Open an existing block without registering it for cleanup by this process."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks, and may warn about the block at exit
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedRing:
+    """Single-producer, single-consumer ring of byte records in shared memory.
+
+    Create it with a ``size`` in the owning process and pass ``name`` to the
+    other process, which opens it with ``SharedRing(name)``. A write that
+    does not fit is dropped rather than blocking the producer.
+    """
+
+    def __init__(self, name: Optional[str] = None, size: int = 65536):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + size)
+            self.owner = True
+            _HEADER.pack_into(self.shm.buf, 0, size, 0, 0)
+        else:
+            self.shm = _attach(name)
+            self.owner = False
+
+        self.name = self.shm.name
+        self.capacity = _HEADER.unpack_from(self.shm.buf, 0)[0]
+        self._data = self.shm.buf[_HEADER_SIZE:_HEADER_SIZE + self.capacity]
+        self.dropped = 0
+
+    def _counter(self, offset: int) -> int:
+        return _COUNTER.unpack_from(self.shm.buf, offset)[0]
+
+    def _copy_in(self, position: int, data):
+        """Copy bytes into the ring at an absolute position, wrapping at the end."""
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        if first < len(data):
+            self._data[:len(data) - first] = data[first:]
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        """Copy bytes out of the ring at an absolute position, wrapping at the end."""
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        if first == length:
+            return bytes(self._data[start:start + length])
+        return bytes(self._data[start:]) + bytes(self._data[:length - first])
+
+    def write(self, data: bytes) -> bool:
+        """Append a record. Returns False (and counts a drop) if the ring is full."""
+        write_pos = self._counter(_WRITE_OFFSET)
+        free = self.capacity - (write_pos - self._counter(_READ_OFFSET))
+        if _LENGTH.size + len(data) > free:
+            self.dropped += 1
+            return False
+
+        self._copy_in(write_pos, _LENGTH.pack(len(data)))
+        self._copy_in(write_pos + _LENGTH.size, memoryview(data).cast('B'))
+
+        # Publish the record only once it is fully written
+        _COUNTER.pack_into(self.shm.buf, _WRITE_OFFSET, write_pos + _LENGTH.size + len(data))
+        return True
+
+    def read(self) -> Optional[bytes]:
+        """Remove and return the oldest record, or None if the ring is empty."""
+        read_pos = self._counter(_READ_OFFSET)
+        if read_pos == self._counter(_WRITE_OFFSET):
+            return None
+
+        (length,) = _LENGTH.unpack(self._copy_out(read_pos, _LENGTH.size))
+        data = self._copy_out(read_pos + _LENGTH.size, length)
+        _COUNTER.pack_into(self.shm.buf, _READ_OFFSET, read_pos + _LENGTH.size + length)
+        return data
+
+    def drain(self) -> List[bytes]:
+        """Remove and return every available record, oldest first."""
+        records = []
+        record = self.read()
+        while record is not None:
+            records.append(record)
+            record = self.read()
+        return records
+
+    def close(self):
+        """Detach from the ring, and free it if this process created it."""
+        self._data.release()
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Soak test for the Tradelink Intercom network and audio managers.
+
+Shop PCs run the intercom all day, so slow leaks and gradual slowdowns
+matter more than anything a short test shows. This runs two headless
+terminals on loopback addresses (127.0.0.1 and 127.0.0.2) with file
+backend audio, and drives them with:
+
+- synthetic push-to-talk traffic between them, in both directions;
+- discovery churn from simulated peers that come online, repeat their
+  presence, and go offline (or crash without saying so) and are replaced
+  by new ones, as terminals are renamed and replaced;
+- a third terminal (127.0.0.4) that is killed early in the run without
+  sending offline, as when a shop PC loses power. By the end both
+  terminals must have shown it offline and forgotten it.
+
+``--speed`` compresses shop time: peers churn and talk spurts start that
+many times faster, and the presence interval, presence timeout and peer
+pruning age are divided by it, so hours of directory churn fit in
+minutes. Audio itself still runs in real time.
+
+Every ``--interval`` seconds it samples RSS, memory traced by tracemalloc
+and its top allocation sites, the thread count, the per-peer state both
+terminals hold, and the delivery latency of audio frames. At the end it
+compares the second quarter of the run with the last quarter and fails if
+any of them kept growing.
+
+Usage: python soak_test.py [--duration SECONDS] [--interval SECONDS] [--speed N]
+                           [--peers N] [--report soak.csv]
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from audio_backends import FileBackend
+from audio_manager import AudioManager
+from config import NETWORK_CONFIG, SHOP_CONFIG
+from gossip import new_version
+from network_manager import NetworkManager
+
+# Loopback addresses of the two terminals and of the simulated peers
+ADDRESSES = ('127.0.0.1', '127.0.0.2')
+GHOST_ADDRESS = '127.0.0.3'
+CRASH_ADDRESS = '127.0.0.4'  # the terminal that is killed without going offline
+
+
+class Sample(NamedTuple):
+    """Measurements taken at one point of the run."""
+    elapsed: float
+    rss_mb: float
+    traced_mb: float
+    threads: int
+    users: int
+    peer_state: int
+    frames: int
+    p50_ms: float
+    p99_ms: float
+
+
+# (field, label, allowed absolute growth, allowed relative growth)
+DRIFT_LIMITS = [
+    ('rss_mb', 'RSS (MB)', 8.0, 0.10),
+    ('traced_mb', 'Python heap (MB)', 2.0, 0.20),
+    ('threads', 'Threads', 2, 0.0),
+    ('users', 'Directory entries', 10, 0.20),
+    ('peer_state', 'Per-peer state entries', 10, 0.20),
+    ('p99_ms', 'Delivery latency p99 (ms)', 5.0, 0.50),
+]
+
+
+def rss_bytes() -> int:
+    """Get the resident set size of this process."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        # Peak rather than current RSS, in KB on Linux
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peer_state_size(network: NetworkManager) -> int:
+    """Count the per-peer entries a network manager holds."""
+    return sum(len(state) for state in (
+        network.receiver_stats, network.receiver_addresses, network.link_controllers,
+        network.packetizers, network.send_queues, network._ended_sessions, network.gossip.entries,
+    ))
+
+
+class Terminal:
+    """One headless intercom terminal: a network manager and a file-backend audio manager."""
+
+    def __init__(self, name: str, address: str, workdir: str, latencies: list, lock: threading.Lock):
+        self.username = name
+        self.shop_location = f"Soak {name[-1].upper()}"
+        self.address = address
+        self.latencies = latencies
+        self.lock = lock
+
+        noise = (np.random.default_rng(len(name)).standard_normal(44100 * 5) * 3000).astype(np.int16)
+        self.backend = FileBackend(noise, realtime=True, loop=True, keep_output=False)
+        self.audio = AudioManager(44100, 1024, self.backend)
+
+        NETWORK_CONFIG['voice_spool_dir'] = os.path.join(workdir, f"{name}-spool")
+        self.network = NetworkManager(name, self.shop_location)
+        self.network.bind_address = address
+        self.network.peer_cache_file = os.path.join(workdir, f"{name}-peers.json")
+        self.network.on_audio_received = self.on_audio
+        self.network.on_spurt_end = lambda spurt: self.audio.release_source(f"{spurt.sender}@{spurt.sender_shop}")
+        self.network.start()
+
+    def on_audio(self, packet):
+        with self.lock:
+            self.latencies.append((time.time() - packet.timestamp) * 1000)
+        self.audio.play_audio(packet.audio_data, f"{packet.sender}@{packet.sender_shop}")
+
+    def introduce(self, address: str):
+        """Announce ourselves to a terminal directly, asking it to answer."""
+        presence = self.network._presence_data()
+        presence['probe'] = True
+        self.network._send_discovery([(json.dumps(presence).encode(), address)])
+
+    def talk(self, other: 'Terminal', seconds: float):
+        """Hold push-to-talk to another terminal for a while."""
+        self.audio.start_recording(
+            lambda data: self.network.send_audio(other.username, other.shop_location, data)
+        )
+        time.sleep(seconds)
+        self.audio.stop_recording()
+        self.network.end_talk_spurt(other.username, other.shop_location)
+
+    def stop(self):
+        self.audio.cleanup()
+        self.network.cleanup()
+
+
+def drive_traffic(terminals: List[Terminal], speed: float, stop: threading.Event):
+    """Hold talk spurts between the terminals, with gaps compressed by ``speed``."""
+    rng = random.Random(1)
+    while not stop.is_set():
+        talker, listener = rng.sample(terminals, 2)
+        talker.talk(listener, rng.uniform(0.5, 3.0))
+        # About a call every half minute of shop time
+        stop.wait(max(0.2, rng.uniform(10.0, 50.0) / speed))
+
+
+def drive_churn(peers: int, speed: float, stop: threading.Event):
+    """Simulate peers coming and going: ``peers`` online at a time, one replaced per minute of shop time.
+
+    Online peers repeat their presence every ``presence_interval``, and one
+    in five leaves without sending offline, as if it crashed.
+    """
+    rng = random.Random(2)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((GHOST_ADDRESS, 0))
+    online = []
+    next_ghost = 0
+    last_heartbeat = time.time()
+
+    def announce(kind: str, username: str):
+        message = json.dumps({
+            'type': kind,
+            'username': username,
+            'shop_location': 'Ghost',
+            'ip_address': GHOST_ADDRESS,
+            'port': sock.getsockname()[1],
+            'version': new_version(),
+            'timestamp': time.time(),
+        }).encode()
+        for address in ADDRESSES:
+            sock.sendto(message, (address, NETWORK_CONFIG['discovery_port']))
+
+    while not stop.is_set():
+        # Ramp up quickly, then replace a peer at the compressed rate
+        if len(online) >= peers:
+            username = online.pop(0)
+            if rng.random() >= 0.2:
+                announce('offline', username)
+        username = f"ghost-{next_ghost}"
+        next_ghost += 1
+        online.append(username)
+        announce('presence', username)
+
+        if time.time() - last_heartbeat >= NETWORK_CONFIG['presence_interval']:
+            last_heartbeat = time.time()
+            for username in online:
+                announce('presence', username)
+        stop.wait(0.1 if next_ghost < peers else max(0.1, 60.0 / speed))
+
+    sock.close()
+
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    """Snapshot traced allocations, leaving out tracemalloc's own."""
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def check_drift(samples: List[Sample]) -> List[str]:
+    """Compare the second quarter of the run with the last; return the measurements that grew."""
+    failures = []
+    count = len(samples)
+    if count < 8:
+        print("\n✗ Too few samples to judge drift; run longer or sample more often")
+        return ['samples']
+
+    print("\nDrift (median of the second quarter -> median of the last quarter)")
+    for field, label, absolute, relative in DRIFT_LIMITS:
+        values = [getattr(sample, field) for sample in samples]
+        baseline = statistics.median(values[count // 4:count // 2])
+        final = statistics.median(values[3 * count // 4:])
+        growth = final - baseline
+        drifted = growth > absolute and growth > baseline * relative
+        print(f"  {'✗' if drifted else '✓'} {label:<28} {baseline:9.2f} -> {final:9.2f}")
+        if drifted:
+            failures.append(label)
+    return failures
+
+
+def main():
+    """Run the soak test and report whether anything drifted."""
+    parser = argparse.ArgumentParser(description="Run two headless terminals for a long time and check for drift")
+    parser.add_argument('--duration', type=float, default=600.0, help="seconds to run")
+    parser.add_argument('--interval', type=float, default=10.0, help="seconds between samples")
+    parser.add_argument('--speed', type=float, default=60.0, help="shop seconds per real second for churn and pruning")
+    parser.add_argument('--peers', type=int, default=50, help="simulated peers online at a time")
+    parser.add_argument('--report', help="write the samples to this CSV file")
+    args = parser.parse_args()
+
+    # A peer offline for half an hour of shop time is forgotten; presence is compressed alike
+    NETWORK_CONFIG['user_prune_age'] = max(2.0, 1800.0 / args.speed)
+    NETWORK_CONFIG['presence_interval'] = max(0.5, NETWORK_CONFIG['presence_interval'] / args.speed)
+    SHOP_CONFIG['user_timeout'] = max(2.0, SHOP_CONFIG['user_timeout'] / args.speed)
+
+    print("Tradelink Intercom soak test")
+    print("=" * 50)
+    print(f"{args.duration:.0f} s at {args.speed:g}x shop time, {args.peers} simulated peers, "
+          f"peers shown offline after {SHOP_CONFIG['user_timeout']:.0f} s silent and pruned after "
+          f"{NETWORK_CONFIG['user_prune_age']:.0f} s offline")
+
+    tracemalloc.start()
+    latencies: List[float] = []
+    lock = threading.Lock()
+    stop = threading.Event()
+    workdir = tempfile.TemporaryDirectory(prefix='soak-')
+    terminals: List[Terminal] = []
+    crasher: Optional[Terminal] = None
+    crashed = False
+
+    try:
+        for name, address in zip(('soak-a', 'soak-b'), ADDRESSES):
+            terminals.append(Terminal(name, address, workdir.name, latencies, lock))
+        crasher = Terminal('soak-c', CRASH_ADDRESS, workdir.name, [], threading.Lock())
+        crash_key = f"{crasher.username}@{crasher.shop_location}"
+
+        # Wait for the terminals to find each other
+        for _ in range(50):
+            terminals[0].introduce(ADDRESSES[1])
+            for address in ADDRESSES:
+                crasher.introduce(address)
+            if all(len(terminal.network.users) >= 2 for terminal in terminals):
+                break
+            time.sleep(0.1)
+        else:
+            print("✗ The terminals did not discover each other")
+            return 1
+
+        drivers = [
+            threading.Thread(target=drive_traffic, args=(terminals, args.speed, stop), name='soak-traffic', daemon=True),
+            threading.Thread(target=drive_churn, args=(args.peers, args.speed, stop), name='soak-churn', daemon=True),
+        ]
+        for driver in drivers:
+            driver.start()
+
+        samples: List[Sample] = []
+        baseline_snapshot: Optional[tracemalloc.Snapshot] = None
+        started = time.time()
+        print(f"\n{'time':>7} {'RSS MB':>8} {'heap MB':>8} {'threads':>7} {'users':>6} "
+              f"{'state':>6} {'frames':>7} {'p50 ms':>7} {'p99 ms':>7}  top allocation")
+
+        while time.time() - started < args.duration:
+            time.sleep(args.interval)
+            if not crashed and time.time() - started >= args.duration / 8:
+                # Killed: no offline message, its peers have to notice the silence
+                crasher.audio.cleanup()
+                crasher.network.stop()
+                crashed = True
+            with lock:
+                window = latencies[:]
+                latencies.clear()
+
+            snapshot = take_snapshot()
+            top = snapshot.statistics('lineno')[:1]
+            sample = Sample(
+                elapsed=time.time() - started,
+                rss_mb=rss_bytes() / 1e6,
+                traced_mb=tracemalloc.get_traced_memory()[0] / 1e6,
+                threads=threading.active_count(),
+                users=sum(len(terminal.network.users) for terminal in terminals),
+                peer_state=sum(peer_state_size(terminal.network) for terminal in terminals),
+                frames=len(window),
+                p50_ms=percentile(window, 0.5),
+                p99_ms=percentile(window, 0.99),
+            )
+            samples.append(sample)
+            if baseline_snapshot is None and sample.elapsed >= args.duration / 4:
+                baseline_snapshot = snapshot
+
+            site = f"{top[0].traceback[0].filename.rsplit(os.sep, 1)[-1]}:{top[0].traceback[0].lineno} " \
+                   f"{top[0].size / 1e3:.0f} KB" if top else ''
+            print(f"{sample.elapsed:7.0f} {sample.rss_mb:8.1f} {sample.traced_mb:8.2f} {sample.threads:7d} "
+                  f"{sample.users:6d} {sample.peer_state:6d} {sample.frames:7d} {sample.p50_ms:7.2f} "
+                  f"{sample.p99_ms:7.2f}  {site}")
+
+        stop.set()
+        final_snapshot = take_snapshot()
+        remembered = [terminal.username for terminal in terminals if crash_key in terminal.network.users]
+    finally:
+        stop.set()
+        for terminal in terminals:
+            terminal.stop()
+        if crasher and not crashed:
+            crasher.stop()
+        workdir.cleanup()
+
+    if baseline_snapshot is not None:
+        print("\nLargest growth in allocations since the first quarter")
+        for stat in final_snapshot.compare_to(baseline_snapshot, 'lineno')[:8]:
+            print(f"  {stat}")
+
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(Sample._fields)
+            writer.writerows(samples)
+        print(f"\nSamples written to {args.report}")
+
+    failures = check_drift(samples)
+    if remembered:
+        print(f"\n✗ {', '.join(remembered)} still list the terminal that was killed")
+        failures.append('crashed terminal')
+    if failures:
+        print(f"\n✗ Drift in: {', '.join(failures)}")
+        return 1
+
+    print("\n✓ No drift detected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Startup profiler for the Tradelink Intercom System.
+
+Run with ``--profile-startup`` to record how long every module import and
+initialization step takes, as a tree per thread. The report is printed and
+written to ``startup_profile.txt`` next to the settings file, since the
+packaged executable has no console.
+"""
+
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+
+class Span:
+    """One timed step, with the steps nested inside it."""
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.duration = 0.0
+        self.children: List['Span'] = []
+
+
+class StartupProfiler:
+    """Records import and initialization timings as a tree."""
+
+    def __init__(self):
+        self.enabled = False
+        self.started_at = time.perf_counter()
+        self.marks: List[tuple] = []
+        self._roots: List[tuple] = []  # (thread name, span)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original_import = None
+
+    def enable(self):
+        """Start recording spans and time every import of a new module."""
+        if self.enabled:
+            return
+
+        self.enabled = True
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def disable(self):
+        """Stop timing imports."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+        self.enabled = False
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block as a child of the current span on this thread."""
+        if not self.enabled:
+            yield
+            return
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        span = Span(name, time.perf_counter())
+        if stack:
+            stack[-1].children.append(span)
+        else:
+            with self._lock:
+                self._roots.append((threading.current_thread().name, span))
+
+        stack.append(span)
+        try:
+            yield
+        finally:
+            span.duration = time.perf_counter() - span.start
+            stack.pop()
+
+    def mark(self, name: str):
+        """Record a point in time since the profiler was created."""
+        if self.enabled:
+            self.marks.append((name, time.perf_counter() - self.started_at))
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """Replacement for ``__import__`` that times modules loaded for the first time."""
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        with self.span(f"import {name}"):
+            return self._original_import(name, globals, locals, fromlist, level)
+
+    def report(self, min_ms: float = 1.0) -> str:
+        """Format the recorded spans, hiding steps shorter than ``min_ms``."""
+        total = (time.perf_counter() - self.started_at) * 1000
+        lines = [f"Startup profile ({total:.1f} ms since launch)"]
+
+        for name, offset in self.marks:
+            lines.append(f"  {offset * 1000:8.1f} ms  {name}")
+
+        with self._lock:
+            roots = list(self._roots)
+
+        current_thread: Optional[str] = None
+        for thread_name, span in roots:
+            if thread_name != current_thread:
+                current_thread = thread_name
+                lines.append(f"[{thread_name}]")
+            self._format_span(span, 1, min_ms, lines)
+
+        return "\n".join(lines)
+
+    def _format_span(self, span: Span, depth: int, min_ms: float, lines: List[str]):
+        """Append a span and its children to the report."""
+        duration_ms = span.duration * 1000
+        if duration_ms < min_ms:
+            return
+
+        lines.append(f"{'  ' * depth}{duration_ms:8.1f} ms  {span.name}")
+        for child in sorted(span.children, key=lambda child: child.duration, reverse=True):
+            self._format_span(child, depth + 1, min_ms, lines)
+
+    def write_report(self, path: str, min_ms: float = 1.0):
+        """Print the report and write it to a file."""
+        report = self.report(min_ms)
+        print(report)
+
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(report + "\n")
+        except Exception as e:
+            print(f"Error writing startup profile: {e}")
+
+
+# Shared profiler, enabled from the command line before the heavy imports
+profiler = StartupProfiler()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+GUI stress test for the Tradelink Intercom audio path.
+
+Hammers the Qt GUI thread with user list rebuilds and repaints while a
+real-time audio probe runs the per-frame work of the audio engine (encode,
+packetize, loopback send and receive, decode) on a fixed frame clock. The
+probe runs once on a thread inside the GUI process and once in a child
+process, as ``audio_engine_process`` would, and reports how often a frame
+missed its deadline. A missed deadline is an audible glitch on a real
+output stream.
+
+Usage: python stress_test.py [--duration SECONDS] [--mode both|inprocess|process]
+"""
+
+import argparse
+import multiprocessing
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+import audio_protocol
+from shared_ring import SharedRing
+
+# Probe record: seconds between a frame's deadline and its decode finishing
+LATENESS = struct.Struct('=d')
+
+
+def audio_probe(ring_name: str, duration: float, frame_ms: int, sample_rate: int):
+    """Run the per-frame audio work on a fixed clock, recording how late each frame is."""
+    ring = SharedRing(ring_name)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = receiver.getsockname()
+
+    samples = audio_protocol.frame_samples(sample_rate, frame_ms)
+    pcm = struct.pack(f'<{samples}h', *(random.randint(-3000, 3000) for _ in range(samples)))
+    period = frame_ms / 1000
+
+    # Build the codec tables before the clock starts
+    audio_protocol.decode_payload('ulaw', audio_protocol.encode_payload('ulaw', pcm))
+
+    sequence_number = 0
+    deadline = time.perf_counter() + period
+    end = deadline + duration
+    while deadline < end:
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        packet = audio_protocol.pack_audio(
+            'probe', 'stress', sequence_number, time.time(), 'ulaw', frame_ms,
+            audio_protocol.encode_payload('ulaw', pcm)
+        )
+        sender.sendto(packet, address)
+        packet_data = audio_protocol.unpack_packet(receiver.recv(2048))
+        audio_protocol.decode_payload(packet_data['codec'], packet_data['payload'])
+
+        ring.write(LATENESS.pack(time.perf_counter() - deadline))
+        sequence_number += 1
+        deadline += period
+
+    sender.close()
+    receiver.close()
+    ring.close()
+
+
+class GuiHammer:
+    """Keeps the GUI thread busy with the kind of work a large shop chain causes."""
+
+    def __init__(self, user_count: int):
+        from PyQt6.QtWidgets import QComboBox, QPlainTextEdit, QVBoxLayout, QWidget
+        from main_window import AudioLevelWidget
+
+        self.window = QWidget()
+        layout = QVBoxLayout(self.window)
+        self.combo = QComboBox()
+        self.text = QPlainTextEdit()
+        self.level = AudioLevelWidget()
+        for widget in (self.combo, self.text, self.level):
+            layout.addWidget(widget)
+        self.window.show()
+
+        self.user_lists = [
+            [f"user{i} (Shop {i % 40})" for i in range(user_count)],
+            [f"user{i} (Shop {i % 40})" for i in range(1, user_count + 1)],
+        ]
+        self.iterations = 0
+
+    def step(self):
+        """Rebuild the user list and repaint synchronously."""
+        users = self.user_lists[self.iterations % 2]
+        self.combo.clear()
+        self.combo.addItems(users)
+        self.text.setPlainText("\n".join(f"• {user}" for user in users))
+        self.level.set_level(random.random())
+        self.window.repaint()
+        self.iterations += 1
+
+
+def run_mode(mode: str, duration: float, frame_ms: int, sample_rate: int, user_count: int) -> dict:
+    """Run the probe in one mode while hammering the GUI, and summarize its frame lateness."""
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    ring = SharedRing(size=LATENESS.size * 4 * int(duration * 1000 / frame_ms + 100))
+    args = (ring.name, duration, frame_ms, sample_rate)
+
+    if mode == 'process':
+        probe = multiprocessing.get_context('spawn').Process(target=audio_probe, args=args, daemon=True)
+    else:
+        probe = threading.Thread(target=audio_probe, args=args, daemon=True)
+
+    hammer = GuiHammer(user_count)
+    timer = QTimer()
+
+    def tick():
+        if probe.is_alive():
+            hammer.step()
+        else:
+            timer.stop()
+            app.quit()
+
+    timer.timeout.connect(tick)
+    probe.start()
+    timer.start(0)
+    app.exec()
+    probe.join()
+
+    lateness = sorted(LATENESS.unpack(record)[0] for record in ring.drain())
+    ring.close()
+    hammer.window.close()
+
+    period = frame_ms / 1000
+    glitches = sum(1 for late in lateness if late > period)
+    count = len(lateness) or 1
+    return {
+        'mode': mode,
+        'frames': len(lateness),
+        'glitches': glitches,
+        'glitch_rate': glitches / count,
+        'p50_ms': lateness[len(lateness) // 2] * 1000 if lateness else 0.0,
+        'p99_ms': lateness[int(len(lateness) * 0.99)] * 1000 if lateness else 0.0,
+        'max_ms': lateness[-1] * 1000 if lateness else 0.0,
+        'gui_iterations': hammer.iterations,
+    }
+
+
+def main():
+    """Run the stress test in the requested modes and compare them."""
+    parser = argparse.ArgumentParser(description="Measure audio glitches while the GUI is under load")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per mode")
+    parser.add_argument('--mode', choices=('both', 'inprocess', 'process'), default='both')
+    parser.add_argument('--frame-ms', type=int, default=20)
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--users', type=int, default=500, help="users in the hammered list")
+    options = parser.parse_args()
+
+    modes = ('inprocess', 'process') if options.mode == 'both' else (options.mode,)
+
+    print("Tradelink Intercom GUI stress test")
+    print("=" * 50)
+    print(f"{options.frame_ms} ms frames, {options.users} users rebuilt per GUI iteration, "
+          f"{options.duration:.0f} s per mode\n")
+
+    for mode in modes:
+        result = run_mode(mode, options.duration, options.frame_ms, options.sample_rate, options.users)
+        print(f"{result['mode']:<10} {result['frames']:5d} frames  "
+              f"{result['glitches']:4d} glitches ({result['glitch_rate']:.1%})  "
+              f"lateness p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+              f"max {result['max_ms']:.2f} ms  [{result['gui_iterations']} GUI iterations]")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Thread-safe, coalescing bridge from worker threads to the Qt GUI.
+
+Network, audio and hotkey callbacks run on worker threads, and Qt widgets
+may only be touched from the GUI thread. Events posted here are collected
+under a lock and applied on the GUI thread at most once per frame interval:
+keyed updates keep only their latest value, and notifications are merged
+and rate-limited per sender, so a burst of events costs a bounded amount of
+GUI work.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+
+class UIEventBridge(QObject):
+    """Queues GUI work from any thread and applies it in coalesced batches."""
+
+    # Emitted from worker threads; delivered on the GUI thread via a queued connection
+    _wakeup = pyqtSignal()
+
+    def __init__(self, show_notification: Callable[[str, str], None],
+                 interval_ms: int = 50, notification_interval: float = 10.0, parent=None):
+        super().__init__(parent)
+        self.show_notification = show_notification
+        self.interval_ms = interval_ms
+        self.notification_interval = notification_interval
+
+        self._lock = threading.Lock()
+        self._updates: Dict[str, Tuple[Callable, tuple]] = {}
+        self._notifications: List[Tuple[str, str, str]] = []
+        self._scheduled = False
+        self._last_notified: Dict[str, float] = {}
+
+        # Metrics
+        self.events_posted = 0
+        self.batches_applied = 0
+        self.notifications_suppressed = 0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._flush)
+        self._wakeup.connect(self._schedule)
+
+    def post_update(self, key: str, func: Callable[..., Any], *args):
+        """Run ``func(*args)`` on the GUI thread. Later posts with the same key replace earlier ones."""
+        with self._lock:
+            self.events_posted += 1
+            self._updates[key] = (func, args)
+            self._request_flush_locked()
+
+    def post_notification(self, sender: str, title: str, message: str):
+        """Show a tray notification on the GUI thread, rate-limited per sender."""
+        with self._lock:
+            self.events_posted += 1
+            self._notifications.append((sender, title, message))
+            self._request_flush_locked()
+
+    def _request_flush_locked(self):
+        """Wake the GUI thread unless a flush is already pending. The lock must be held."""
+        if not self._scheduled:
+            self._scheduled = True
+            self._wakeup.emit()
+
+    @pyqtSlot()
+    def _schedule(self):
+        """Start the frame timer (GUI thread)."""
+        if not self._timer.isActive():
+            self._timer.start(self.interval_ms)
+
+    @pyqtSlot()
+    def _flush(self):
+        """Apply everything posted since the last flush (GUI thread)."""
+        with self._lock:
+            updates = list(self._updates.values())
+            notifications = self._notifications
+            self._updates = {}
+            self._notifications = []
+            self._scheduled = False
+
+        self.batches_applied += 1
+
+        for func, args in updates:
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Error applying UI update: {e}")
+
+        self._show_notifications(notifications)
+
+    def _show_notifications(self, notifications: List[Tuple[str, str, str]]):
+        """Drop notifications from recently notified senders and merge the rest."""
+        now = time.monotonic()
+        shown = []
+
+        for sender, title, message in notifications:
+            key = f"{sender}|{title}"
+            if now - self._last_notified.get(key, float('-inf')) < self.notification_interval:
+                self.notifications_suppressed += 1
+                continue
+            self._last_notified[key] = now
+            shown.append((title, message))
+
+        if not shown:
+            return
+
+        try:
+            if len(shown) == 1:
+                self.show_notification(*shown[0])
+            else:
+                titles = {title for title, _ in shown}
+                title = shown[0][0] if len(titles) == 1 else "Tradelink Intercom"
+                self.show_notification(title, "\n".join(message for _, message in shown))
+        except Exception as e:
+            print(f"Error showing notification: {e}")
@@ -0,0 +1,126 @@
+"""
+Struct-of-arrays user directory.
+
+A chain-wide directory kept as User objects costs a Python object per user
+plus one per field value. UserTable stores each field in a column instead
+(``array`` columns for numbers, shared strings for names), so ten thousand
+users are a handful of objects that scan quickly and pickle compactly, e.g.
+when the user list is sent from the audio engine process to the GUI.
+"""
+
+import socket
+import struct
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from network_manager import User
+
+_IPV4 = struct.Struct('!I')
+
+
+class UserTable:
+    """Users stored column by column, one row per user key."""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.usernames: List[str] = []
+        self.shop_locations: List[str] = []
+        self.addresses = array('I')
+        self.ports = array('H')
+        self.last_seen = array('d')
+        self.online = bytearray()
+        self.confirmed = bytearray()
+        self.max_packet_sizes = array('I')
+        self.chunk_sizes = array('I')
+        self.codec_ids = array('B')
+        self.codec_sets: List[tuple] = []  # distinct codec lists, shared between rows
+
+    @classmethod
+    def from_users(cls, users: Iterable[User]) -> 'UserTable':
+        """Build a table from User objects."""
+        table = cls()
+        for user in users:
+            table.upsert(user)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def __contains__(self, user_key: str) -> bool:
+        return user_key in self.index
+
+    def _codec_id(self, codecs: List[str]) -> int:
+        """Get the shared id of a codec list."""
+        codecs = tuple(codecs)
+        try:
+            return self.codec_sets.index(codecs)
+        except ValueError:
+            self.codec_sets.append(codecs)
+            return len(self.codec_sets) - 1
+
+    def upsert(self, user: User) -> int:
+        """Add or update a user. Returns its row."""
+        user_key = f"{user.username}@{user.shop_location}"
+        address = _IPV4.unpack(socket.inet_aton(user.ip_address))[0]
+        codec_id = self._codec_id(user.codecs)
+
+        row = self.index.get(user_key)
+        if row is None:
+            row = self.index[user_key] = len(self.usernames)
+            self.usernames.append(user.username)
+            self.shop_locations.append(user.shop_location)
+            self.addresses.append(address)
+            self.ports.append(user.port)
+            self.last_seen.append(user.last_seen)
+            self.online.append(user.is_online)
+            self.confirmed.append(user.confirmed)
+            self.max_packet_sizes.append(user.max_packet_size)
+            self.chunk_sizes.append(user.chunk_size)
+            self.codec_ids.append(codec_id)
+            return row
+
+        self.addresses[row] = address
+        self.ports[row] = user.port
+        self.last_seen[row] = user.last_seen
+        self.online[row] = user.is_online
+        self.confirmed[row] = user.confirmed
+        self.max_packet_sizes[row] = user.max_packet_size
+        self.chunk_sizes[row] = user.chunk_size
+        self.codec_ids[row] = codec_id
+        return row
+
+    def user(self, row: int) -> User:
+        """Build the User object for a row."""
+        return User(
+            username=self.usernames[row],
+            shop_location=self.shop_locations[row],
+            ip_address=socket.inet_ntoa(_IPV4.pack(self.addresses[row])),
+            port=self.ports[row],
+            last_seen=self.last_seen[row],
+            is_online=bool(self.online[row]),
+            max_packet_size=self.max_packet_sizes[row],
+            chunk_size=self.chunk_sizes[row],
+            codecs=list(self.codec_sets[self.codec_ids[row]]),
+            confirmed=bool(self.confirmed[row])
+        )
+
+    def get(self, user_key: str) -> Optional[User]:
+        """Get a user by key, or None."""
+        row = self.index.get(user_key)
+        return None if row is None else self.user(row)
+
+    def set_online(self, user_key: str, online: bool, last_seen: Optional[float] = None):
+        """Mark a user online or offline."""
+        row = self.index[user_key]
+        self.online[row] = online
+        if last_seen is not None:
+            self.last_seen[row] = last_seen
+
+    def online_rows(self) -> List[int]:
+        """Get the rows of online users."""
+        online = self.online
+        return [row for row in range(len(online)) if online[row]]
+
+    def online_users(self) -> List[User]:
+        """Build User objects for the online users."""
+        return [self.user(row) for row in self.online_rows()]
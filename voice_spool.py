@@ -0,0 +1,233 @@
+"""
+On-disk queue of voice messages for peers that are offline.
+
+When a talk spurt is addressed to a peer we have not heard from, the audio
+is kept here instead of being dropped, and NetworkManager delivers it with
+a reliable transfer (see ``voice_transfer``) once the peer's presence comes
+back. Audio is held in memory, μ-law encoded, while the spurt is recorded,
+and written to disk in one go when it ends, so the capture path never
+waits on the disk.
+
+One file per message: ``HEADER`` (magic, version, codec, sample rate,
+timestamp, lengths of the target, sender and shop), the three names in
+UTF-8, then the encoded audio. Files are named by a sequence number, so
+messages are delivered in the order they were recorded.
+"""
+
+import os
+import struct
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import audio_protocol
+from clock import Clock, system_clock
+
+MAGIC = b'TLVM'
+VERSION = 1
+HEADER = struct.Struct('<4sBBIdHHH')
+SUFFIX = '.tlvm'
+
+# Codec stored on disk; μ-law halves the size of 16-bit PCM
+SPOOL_CODEC = 'ulaw'
+
+
+class SpooledMessage(NamedTuple):
+    """A voice message waiting on disk for its target."""
+    message_id: int
+    target: str
+    sender: str
+    sender_shop: str
+    timestamp: float
+    sample_rate: int
+    codec: str
+    path: str
+    size: int  # encoded audio bytes
+
+
+class VoiceSpool:
+    """Keeps voice messages on disk, by target, until they are delivered."""
+
+    def __init__(self, directory: str, max_bytes: int, max_age: float, max_message_bytes: int,
+                 clock: Optional[Clock] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_message_bytes = max_message_bytes
+        self.clock = clock or system_clock
+
+        self._lock = threading.Lock()
+        self._messages: Dict[str, List[SpooledMessage]] = {}  # target -> messages, oldest first
+        self._recording: Dict[str, tuple] = {}  # target -> (sender, shop, sample rate, started, audio)
+        self._next_id = 1
+
+        # Metrics
+        self.spooled = 0
+        self.delivered = 0
+        self.discarded = 0
+        self.truncated = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index the messages left on disk by earlier runs."""
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                message = self._read_header(path)
+            except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+                print(f"Discarding unreadable voice message {name}: {e}")
+                self._delete(path)
+                continue
+
+            self._messages.setdefault(message.target, []).append(message)
+            self._next_id = max(self._next_id, message.message_id + 1)
+
+        self.expire()
+
+    @staticmethod
+    def _read_header(path: str) -> SpooledMessage:
+        """Read a message file's header."""
+        with open(path, 'rb') as f:
+            magic, version, codec_id, sample_rate, timestamp, *lengths = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not a voice message file")
+            target, sender, shop = (f.read(length).decode('utf-8') for length in lengths)
+
+        message_id = int(os.path.basename(path)[:-len(SUFFIX)])
+        size = os.path.getsize(path) - HEADER.size - sum(lengths)
+        return SpooledMessage(message_id, target, sender, shop, timestamp, sample_rate,
+                              audio_protocol.CODEC_NAMES[codec_id], path, size)
+
+    @staticmethod
+    def _delete(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def append(self, target: str, sender: str, sender_shop: str, sample_rate: int, pcm: bytes):
+        """Add captured audio to the message being recorded for a target."""
+        with self._lock:
+            recording = self._recording.get(target)
+            if recording is None:
+                recording = self._recording[target] = (sender, sender_shop, sample_rate, self.clock.time(), bytearray())
+            audio = recording[4]
+
+            room = self.max_message_bytes - len(audio)
+            if room <= 0:
+                self.truncated += 1
+                return
+            encoded = audio_protocol.encode_payload(SPOOL_CODEC, pcm)
+            if len(encoded) > room:
+                # One byte per sample, so the cut stays on a sample boundary
+                encoded = encoded[:room]
+                self.truncated += 1
+            audio += encoded
+
+    def is_recording(self, target: str) -> bool:
+        """Check if a message is being recorded for a target."""
+        return target in self._recording
+
+    def finish(self, target: str) -> Optional[SpooledMessage]:
+        """Write the message being recorded for a target to disk."""
+        with self._lock:
+            recording = self._recording.pop(target, None)
+            if recording is None or not recording[4]:
+                return None
+            message_id = self._next_id
+            self._next_id += 1
+
+        sender, shop, sample_rate, started_at, audio = recording
+        names = [value.encode('utf-8') for value in (target, sender, shop)]
+        header = HEADER.pack(MAGIC, VERSION, audio_protocol.CODECS[SPOOL_CODEC][0], sample_rate, started_at,
+                             *(len(name) for name in names))
+
+        path = os.path.join(self.directory, f"{message_id:08d}{SUFFIX}")
+        temp_path = path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(header)
+                f.write(b''.join(names))
+                f.write(audio)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error spooling voice message for {target}: {e}")
+            self._delete(temp_path)
+            return None
+
+        message = SpooledMessage(message_id, target, sender, shop, started_at, sample_rate,
+                                 SPOOL_CODEC, path, len(audio))
+        with self._lock:
+            self._messages.setdefault(target, []).append(message)
+            self.spooled += 1
+        self._enforce_limit()
+        return message
+
+    def targets(self) -> List[str]:
+        """Get the targets with messages waiting."""
+        with self._lock:
+            return list(self._messages)
+
+    def next_message(self, target: str) -> Optional[SpooledMessage]:
+        """Get the oldest message waiting for a target."""
+        with self._lock:
+            messages = self._messages.get(target)
+            return messages[0] if messages else None
+
+    def read_audio(self, message: SpooledMessage) -> bytes:
+        """Read a message's encoded audio."""
+        with open(message.path, 'rb') as f:
+            f.seek(-message.size, os.SEEK_END)
+            return f.read()
+
+    def remove(self, message: SpooledMessage, delivered: bool = True):
+        """Remove a message once it has been delivered (or given up on)."""
+        with self._lock:
+            messages = self._messages.get(message.target, [])
+            if message in messages:
+                messages.remove(message)
+            if not messages:
+                self._messages.pop(message.target, None)
+            if delivered:
+                self.delivered += 1
+            else:
+                self.discarded += 1
+        self._delete(message.path)
+
+    def expire(self, now: Optional[float] = None):
+        """Discard messages older than the maximum age."""
+        cutoff = (self.clock.time() if now is None else now) - self.max_age
+        for message in self._all_messages():
+            if message.timestamp < cutoff:
+                print(f"Voice message for {message.target} expired undelivered")
+                self.remove(message, delivered=False)
+
+    def _all_messages(self) -> List[SpooledMessage]:
+        with self._lock:
+            return [message for messages in self._messages.values() for message in messages]
+
+    def _enforce_limit(self):
+        """Discard the oldest messages while the spool is over its size limit."""
+        messages = sorted(self._all_messages(), key=lambda message: message.message_id)
+        total = sum(message.size for message in messages)
+        while messages and total > self.max_bytes:
+            oldest = messages.pop(0)
+            print(f"Voice spool full; discarding message for {oldest.target}")
+            self.remove(oldest, delivered=False)
+            total -= oldest.size
+
+    def stats(self) -> dict:
+        """Get spool metrics."""
+        messages = self._all_messages()
+        return {
+            'waiting': len(messages),
+            'bytes': sum(message.size for message in messages),
+            'recording': len(self._recording),
+            'spooled': self.spooled,
+            'delivered': self.delivered,
+            'discarded': self.discarded,
+            'truncated': self.truncated,
+        }
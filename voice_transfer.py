@@ -0,0 +1,336 @@
+"""
+Reliable chunked transfer of voice messages over the control socket.
+
+Spooled voice messages (see ``voice_spool``) can be tens of seconds long,
+far more than one datagram. The sender offers a message with a JSON
+``voice_offer``, then sends it as binary chunks of ``CHUNK_SIZE`` bytes,
+keeping at most ``window`` chunks unacknowledged and pacing them to a byte
+rate, so the transfer never crowds out live audio. The receiver answers
+with binary acknowledgements carrying the next chunk it needs plus the
+chunks it holds beyond it, acknowledging every few chunks rather than
+each one, and at once only when a gap opens or is filled. Chunks that
+time out or that later chunks overtook are sent again.
+
+Chunks and acknowledgements are binary so the network manager can pass
+them through its voice rate limit without parsing them; a transfer's
+acknowledgements must not compete with presence and keying messages for
+the control rate limit.
+
+Chunk datagram: ``CHUNK`` (magic, transfer id, chunk index), then the data.
+Ack datagram: ``ACK`` (magic, transfer id, next chunk needed, count), then
+``count`` chunk indexes received beyond it.
+"""
+
+import json
+import struct
+import time
+from typing import List, Optional
+
+MAGIC = b'TLVC'
+CHUNK = struct.Struct('!4sII')
+ACK_MAGIC = b'TLVA'
+ACK = struct.Struct('!4sIIH')
+CHUNK_SIZE = 1024  # with the header, fits the control socket's 2048-byte receive buffer
+
+ACK_EVERY = 8       # chunks received before an acknowledgement is sent
+ACK_DELAY = 0.02    # seconds an acknowledgement may be held back waiting for more chunks
+MAX_SACK = 64       # chunks beyond the next one needed that an acknowledgement lists
+DUPLICATE_ACKS = 3  # later chunks acknowledged before a missing one is sent again
+
+# Retransmission timeout bounds; a LAN answers far sooner than RFC 6298's one second minimum
+MIN_RTO = 0.05
+MAX_RTO = 2.0
+INITIAL_RTO = 0.25
+
+
+def is_chunk(data: bytes) -> bool:
+    """Check if a control datagram is a transfer chunk rather than a JSON message."""
+    return data[:4] == MAGIC
+
+
+def pack_chunk(transfer_id: int, index: int, data) -> bytes:
+    """Build a chunk datagram."""
+    return CHUNK.pack(MAGIC, transfer_id, index) + data
+
+
+def unpack_chunk(data: bytes) -> tuple:
+    """Split a chunk datagram into (transfer id, chunk index, data)."""
+    _, transfer_id, index = CHUNK.unpack_from(data)
+    return transfer_id, index, memoryview(data)[CHUNK.size:]
+
+
+def is_ack(data: bytes) -> bool:
+    """Check if a control datagram is a transfer acknowledgement."""
+    return data[:4] == ACK_MAGIC
+
+
+def pack_ack(ack: dict) -> bytes:
+    """Build an acknowledgement datagram from ``IncomingTransfer.ack``."""
+    received = ack['received']
+    return (ACK.pack(ACK_MAGIC, ack['transfer_id'], ack['next'], len(received))
+            + struct.pack(f'!{len(received)}I', *received))
+
+
+def unpack_ack(data: bytes) -> dict:
+    """Parse an acknowledgement datagram into the form ``OutgoingTransfer.on_ack`` takes."""
+    _, transfer_id, next_needed, count = ACK.unpack_from(data)
+    return {
+        'type': 'voice_ack',
+        'transfer_id': transfer_id,
+        'next': next_needed,
+        'received': list(struct.unpack_from(f'!{min(count, MAX_SACK)}I', data, ACK.size)),
+    }
+
+
+def chunk_count(size: int) -> int:
+    """Number of chunks a message of ``size`` bytes is sent in."""
+    return max(1, -(-size // CHUNK_SIZE))
+
+
+class OutgoingTransfer:
+    """Sends one message, with a sliding window, pacing and retransmission."""
+
+    def __init__(self, offer: dict, data: bytes, window: int, rate: float, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self.offer = offer
+        self.transfer_id = offer['transfer_id']
+        self.data = data
+        self.chunks = chunk_count(len(data))
+        self.window = window
+        self.rate = rate
+
+        self.accepted = False  # the receiver has acknowledged the offer
+        self.base = 0          # every chunk below this has been acknowledged
+        self.next_index = 0    # first chunk never sent
+        self.sacked = set()    # chunks at or beyond ``base`` that have been acknowledged
+        self.sent_at = {}      # chunk in flight -> time it was last sent
+        self.retransmitted = set()
+        self._fast_retransmitted = set()
+        self._offer_sent_at: Optional[float] = None
+
+        # Round trip estimate (RFC 6298), from chunks that were only sent once
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.rto = INITIAL_RTO
+
+        # Token bucket pacing, with a burst of a few chunks
+        self.burst = 8 * (CHUNK.size + CHUNK_SIZE)
+        self._tokens = float(self.burst)
+        self._tokens_at = now
+
+        # Metrics
+        self.started_at = now
+        self.finished_at: Optional[float] = None
+        self.last_progress = now
+        self.chunks_sent = 0
+        self.retransmissions = 0
+
+    @property
+    def done(self) -> bool:
+        return self.base >= self.chunks
+
+    def _chunk(self, index: int) -> bytes:
+        return pack_chunk(self.transfer_id, index, self.data[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE])
+
+    def _take_tokens(self, size: int, now: float) -> bool:
+        """Spend pacing tokens for a datagram, if there are enough."""
+        self._tokens = min(self.burst, self._tokens + (now - self._tokens_at) * self.rate)
+        self._tokens_at = now
+        if self._tokens < size:
+            return False
+        self._tokens -= size
+        return True
+
+    def poll(self, now: Optional[float] = None) -> List[bytes]:
+        """Get the datagrams that are due: the offer, retransmissions and new chunks."""
+        now = time.time() if now is None else now
+        if self.done:
+            return []
+
+        if not self.accepted:
+            if self._offer_sent_at is None or now - self._offer_sent_at >= self.rto:
+                if self._offer_sent_at is not None:
+                    self.rto = min(MAX_RTO, self.rto * 2)
+                self._offer_sent_at = now
+                return [json.dumps(self.offer).encode()]
+            return []
+
+        datagrams = []
+        timed_out = False
+        for index, sent_at in sorted(self.sent_at.items()):
+            if now - sent_at < self.rto:
+                continue
+            chunk = self._chunk(index)
+            if not self._take_tokens(len(chunk), now):
+                return datagrams
+            if sent_at:
+                timed_out = True  # zero means a fast retransmit, not a timeout
+            self.sent_at[index] = now
+            self.retransmitted.add(index)
+            self.retransmissions += 1
+            datagrams.append(chunk)
+
+        if timed_out:
+            self.rto = min(MAX_RTO, self.rto * 2)
+
+        while self.next_index < self.chunks and self.next_index < self.base + self.window:
+            chunk = self._chunk(self.next_index)
+            if not self._take_tokens(len(chunk), now):
+                break
+            self.sent_at[self.next_index] = now
+            self.next_index += 1
+            self.chunks_sent += 1
+            datagrams.append(chunk)
+
+        return datagrams
+
+    def on_ack(self, message: dict, now: Optional[float] = None):
+        """Handle an acknowledgement from the receiver."""
+        now = time.time() if now is None else now
+        self.accepted = True
+
+        acked = [index for index in message.get('received', []) if index in self.sent_at]
+        next_needed = min(message['next'], self.chunks)
+        acked.extend(index for index in range(self.base, next_needed) if index in self.sent_at)
+
+        # Measure the round trip from chunks that were sent once, taking the longest so the
+        # time an acknowledgement is held back for more chunks counts towards the timeout
+        samples = [now - self.sent_at[index] for index in acked
+                   if index not in self.retransmitted and self.sent_at[index]]
+        if samples:
+            self._update_rto(max(samples))
+
+        for index in acked:
+            self.sent_at.pop(index, None)
+            self.sacked.add(index)
+        if acked or next_needed > self.base:
+            self.last_progress = now
+
+        if next_needed > self.base:
+            self.base = next_needed
+            self.sacked = {index for index in self.sacked if index >= self.base}
+            self.retransmitted = {index for index in self.retransmitted if index >= self.base}
+            self._fast_retransmitted = {index for index in self._fast_retransmitted if index >= self.base}
+
+        # Chunks acknowledged beyond a missing one mean it was probably lost: send it again now
+        for index in sorted(self.sent_at):
+            later = sum(1 for acked_index in self.sacked if acked_index > index)
+            if later < DUPLICATE_ACKS:
+                break
+            if index not in self._fast_retransmitted:
+                self._fast_retransmitted.add(index)
+                self.sent_at[index] = 0.0
+
+        if self.done and self.finished_at is None:
+            self.finished_at = now
+
+    def _update_rto(self, sample: float):
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar += (abs(self.srtt - sample) - self.rttvar) / 4
+            self.srtt += (sample - self.srtt) / 8
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def next_due(self, now: Optional[float] = None) -> float:
+        """Seconds until ``poll`` may have something to send."""
+        now = time.time() if now is None else now
+        if self.done:
+            return MAX_RTO
+        if not self.accepted:
+            return max(0.0, (self._offer_sent_at or now) + self.rto - now)
+
+        due = [sent_at + self.rto for sent_at in self.sent_at.values()]
+        if self.next_index < self.chunks and self.next_index < self.base + self.window:
+            due.append(now)
+        if not due:
+            return self.rto
+        wait = max(0.0, min(due) - now)
+        # Waiting for pacing tokens
+        tokens = min(self.burst, self._tokens + (now - self._tokens_at) * self.rate)
+        shortfall = CHUNK.size + CHUNK_SIZE - tokens
+        if shortfall > 0:
+            wait = max(wait, shortfall / self.rate)
+        return wait
+
+    def stats(self) -> dict:
+        """Get transfer metrics."""
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            'bytes': len(self.data),
+            'chunks': self.chunks,
+            'acknowledged': self.base,
+            'sent': self.chunks_sent,
+            'retransmissions': self.retransmissions,
+            'rtt_ms': round(self.srtt * 1000, 2) if self.srtt is not None else None,
+            'throughput_kbps': round(len(self.data) * 8 / elapsed / 1000, 1) if self.done and elapsed > 0 else None,
+        }
+
+
+class IncomingTransfer:
+    """Reassembles one message and decides when to acknowledge it."""
+
+    def __init__(self, offer: dict, address: tuple, now: Optional[float] = None):
+        self.offer = offer
+        self.address = address  # where acknowledgements go
+        self.transfer_id = offer['transfer_id']
+        self.chunks = chunk_count(offer['size'])
+        self.data = bytearray(offer['size'])
+        self.received = bytearray(self.chunks)
+        self.count = 0
+        self.next_needed = 0
+
+        self.ack_due: Optional[float] = None
+        self._unacked = 0
+        self.last_activity = time.time() if now is None else now
+
+    @property
+    def complete(self) -> bool:
+        return self.count == self.chunks
+
+    def on_chunk(self, index: int, data, now: Optional[float] = None) -> bool:
+        """Store a chunk. Returns True if an acknowledgement should be sent now."""
+        now = time.time() if now is None else now
+        self.last_activity = now
+        if index >= self.chunks:
+            return False
+        if self.received[index]:
+            return True  # a duplicate: our acknowledgement was probably lost
+
+        gap_before = self.received.find(1, self.next_needed) >= 0
+        start = index * CHUNK_SIZE
+        self.data[start:start + len(data)] = data
+        self.received[index] = 1
+        self.count += 1
+        in_order = index == self.next_needed
+        while self.next_needed < self.chunks and self.received[self.next_needed]:
+            self.next_needed += 1
+
+        self._unacked += 1
+        if self.complete or self._unacked >= ACK_EVERY:
+            return True
+        if in_order and gap_before:
+            return True  # a gap filled: the sender can move its window on
+        if not in_order and not gap_before:
+            return True  # a gap opened: the sender should hear about it at once
+        if self.ack_due is None:
+            self.ack_due = now + ACK_DELAY
+        return False
+
+    def ack(self) -> dict:
+        """Build an acknowledgement of everything received so far."""
+        self._unacked = 0
+        self.ack_due = None
+        received = []
+        index = self.received.find(1, self.next_needed) if self.next_needed < self.chunks else -1
+        while index >= 0 and len(received) < MAX_SACK:
+            received.append(index)
+            index = self.received.find(1, index + 1)
+
+        return {
+            'type': 'voice_ack',
+            'transfer_id': self.transfer_id,
+            'next': self.next_needed,
+            'received': received,
+        }